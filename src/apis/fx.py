@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, Iterable
+
+from apis import market_data
+from apis.market_data import BASE_CURRENCY
+
+
+class FxRateTable:
+    """
+    In-memory table of exchange rates quoted against USD.
+
+    Every currency is stored as the amount of it one USD buys, so any cross
+    rate is derived from two entries and N currencies only need N fetches.
+
+    Args:
+        refresh_interval (float, optional): Seconds between two refreshes of the table. Defaults to 900.
+    """
+
+    def __init__(self, refresh_interval: float = 15 * 60) -> None:
+        self.refresh_interval = refresh_interval
+
+        self._per_usd: Dict[str, float] = {BASE_CURRENCY: 1.0}
+        self._lock = threading.Lock()
+
+    @property
+    def currencies(self):
+        return list(self._per_usd.keys())
+
+    def rate(self, base_currency: str, target_currency: str) -> float:
+        """
+        Get the exchange rate between two currencies, derived through USD.
+
+        Only currencies never seen before trigger a network fetch.
+
+        Args:
+            base_currency (str): The base currency code (e.g., 'EUR').
+            target_currency (str): The target currency code (e.g., 'USD').
+
+        Returns:
+            float: How much of the target currency one unit of the base currency buys.
+        """
+        if base_currency == target_currency:
+            return 1
+
+        missing = [i for i in (base_currency, target_currency) if i not in self._per_usd]
+        if missing:
+            self._fetch(missing)
+
+        return self._per_usd[target_currency] / self._per_usd[base_currency]
+
+    def refresh(self, currencies: Iterable[str] = None) -> None:
+        """Fetch the latest rates of every known currency (plus the given ones) in a single request."""
+        currencies = (set(self._per_usd) | set(currencies or ())) - {BASE_CURRENCY}
+
+        if currencies:
+            self._fetch(currencies, strict=False)
+
+    def _fetch(self, currencies: Iterable[str], *, strict: bool = True) -> None:
+        currencies = sorted(set(currencies) - {BASE_CURRENCY})
+        rates = market_data.provider.fx_rates(currencies)
+        not_found = [i for i in currencies if i not in rates]
+
+        with self._lock:
+            self._per_usd.update(rates)
+
+        if strict and not_found:
+            raise ValueError(f"Exchange rate for {BASE_CURRENCY} to {', '.join(not_found)} not found.")
+
+
+fx_table = FxRateTable()
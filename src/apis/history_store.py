@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+import numpy as np
+
+from apis import market_data
+from utils import calculate_start_date
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# marks a symbol whose whole history is stored
+FULL_HISTORY = np.iinfo(np.int64).min
+
+
+class SymbolHistory:
+    """Daily close prices of a symbol, kept as two aligned NumPy arrays."""
+
+    def __init__(self, dates: np.ndarray, close: np.ndarray, covered_from: int, fetched_at: float, metadata: Dict[str, str] = None) -> None:
+        self.dates = dates  # datetime64[ns], sorted
+        self.close = close  # float64
+        self.covered_from = covered_from  # earliest date (ns) ever requested, or FULL_HISTORY
+        self.fetched_at = fetched_at  # epoch seconds of the last fetch
+        self.metadata = metadata or {}
+
+    @property
+    def last_date(self) -> np.datetime64:
+        return self.dates[-1]
+
+    def covers(self, start: Optional[pd.Timestamp]) -> bool:
+        if self.covered_from == FULL_HISTORY:
+            return True
+
+        return start is not None and start.value >= self.covered_from
+
+    def merge(self, dates: np.ndarray, close: np.ndarray) -> None:
+        """Merge freshly fetched bars, the fetched ones win on overlapping dates."""
+        keep = ~np.isin(self.dates, dates)
+
+        all_dates = np.concatenate([self.dates[keep], dates])
+        all_close = np.concatenate([self.close[keep], close])
+        order = np.argsort(all_dates, kind='stable')
+
+        self.dates = all_dates[order]
+        self.close = all_close[order]
+
+    def slice(self, start: Optional[pd.Timestamp]) -> pd.DataFrame:
+        import pandas as pd
+
+        idx = 0 if start is None else np.searchsorted(self.dates, np.datetime64(start.value, 'ns'))
+
+        return pd.DataFrame({'Close': self.close[idx:]}, index=pd.DatetimeIndex(self.dates[idx:], name='Date'))
+
+
+class HistoryStore:
+    """
+    Per-symbol on-disk store of daily close prices.
+
+    Only the bars missing since the last stored date are downloaded, any
+    range is then served by slicing the local arrays.
+
+    Args:
+        directory (str, optional): Folder where the `.npz` files are kept. Defaults to './history'.
+        min_refresh (float, optional): Seconds before the tail of a symbol is fetched again. Defaults to 300.
+    """
+
+    def __init__(self, directory: str = './history', min_refresh: float = 300) -> None:
+        self.directory = directory
+        self.min_refresh = min_refresh
+
+        self._histories: Dict[str, SymbolHistory] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def get(self, symbol: str, range: str = '6mo') -> pd.DataFrame:
+        """
+        Get the daily close prices of a symbol for a time range.
+
+        Args:
+            symbol (str): The stock symbol.
+            range (str, optional): The time range, in the yfinance period format. Defaults to '6mo'.
+
+        Returns:
+            pd.DataFrame: Close prices indexed by date.
+
+        Raises:
+            ValueError: If the symbol has no history.
+        """
+        start = calculate_start_date(range)
+
+        with self._lock_for(symbol):
+            history = self._histories.get(symbol) or self._load(symbol)
+
+            if history is None:
+                history = self._fetch_range(symbol, range, start)
+
+            else:
+                if not history.covers(start):
+                    self._fetch_head(symbol, history, range, start)
+
+                if time.time() - history.fetched_at > self.min_refresh:
+                    self._fetch_tail(symbol, history)
+
+            self._histories[symbol] = history
+
+        return history.slice(start)
+
+    def metadata(self, symbol: str) -> Optional[Dict[str, str]]:
+        history = self._histories.get(symbol) or self._load(symbol)
+
+        if history is None or not history.metadata:
+            return None
+
+        return history.metadata
+
+    def set_metadata(self, symbol: str, metadata: Dict[str, str]) -> Dict[str, str]:
+        with self._lock_for(symbol):
+            history = self._histories.get(symbol) or self._load(symbol)
+
+            if history is not None:
+                history.metadata = metadata
+                self._save(symbol, history)
+
+        return metadata
+
+    # fetching
+    def _fetch_range(self, symbol: str, range: str, start: Optional[pd.Timestamp]) -> SymbolHistory:
+        dates, close = self._download(symbol, period=range)
+
+        if not len(dates):
+            raise ValueError("Ticker not recognized")
+
+        covered_from = FULL_HISTORY if start is None else start.value
+        history = SymbolHistory(dates, close, covered_from, time.time())
+        self._save(symbol, history)
+
+        return history
+
+    def _fetch_head(self, symbol: str, history: SymbolHistory, range: str, start: Optional[pd.Timestamp]) -> None:
+        import pandas as pd
+
+        if start is None:
+            dates, close = self._download(symbol, period=range)
+        else:
+            dates, close = self._download(symbol, start=start, end=pd.Timestamp(history.dates[0]))
+
+        history.merge(dates, close)
+        history.covered_from = FULL_HISTORY if start is None else start.value
+        self._save(symbol, history)
+
+    def _fetch_tail(self, symbol: str, history: SymbolHistory) -> None:
+        import pandas as pd
+
+        # the last stored bar may still have been changing when it was fetched
+        dates, close = self._download(symbol, start=pd.Timestamp(history.last_date))
+
+        history.merge(dates, close)
+        history.fetched_at = time.time()
+        self._save(symbol, history)
+
+    def _download(self, symbol: str, **kwargs):
+        return market_data.provider.history(symbol, **kwargs)
+
+    # storage
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.directory, f"{symbol.upper()}.npz")
+
+    def _load(self, symbol: str) -> Optional[SymbolHistory]:
+        path = self._path(symbol)
+        if not os.path.isfile(path):
+            return None
+
+        with np.load(path) as data:
+            metadata = {i[5:]: str(data[i]) for i in data.files if i.startswith('meta_')}
+            history = SymbolHistory(
+                data['dates'], data['close'], int(data['covered_from']), float(data['fetched_at']), metadata
+            )
+
+        self._histories[symbol] = history
+        return history
+
+    def _save(self, symbol: str, history: SymbolHistory) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = self._path(symbol)
+        tmp_path = path + '.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                dates=history.dates,
+                close=history.close,
+                covered_from=np.int64(history.covered_from),
+                fetched_at=np.float64(history.fetched_at),
+                **{f"meta_{i}": np.str_(j) for i, j in history.metadata.items()}
+            )
+
+        os.replace(tmp_path, path)
+
+    def _lock_for(self, symbol: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+
+history_store = HistoryStore()
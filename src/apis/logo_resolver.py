@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import aiohttp
+
+from executor import run_io
+from metrics import metrics
+
+BASE_URL = "https://trading212equities.s3.eu-central-1.amazonaws.com/"
+POSSIBLE_SUFFIXES = [".png", "_US_EQ.png", "_EQ.png", "CA_EQ.png"]
+
+logger = logging.getLogger(__name__)
+
+
+class LogoResolver:
+    """
+    Resolves the logo URL of a stock by probing every candidate URL in parallel.
+
+    Results are kept in a JSON file so they survive restarts. Symbols without a
+    logo, every candidate answering 404, are remembered too, and probed again
+    only after `negative_ttl`. Timeouts and other failures are not remembered.
+
+    Args:
+        cache_path (str, optional): Path of the on-disk cache. Defaults to './logos.json'.
+        timeout (float, optional): Seconds each probe may take. Defaults to 3.
+        positive_ttl (float, optional): Seconds a found logo is trusted. Defaults to 30 days.
+        negative_ttl (float, optional): Seconds before a missing logo is probed again. Defaults to 7 days.
+    """
+
+    def __init__(
+        self,
+        cache_path: str = './logos.json',
+        timeout: float = 3,
+        positive_ttl: float = 30 * 24 * 3600,
+        negative_ttl: float = 7 * 24 * 3600
+    ) -> None:
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+
+        # symbol -> {"url": str | None, "checked_at": epoch seconds}
+        self._cache: Dict[str, dict] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # saves run on the IO pool, one at a time and never older over newer
+        self._save_lock = threading.Lock()
+        self._changes = 0
+        self._saved_changes = 0
+
+    def load(self) -> None:
+        """Load the on-disk cache, meant to be called at startup."""
+        if not os.path.isfile(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path, 'r') as f:
+                self._cache = json.load(f)
+        except (OSError, ValueError):
+            self._cache = {}
+
+    def save(self, entries: Dict[str, dict] = None, changes: int = None) -> None:
+        """
+        Write the cache, or a copy of it taken after `changes` changes.
+
+        A copy older than the one already written is skipped.
+        """
+        with self._save_lock:
+            if changes is not None:
+                if changes <= self._saved_changes:
+                    return
+                self._saved_changes = changes
+
+            tmp_path = self.cache_path + '.tmp'
+
+            with open(tmp_path, 'w') as f:
+                json.dump(self._cache if entries is None else entries, f)
+
+            os.replace(tmp_path, self.cache_path)
+
+    def cached(self, symbol: str) -> Optional[dict]:
+        entry = self._cache.get(symbol)
+        if entry is None:
+            return None
+
+        ttl = self.positive_ttl if entry['url'] is not None else self.negative_ttl
+        if time.time() - entry['checked_at'] > ttl:
+            return None
+
+        return entry
+
+    async def resolve(self, symbol: str) -> Optional[str]:
+        """
+        Get the logo URL of a stock.
+
+        Args:
+            symbol (str): The stock symbol.
+
+        Returns:
+            str or None: The logo URL, None if the stock has no logo or the probes failed.
+        """
+        entry = self.cached(symbol)
+        if entry is not None:
+            return entry['url']
+
+        # concurrent lookups of the same symbol share one probe
+        if symbol in self._in_flight:
+            return await asyncio.shield(self._in_flight[symbol])
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[symbol] = future
+
+        try:
+            url = await self._probe(symbol)
+            self._cache[symbol] = {'url': url, 'checked_at': time.time()}
+            self._changes += 1
+
+            try:
+                await run_io(self.save, dict(self._cache), self._changes)
+            except OSError:
+                # the logo is still good, the next save writes it
+                logger.exception("Saving the logo cache failed")
+
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # unreachable, not missing: answer without a logo and don't remember it
+            url = None
+
+        except BaseException:
+            future.cancel()
+            raise
+
+        finally:
+            del self._in_flight[symbol]
+
+        future.set_result(url)
+        return url
+
+    async def _probe(self, symbol: str) -> Optional[str]:
+        session = self._get_session()
+        urls = [BASE_URL + f"{symbol}{suffix}" for suffix in POSSIBLE_SUFFIXES]
+
+        results = await asyncio.gather(*(self._head(session, url) for url in urls), return_exceptions=True)
+
+        # keep the suffix priority, not the response order
+        for url, status in zip(urls, results):
+            if status == 200:
+                return url
+
+        # missing only if every candidate is, anything else may have a logo next time
+        if all(i == 404 for i in results):
+            return None
+
+        error = next((i for i in results if isinstance(i, Exception)), None)
+        raise error or aiohttp.ClientError(f"Logo probes of {symbol} answered {results}")
+
+    async def _head(self, session: aiohttp.ClientSession, url: str) -> int:
+        with metrics.timer('logo_head'):
+            async with session.head(url) as response:
+                return response.status
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=len(POSSIBLE_SUFFIXES) * 4),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+logo_resolver = LogoResolver()
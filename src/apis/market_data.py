@@ -0,0 +1,436 @@
+"""
+Market data providers.
+
+Every quote, history, exchange rate and symbol search of the bot goes
+through the current `provider`, so the feed is chosen in one place:
+Yahoo Finance over the network, or recorded data replayed from disk.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import metrics
+from utils import calculate_start_date
+
+# pandas, yfinance and requests are imported on first use, they are a large part of the startup time
+if TYPE_CHECKING:
+    import pandas as pd
+
+BASE_CURRENCY = "USD"
+
+logger = logging.getLogger(__name__)
+
+EMPTY_HISTORY = (np.array([], dtype='datetime64[ns]'), np.array([], dtype=np.float64))
+
+
+def fx_symbol(currency: str) -> str:
+    """Symbol of the amount of `currency` one USD buys."""
+    return f"{BASE_CURRENCY}{currency}=X"
+
+
+class MarketDataProvider(ABC):
+
+    @abstractmethod
+    def info(self, symbol: str) -> Dict[str, Any]:
+        """
+        Describe a symbol.
+
+        Returns:
+            Dict[str, Any]: Its 'symbol', 'shortName' and 'currency'.
+
+        Raises:
+            ValueError: If the symbol is unknown.
+        """
+
+    @abstractmethod
+    def last_closes(self, symbols: List[str]) -> Dict[str, float]:
+        """Last close of many symbols at once, unknown symbols are left out."""
+
+    @abstractmethod
+    def currency(self, symbol: str) -> str:
+        """Trading currency of a symbol."""
+
+    @abstractmethod
+    def history(self, symbol: str, *, period: str = None, start: pd.Timestamp = None, end: pd.Timestamp = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Daily closes of a symbol, either for a period in the yfinance format or between two dates.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The datetime64 dates and the close prices, empty if the symbol is unknown.
+        """
+
+    @abstractmethod
+    def fx_rates(self, currencies: Iterable[str]) -> Dict[str, float]:
+        """Amount of each currency one USD buys, currencies without a rate are left out."""
+
+    @abstractmethod
+    def search(self, text: str) -> List[str]:
+        """Symbols matching a possibly misspelled one."""
+
+    def currencies(self, symbols: Iterable[str]) -> Dict[str, str]:
+        """Trading currency of many symbols, those whose lookup fails are left out."""
+        resp = {}
+        for symbol in symbols:
+            try:
+                resp[symbol] = self.currency(symbol)
+            except Exception as e:
+                logger.warning("Currency lookup of %s failed: %s", symbol, e)
+
+        return resp
+
+    def warm_up(self) -> None:
+        """Import the libraries the provider needs, ahead of its first request."""
+        import pandas  # noqa: F401
+
+
+class YahooProvider(MarketDataProvider):
+    """Yahoo Finance, through yfinance and the Yahoo search API."""
+
+    SEARCH_URL = "https://query1.finance.yahoo.com/v1/finance/search"
+    LOOKUP_WORKERS = 8
+
+    def __init__(self) -> None:
+        self._lookup_pool: Optional[ThreadPoolExecutor] = None
+
+    def warm_up(self) -> None:
+        import pandas, requests, yfinance  # noqa: F401
+
+    def info(self, symbol: str) -> Dict[str, Any]:
+        import yfinance as yf
+
+        with metrics.timer('yahoo_info'):
+            info = yf.Ticker(symbol).info
+
+        if 'symbol' not in info or 'shortName' not in info:
+            raise ValueError("Ticker not recognized")
+
+        return {
+            'symbol': info['symbol'],
+            'shortName': info['shortName'],
+            'currency': info.get('currency', BASE_CURRENCY),
+        }
+
+    def last_closes(self, symbols: List[str]) -> Dict[str, float]:
+        import yfinance as yf
+
+        with metrics.timer('yahoo_quote_batch'):
+            data: pd.DataFrame = yf.download(symbols, period="5d", progress=False)
+
+        return self._last_closes(data, symbols)
+
+    def currency(self, symbol: str) -> str:
+        import yfinance as yf
+
+        with metrics.timer('yahoo_info'):
+            return yf.Ticker(symbol).fast_info['currency']
+
+    def currencies(self, symbols: Iterable[str]) -> Dict[str, str]:
+        # Yahoo has no batched lookup of currencies, the requests run in parallel instead
+        symbols = list(symbols)
+        if len(symbols) < 2:
+            return super().currencies(symbols)
+
+        if self._lookup_pool is None:
+            self._lookup_pool = ThreadPoolExecutor(max_workers=self.LOOKUP_WORKERS, thread_name_prefix="yahoo")
+
+        # every lookup catches its own failure, like the sequential one
+        resp = {}
+        for currencies in self._lookup_pool.map(lambda i: MarketDataProvider.currencies(self, [i]), symbols):
+            resp.update(currencies)
+
+        return resp
+
+    def history(self, symbol: str, *, period: str = None, start: pd.Timestamp = None, end: pd.Timestamp = None) -> Tuple[np.ndarray, np.ndarray]:
+        import pandas as pd
+        import yfinance as yf
+
+        kwargs = {'period': period} if period is not None else {'start': start, 'end': end}
+
+        with metrics.timer('yahoo_history'):
+            hist: pd.DataFrame = yf.Ticker(symbol).history(**kwargs)
+
+        if hist.empty:
+            return EMPTY_HISTORY
+
+        index = pd.to_datetime(hist.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+
+        close = pd.to_numeric(hist['Close'], errors='coerce').to_numpy(dtype=np.float64)
+
+        return index.to_numpy(dtype='datetime64[ns]'), close
+
+    def fx_rates(self, currencies: Iterable[str]) -> Dict[str, float]:
+        import yfinance as yf
+
+        currencies = list(currencies)
+        tickers = [fx_symbol(i) for i in currencies]
+
+        with metrics.timer('yahoo_fx'):
+            data: pd.DataFrame = yf.download(tickers, period="5d", progress=False)
+
+        closes = self._last_closes(data, tickers)
+        return {currency: closes[ticker] for currency, ticker in zip(currencies, tickers) if ticker in closes}
+
+    def search(self, text: str) -> List[str]:
+        import requests
+
+        with metrics.timer('yahoo_search'):
+            req = requests.get(
+                self.SEARCH_URL,
+                params={"q": text, "newsCount": 0},
+                headers={"User-Agent": "python"}
+            )
+
+        if req.status_code != 200:
+            return []
+
+        return [i['symbol'] for i in req.json().get('quotes', [])]
+
+    @staticmethod
+    def _last_closes(data: pd.DataFrame, symbols: List[str]) -> Dict[str, float]:
+        import pandas as pd
+
+        if data.empty:
+            return {}
+
+        closes = data['Close']
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(name=symbols[0])
+
+        resp = {}
+        for symbol in symbols:
+            if symbol not in closes:
+                continue
+
+            prices = closes[symbol].dropna()
+            if not prices.empty:
+                resp[symbol] = float(prices.iloc[-1])
+
+        return resp
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Recorded daily closes replayed from disk, without any network access.
+
+    Every symbol is a `<SYMBOL>.parquet` or `<SYMBOL>.csv` file with 'Date'
+    and 'Close' columns, exchange rates are recorded as `USD<CURRENCY>=X`
+    symbols. An optional `symbols.csv` gives the 'name' and 'currency' of
+    each symbol, USD is assumed otherwise.
+
+    Files are read once and kept in memory as NumPy arrays. Quotes are the
+    last close at or before `as_of`, so moving it steps the replay in time.
+
+    Args:
+        directory (str): Folder holding the recorded files.
+        as_of (pd.Timestamp, optional): Date of the replay. Defaults to the last recorded close.
+    """
+
+    def __init__(self, directory: str, as_of: pd.Timestamp = None) -> None:
+        self.directory = directory
+        self.as_of = as_of
+
+        self.names: Dict[str, str] = {}
+        self._currencies: Dict[str, str] = {}
+        self.symbols: List[str] = []
+
+        self._series: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+        self._scan()
+
+    def info(self, symbol: str) -> Dict[str, Any]:
+        if self._load(symbol) is None:
+            raise ValueError("Ticker not recognized")
+
+        return {
+            'symbol': symbol,
+            'shortName': self.names.get(symbol, symbol),
+            'currency': self.currency(symbol),
+        }
+
+    def last_closes(self, symbols: List[str]) -> Dict[str, float]:
+        resp = {}
+        for symbol in symbols:
+            close = self._close(symbol)
+            if close is not None:
+                resp[symbol] = close
+
+        return resp
+
+    def currency(self, symbol: str) -> str:
+        return self._currencies.get(symbol, BASE_CURRENCY)
+
+    def history(self, symbol: str, *, period: str = None, start: pd.Timestamp = None, end: pd.Timestamp = None) -> Tuple[np.ndarray, np.ndarray]:
+        series = self._load(symbol)
+        if series is None:
+            return EMPTY_HISTORY
+
+        dates, close = series
+
+        # a period counts back from the replayed day, not from today
+        if period is not None and len(dates):
+            import pandas as pd
+
+            last = pd.Timestamp(dates[-1])
+            if self.as_of is not None:
+                last = min(last, pd.Timestamp(self.as_of))
+            start, end = calculate_start_date(period, last), None
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'ns'), side='left')
+        hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(end, 'ns'), side='left')
+        if self.as_of is not None:
+            hi = min(hi, np.searchsorted(dates, np.datetime64(self.as_of, 'ns'), side='right'))
+
+        return dates[lo:hi], close[lo:hi]
+
+    def fx_rates(self, currencies: Iterable[str]) -> Dict[str, float]:
+        resp = {}
+        for currency in currencies:
+            close = self._close(fx_symbol(currency))
+            if close is not None:
+                resp[currency] = close
+
+        return resp
+
+    def search(self, text: str) -> List[str]:
+        text = text.upper()
+        return [i for i in self.symbols if i.startswith(text) or text in self.names.get(i, '').upper()][:7]
+
+    def _scan(self) -> None:
+        if not os.path.isdir(self.directory):
+            return
+
+        for name in os.listdir(self.directory):
+            symbol, ext = os.path.splitext(name)
+            if ext in ('.csv', '.parquet') and name != 'symbols.csv':
+                self.symbols.append(symbol)
+        self.symbols.sort()
+
+        path = os.path.join(self.directory, 'symbols.csv')
+        if os.path.isfile(path):
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    self.names[row['symbol']] = row.get('name') or row['symbol']
+                    self._currencies[row['symbol']] = row.get('currency') or BASE_CURRENCY
+
+    def _load(self, symbol: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        series = self._series.get(symbol)
+        if series is not None:
+            return series
+
+        import pandas as pd
+
+        base = os.path.join(self.directory, symbol)
+        if os.path.isfile(base + '.parquet'):
+            df = pd.read_parquet(base + '.parquet')
+        elif os.path.isfile(base + '.csv'):
+            df = pd.read_csv(base + '.csv')
+        else:
+            return None
+
+        if 'Date' in df:
+            df = df.set_index('Date')
+        df = df.sort_index()
+
+        series = (
+            pd.to_datetime(df.index).tz_localize(None).to_numpy(dtype='datetime64[ns]'),
+            pd.to_numeric(df['Close'], errors='coerce').to_numpy(dtype=np.float64),
+        )
+
+        with self._lock:
+            self._series[symbol] = series
+
+        return series
+
+    def _close(self, symbol: str) -> Optional[float]:
+        series = self._load(symbol)
+        if series is None:
+            return None
+
+        dates, close = series
+        end = len(dates) if self.as_of is None else np.searchsorted(dates, np.datetime64(self.as_of, 'ns'), side='right')
+
+        return float(close[end - 1]) if end else None
+
+
+def record(source: MarketDataProvider, symbols: Iterable[str], directory: str, period: str = '1y', currencies: Iterable[str] = ()) -> None:
+    """
+    Record the history of symbols and exchange rates into a folder a ReplayProvider can serve.
+
+    Args:
+        source (MarketDataProvider): Provider the data is read from.
+        symbols (Iterable[str]): The symbols to record.
+        directory (str): Destination folder.
+        period (str, optional): Length of the recorded history. Defaults to '1y'.
+        currencies (Iterable[str], optional): Currencies whose rate against USD is recorded too.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    rows = []
+    for symbol in symbols:
+        info = source.info(symbol)
+        rows.append({'symbol': symbol, 'name': info['shortName'], 'currency': info['currency']})
+        _write_history(directory, symbol, *source.history(symbol, period=period))
+
+    for currency in currencies:
+        _write_history(directory, fx_symbol(currency), *source.history(fx_symbol(currency), period=period))
+
+    with open(os.path.join(directory, 'symbols.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['symbol', 'name', 'currency'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _write_history(directory: str, symbol: str, dates: np.ndarray, close: np.ndarray) -> None:
+    import pandas as pd
+
+    pd.DataFrame({'Date': dates, 'Close': close}).to_csv(os.path.join(directory, f"{symbol}.csv"), index=False)
+
+
+def create_provider(name: str, **options) -> MarketDataProvider:
+    """
+    Create a market data provider by name.
+
+    Args:
+        name (str): 'yahoo' or 'replay'.
+        **options: Arguments of the provider, e.g. the `directory` of the replay.
+
+    Returns:
+        MarketDataProvider: The provider.
+    """
+    if name == 'yahoo':
+        return YahooProvider()
+    if name == 'replay':
+        return ReplayProvider(**options)
+
+    raise ValueError(f"Unknown market data provider {name}")
+
+def set_provider(new_provider: MarketDataProvider) -> None:
+    global provider
+    provider = new_provider
+
+
+provider: MarketDataProvider = YahooProvider()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record market data for the replay provider.")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--output', default='./replay')
+    parser.add_argument('--period', default='1y')
+    parser.add_argument('--currencies', nargs='*', default=[])
+    args = parser.parse_args()
+
+    record(YahooProvider(), args.symbols, args.output, args.period, args.currencies)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+
+class Quote(NamedTuple):
+    symbol: str
+    price: float
+    currency: str
+    fetched_at: float
+
+
+class QuoteCache:
+    """
+    Process-wide LRU cache of stock quotes with a time-to-live per symbol.
+
+    Args:
+        default_ttl (float, optional): Seconds a quote stays fresh. Defaults to 60.
+        max_size (int, optional): Maximum number of symbols kept. Defaults to 2048.
+    """
+
+    def __init__(self, default_ttl: float = 60, max_size: int = 2048) -> None:
+        self.default_ttl = default_ttl
+        self.max_size = max_size
+
+        self._quotes: OrderedDict[str, Quote] = OrderedDict()
+        self._ttls: Dict[str, float] = {}
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def ttl_for(self, symbol: str) -> float:
+        return self._ttls.get(symbol, self.default_ttl)
+
+    def set_ttl(self, symbol: str, ttl: Optional[float]) -> None:
+        """Override the TTL of a symbol. Passing None restores the default."""
+        with self._lock:
+            if ttl is None:
+                self._ttls.pop(symbol, None)
+            else:
+                self._ttls[symbol] = ttl
+
+    def get(self, symbol: str) -> Optional[Quote]:
+        """
+        Get a fresh quote for a symbol.
+
+        Args:
+            symbol (str): The stock symbol.
+
+        Returns:
+            Quote or None: The cached quote, or None if it is missing or expired.
+        """
+        with self._lock:
+            quote = self._quotes.get(symbol)
+            self._last_access[symbol] = time.monotonic()
+
+            if quote is None or time.monotonic() - quote.fetched_at > self.ttl_for(symbol):
+                self.misses += 1
+                return None
+
+            self._quotes.move_to_end(symbol)
+            self.hits += 1
+            return quote
+
+    def peek(self, symbol: str) -> Optional[Quote]:
+        """Get the last known quote of a symbol, even if expired, without touching the counters."""
+        with self._lock:
+            return self._quotes.get(symbol)
+
+    def set(self, symbol: str, price: float, currency: str) -> Quote:
+        quote = Quote(symbol, price, currency, time.monotonic())
+
+        with self._lock:
+            self._quotes[symbol] = quote
+            self._quotes.move_to_end(symbol)
+
+            while len(self._quotes) > self.max_size:
+                self._quotes.popitem(last=False)
+
+        return quote
+
+    def recent_symbols(self, window: float) -> List[str]:
+        """Symbols looked up in the last `window` seconds."""
+        now = time.monotonic()
+
+        with self._lock:
+            # forget old lookups so the access log stays bounded
+            for symbol in [i for i, t in self._last_access.items() if now - t > window]:
+                del self._last_access[symbol]
+
+            return list(self._last_access)
+
+    def last_access(self, symbol: str) -> Optional[float]:
+        return self._last_access.get(symbol)
+
+    def invalidate(self, symbol: str) -> None:
+        with self._lock:
+            self._quotes.pop(symbol, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._quotes.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'size': len(self._quotes),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+        }
+
+    def __len__(self) -> int:
+        return len(self._quotes)
+
+
+quote_cache = QuoteCache()
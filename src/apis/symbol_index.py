@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import bisect
+import csv
+import os
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+BUNDLED_SYMBOLS = os.path.join(os.path.dirname(__file__), 'data', 'symbols.csv')
+NASDAQ_TRADED_URL = "https://www.nasdaqtrader.com/dynamic/SymDir/nasdaqtraded.txt"
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Levenshtein distance between two strings, giving up past `max_distance`.
+
+    Returns:
+        int: The distance, or `max_distance + 1` if it is larger than `max_distance`.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+
+    return previous[-1]
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SymbolIndex:
+    """
+    In-memory index of ticker symbols for instant suggestions.
+
+    Supports prefix lookup through a sorted list and fuzzy lookup through a
+    trigram index, ranked by edit distance.
+
+    Args:
+        paths (Iterable[str], optional): CSV files with 'symbol' and 'name' columns to load.
+    """
+
+    def __init__(self, paths: Iterable[str] = ()) -> None:
+        self.names: Dict[str, str] = {}
+
+        self._sorted: List[str] = []
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+        for path in paths:
+            self.load(path)
+
+    def load(self, path: str) -> None:
+        if not os.path.isfile(path):
+            return
+
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            self.add_many((row['symbol'], row['name']) for row in csv.DictReader(f))
+
+    def add(self, symbol: str, name: str = '') -> None:
+        self.add_many([(symbol, name)])
+
+    def add_many(self, entries: Iterable[Tuple[str, str]]) -> None:
+        with self._lock:
+            new = []
+            for symbol, name in entries:
+                symbol = symbol.upper()
+                if symbol not in self.names:
+                    new.append(symbol)
+                self.names[symbol] = name or self.names.get(symbol, '')
+
+            for symbol in new:
+                for gram in trigrams(symbol):
+                    self._trigrams[gram].add(symbol)
+
+            if new:
+                self._sorted = sorted(self.names)
+
+    def prefix(self, text: str, limit: int = 5) -> List[str]:
+        text = text.upper()
+        start = bisect.bisect_left(self._sorted, text)
+
+        resp = []
+        for symbol in self._sorted[start:start + limit]:
+            if not symbol.startswith(text):
+                break
+            resp.append(symbol)
+
+        return resp
+
+    def fuzzy(self, text: str, limit: int = 5, max_distance: int = None) -> List[str]:
+        text = text.upper()
+
+        if max_distance is None:
+            # short symbols are a few edits away from almost anything
+            max_distance = 1 if len(text) <= 3 else 2
+
+        # candidates share at least one trigram with the text
+        shared = Counter()
+        with self._lock:
+            for gram in trigrams(text):
+                shared.update(self._trigrams.get(gram, ()))
+
+        ranked = []
+        for symbol, common in shared.most_common(limit * 20):
+            distance = edit_distance(text, symbol, max_distance)
+            if distance <= max_distance:
+                ranked.append((distance, -common, symbol))
+
+        ranked.sort()
+        return [i[2] for i in ranked[:limit]]
+
+    def suggest(self, text: str, limit: int = 5) -> List[str]:
+        """
+        Suggest symbols for a possibly misspelled one.
+
+        Args:
+            text (str): The symbol typed by the user.
+            limit (int, optional): Maximum number of suggestions. Defaults to 5.
+
+        Returns:
+            List[str]: Prefix matches first, then the closest symbols by edit distance.
+        """
+        resp = self.prefix(text, limit)
+
+        for symbol in self.fuzzy(text, limit):
+            if len(resp) >= limit:
+                break
+            if symbol not in resp:
+                resp.append(symbol)
+
+        return resp
+
+    def refresh(self, path: str) -> None:
+        """
+        Download the symbol directory of every US listed security into `path` and load it.
+
+        Args:
+            path (str): CSV file where the downloaded symbols are kept.
+        """
+        import requests
+
+        req = requests.get(NASDAQ_TRADED_URL, timeout=30)
+        req.raise_for_status()
+
+        entries = []
+        lines = req.text.splitlines()
+        header = lines[0].split('|')
+        symbol_col, name_col, test_col = header.index('Symbol'), header.index('Security Name'), header.index('Test Issue')
+
+        for line in lines[1:]:
+            cols = line.split('|')
+            if len(cols) != len(header) or cols[test_col] == 'Y':
+                continue  # footer line or test issue
+            entries.append((cols[symbol_col].replace('.', '-'), cols[name_col]))
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['symbol', 'name'])
+            writer.writerows(entries)
+        os.replace(tmp_path, path)
+
+        self.add_many(entries)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self.names
+
+
+SYMBOLS_PATH = './symbols.csv'
+
+symbol_index = SymbolIndex([BUNDLED_SYMBOLS, SYMBOLS_PATH])
@@ -1,20 +1,28 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING, Iterable
 
-from functools import wraps
-from forex_python.converter import CurrencyCodes
+from functools import lru_cache, wraps
+import logging
 import discord
-import pandas as pd
-import requests
+from apis import market_data
+from apis.fx import fx_table
+from apis.history_store import history_store
+from apis.quote_cache import Quote, quote_cache
+from apis.symbol_index import symbol_index
+from executor import run_io
 from utils import Stock
-import yfinance as yf
 
 if TYPE_CHECKING:
     from typing import Dict, List
     from database.position import Position
 
+logger = logging.getLogger(__name__)
+
+# trading currency of each symbol seen so far
+_symbol_currencies: Dict[str, str] = {}
+
 # decorators
-def check_stock_validaty(iter_pos: int = 0):
+def check_stock_validaty(iter_pos: int = 0, *, remote_fallback: bool = True):
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
@@ -23,8 +31,10 @@ def check_stock_validaty(iter_pos: int = 0):
                 await func(*args, **kwargs)
             
             except ValueError as e:
-                name = kwargs.get('name', 'Unknown')
-                suggestions = get_symbol_suggestions(name)
+                name = kwargs.get('name', kwargs.get('symbol', 'Unknown'))
+                suggestions = symbol_index.suggest(name)
+                if not suggestions and remote_fallback:
+                    suggestions = await run_io(get_symbol_suggestions, name)
                 suggestions_str = ' '.join(f"`{i}`" for i in suggestions)
                 await iter.followup.send(
                     f"I don't have that info about `{name}`.\nCheck if the symbol is right." +
@@ -42,6 +52,9 @@ def get_stock_data(symbol, range='6mo', *, verbose=False) -> Stock:
     """
     Retrieve historical stock data for a given symbol.
 
+    The history is served from the local history store, which only downloads
+    the bars missing since the last request.
+
     Args:
         symbol (str): The stock symbol.
         range (str, optional): The time range for which historical data is requested. Defaults to '6mo'.
@@ -51,26 +64,42 @@ def get_stock_data(symbol, range='6mo', *, verbose=False) -> Stock:
         Stock or None: An instance of Stock containing the retrieved data if successful, otherwise None.
     """
 
-    stock = yf.Ticker(symbol)
+    df = history_store.get(symbol, range)
 
-    info = stock.info
-    hist = stock.history(period=range)
+    if verbose:
+        print(df)
 
-    if hist.empty:
-        raise ValueError("Ticker not recognized")
+    metadata = history_store.metadata(symbol)
+    if metadata is None:
+        info = market_data.provider.info(symbol)
+        metadata = history_store.set_metadata(
+            symbol, {'symbol': info['symbol'], 'shortName': info['shortName'], 'currency': info['currency']}
+        )
+        symbol_index.add(info['symbol'], info['shortName'])
+        _symbol_currencies.setdefault(symbol, info['currency'])
 
-    if verbose:
-        print(hist)
+    quote = get_stock_quote(symbol)
 
-    df = pd.DataFrame(hist['Close'], index=hist.index)
+    return Stock(metadata['symbol'], metadata['shortName'], quote.price, metadata['currency'], df, range)
 
-    df.index = pd.to_datetime(df.index)
-    df['Close'] = pd.to_numeric(df['Close'], errors='coerce')
-    
-    
-    currentPrice = info['currentPrice'] if 'currentPrice' in info else info['open'] 
+def get_stock_quote(symbol: str) -> Quote:
+    """Get the quote of a stock, served from the quote cache while it is fresh.
+
+    Args:
+        symbol (str): The stock symbol to lookup.
 
-    return Stock(info['symbol'], info['shortName'], currentPrice, info['currency'], df)
+    Returns:
+        Quote: The price and currency of the stock.
+
+    Raises:
+        ValueError: If the symbol is not recognized.
+    """
+
+    quote = get_stock_quotes([symbol]).get(symbol)
+    if quote is None:
+        raise ValueError("Ticker not recognized")
+
+    return quote
 
 def get_stock_current_value(symbol: str, *, currency:str = None) -> float:
     """Get the current value of a stock given its symbol.
@@ -82,62 +111,126 @@ def get_stock_current_value(symbol: str, *, currency:str = None) -> float:
         float: The current price of the stock.
     """
     
-    stock = yf.Ticker(symbol)
-
-    info = stock.info
-
-    try:
-        currentPrice = info['currentPrice'] if 'currentPrice' in info else info['open'] 
-    except KeyError:
-        raise ValueError("Ticker not recognized")
+    quote = get_stock_quote(symbol)
 
     if currency is None:
-        return currentPrice
+        return quote.price
     
-    return convert_currency(currentPrice, info['currency'], currency)
+    return convert_currency(quote.price, quote.currency, currency)
+
+def get_stock_quotes(symbols: Iterable[str], *, force: bool = False) -> Dict[str, Quote]:
+    """
+    Get the quotes of many stocks at once.
+
+    Fresh quotes are served from the quote cache, the remaining symbols are
+    resolved with a single batched download. Every quote is the last close
+    of that download, single symbols included, so cached prices always come
+    from the same source.
+
+    Args:
+        symbols (Iterable[str]): The stock symbols to lookup.
+        force (bool, optional): If True, ignores the cache and fetches every symbol. Defaults to False.
+
+    Returns:
+        Dict[str, Quote]: The quote of every recognized symbol whose currency is known.
+    """
+
+    resp = {}
+    missing = []
+
+    for symbol in set(symbols):
+        quote = None if force else quote_cache.get(symbol)
+        if quote is None:
+            missing.append(symbol)
+        else:
+            resp[symbol] = quote
+
+    if not missing:
+        return resp
+
+    closes = market_data.provider.last_closes(missing)
+    currencies = get_stock_currencies(closes)
+
+    for symbol, price in closes.items():
+        if symbol in currencies:
+            resp[symbol] = quote_cache.set(symbol, price, currencies[symbol])
+
+    return resp
+
+def get_stock_currencies(symbols: Iterable[str]) -> Dict[str, str]:
+    """
+    Get the trading currency of many stocks, the unknown ones are looked up together.
+
+    Currencies never change, so they are kept for the process lifetime.
+    Symbols whose lookup fails are left out.
+    """
+
+    symbols = list(symbols)
+    missing = [i for i in symbols if i not in _symbol_currencies]
+    if missing:
+        _symbol_currencies.update(market_data.provider.currencies(missing))
+
+    return {i: _symbol_currencies[i] for i in symbols if i in _symbol_currencies}
 
 def get_stock_position(stocks: Dict[str, Position]) -> Dict[str, float]:
     """
     Calculate the positions of stocks based on their current prices and quantities.
 
     Args:
-        stocks (List[Tuple[str, float]]): A list of tuples containing stock symbols and quantities.
+        stocks (Dict[str, Position]): The positions of a user indexed by stock symbol.
 
     Returns:
-        Dict[str, float]: A list of tuples containing stock symbols and their calculated positions.
+        Dict[str, float]: The value in USD of each position indexed by stock symbol.
     """
 
-    positions = {}
-    
-    for symbol, position in stocks.items():
-        try:
-            current_price = get_stock_current_value(symbol, currency="USD")
-        except ValueError:
-            continue
+    stock_values = get_stocks_values(stocks.keys())
 
-        positions[symbol] = current_price * position.number_owned
-        
-    return positions
+    return {
+        symbol: stock_values[symbol] * position.number_owned
+        for symbol, position in stocks.items()
+        if symbol in stock_values
+    }
 
 def get_stocks_values(stocks: Iterable[str]) -> Dict[str, float]:
+    """
+    Get the current value in USD of many stocks with a single batched request.
+
+    Args:
+        stocks (Iterable[str]): The stock symbols.
+
+    Returns:
+        Dict[str, float]: The price in USD of every recognized symbol.
+    """
     
-    resp = {}
-    
-    for symbol in stocks:
+    return quotes_to_usd(get_stock_quotes(stocks))
+
+
+def quotes_to_usd(quotes: Dict[str, Quote]) -> Dict[str, float]:
+    """
+    Convert quotes to USD, without going through the quote cache.
+
+    Args:
+        quotes (Dict[str, Quote]): The quotes, by symbol.
+
+    Returns:
+        Dict[str, float]: The price in USD of every quote whose exchange rate is known.
+    """
+
+    # one exchange rate per currency, not per symbol, a missing rate only drops its symbols
+    rates = {}
+    for currency in {i.currency for i in quotes.values()}:
         try:
-            current_price = get_stock_current_value(symbol, currency="USD")
-        except ValueError:
-            continue
+            rates[currency] = convert_currency(1, currency, "USD")
+        except Exception as e:
+            logger.warning("Exchange rate of %s failed: %s", currency, e)
 
-        resp[symbol] = current_price
-    
-    return resp
+    return {symbol: quote.price * rates[quote.currency] for symbol, quote in quotes.items() if quote.currency in rates}
 
 
 # currency funcs
 def get_symbol_suggestions(symbol: str) -> List[str]:
     """
-    Fetches symbol suggestions from Yahoo Finance API based on the provided symbol.
+    Fetches symbol suggestions from the market data provider based on the provided symbol.
 
     Args:
         symbol (str): The symbol to search for.
@@ -147,21 +240,12 @@ def get_symbol_suggestions(symbol: str) -> List[str]:
                    Returns an empty list if no suggestions are found or if there
                    was an error in retrieving the suggestions.
     """
-    
-    req = requests.get(
-        "https://query1.finance.yahoo.com/v1/finance/search",
-        params={"q": symbol, "newsCount": 0},
-        headers={"User-Agent": "python"}
-    )
-
-    if req.status_code != 200:
-        return []
-    
-    return [i['symbol'] for i in req.json().get('quotes', [])]
+
+    return market_data.provider.search(symbol)
 
 def convert_currency(amount: float, base_currency: str, target_currency: str) -> float:
     """
-    Converts an amount from the base currency to the target currency using the latest exchange rate.
+    Converts an amount from the base currency to the target currency using the in-memory FX rate table.
 
     Args:
         amount (float): The amount of money to be converted.
@@ -174,23 +258,12 @@ def convert_currency(amount: float, base_currency: str, target_currency: str) ->
     if base_currency == target_currency:
         return amount
     
-    def get_exchange_rate(base_currency: str, target_currency: str) -> float:
-        if base_currency == target_currency:
-            return 1
-        
-        ticker = f"{base_currency}{target_currency}=X"
-        data: pd.DataFrame = yf.download(ticker, period="1d", progress=False)
-        
-        if not data.empty:
-            return data['Close'].iloc[-1]
-        else:
-            raise ValueError(f"Exchange rate for {base_currency} to {target_currency} not found.")
-    
-    exchange_rate = get_exchange_rate(base_currency, target_currency)
+    exchange_rate = fx_table.rate(base_currency, target_currency)
     converted_amount = amount * exchange_rate
     
     return converted_amount
 
+@lru_cache(maxsize=None)
 def get_currency_symbol(currency: str) -> str:
     """
     Retrieves the currency symbol for a given currency code.
@@ -201,6 +274,7 @@ def get_currency_symbol(currency: str) -> str:
     Returns:
         str: The currency symbol (e.g., '$').
     """
-    c = CurrencyCodes()
-    symbol = c.get_symbol(currency)
+    from forex_python.converter import CurrencyCodes
+
+    symbol = CurrencyCodes().get_symbol(currency)
     return symbol
@@ -0,0 +1,223 @@
+"""
+Deterministic stand-ins for the market data services and for Discord.
+
+`FakeMarket` is a market data provider that also answers like the logo
+bucket and the symbol listing, with the same prices for the same seed and
+a fixed latency per request. The fake interactions record what a command sends back.
+"""
+import asyncio
+import itertools
+import time
+import zlib
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import discord
+import numpy as np
+import pandas as pd
+
+from apis import market_data
+from apis.market_data import MarketDataProvider, fx_symbol
+
+HISTORY_DAYS = 5 * 365
+CURRENCY_SUFFIXES = {'.L': 'GBP', '.DE': 'EUR', '.PA': 'EUR', '.TO': 'CAD', '.T': 'JPY'}
+
+
+class FakeMarket(MarketDataProvider):
+    """
+    Synthetic market: every symbol follows a seeded random walk of daily closes.
+
+    Symbols starting with 'INVALID' are unknown, like a typo would be.
+
+    The histories end on `today`, which is also the day the periods
+    requested are counted back from, so a run is the same on any day.
+
+    Args:
+        latency (float, optional): Seconds every request takes. Defaults to 0.05.
+        seed (int, optional): Seed of the random walks. Defaults to 0.
+        today (pd.Timestamp, optional): Last day of the histories. Defaults to the day the market is created.
+    """
+
+    def __init__(self, latency: float = 0.05, seed: int = 0, today: pd.Timestamp = None) -> None:
+        self.latency = latency
+        self.seed = seed
+        self.today = pd.Timestamp.today().normalize() if today is None else pd.Timestamp(today).normalize()
+        self.calls: Dict[str, int] = {}
+
+        self._series: Dict[str, pd.Series] = {}
+
+    # market data
+    def series(self, symbol: str) -> pd.Series:
+        series = self._series.get(symbol)
+        if series is None:
+            rng = np.random.default_rng(zlib.crc32(symbol.encode()) ^ self.seed)
+            dates = pd.bdate_range(end=self.today, periods=HISTORY_DAYS)
+
+            if symbol.endswith('=X'):
+                start = rng.uniform(0.5, 2.0)
+            else:
+                start = rng.uniform(5, 800)
+
+            close = start * np.exp(np.cumsum(rng.normal(0, 0.015, len(dates))))
+            series = self._series[symbol] = pd.Series(close, index=dates, name='Close')
+
+        return series
+
+    def known(self, symbol: str) -> bool:
+        return not symbol.startswith('INVALID')
+
+    def currency(self, symbol: str) -> str:
+        for suffix, currency in CURRENCY_SUFFIXES.items():
+            if symbol.endswith(suffix):
+                return currency
+        return 'USD'
+
+    def _request(self, kind: str) -> None:
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        time.sleep(self.latency)
+
+    # market data provider
+    def info(self, symbol: str) -> dict:
+        self._request('info')
+
+        if not self.known(symbol):
+            raise ValueError("Ticker not recognized")
+
+        return {
+            'symbol': symbol,
+            'shortName': f"{symbol} Inc.",
+            'currency': self.currency(symbol),
+        }
+
+    def last_closes(self, symbols: List[str]) -> Dict[str, float]:
+        self._request('quote_batch')
+        return {i: float(self.series(i).iloc[-1]) for i in symbols if self.known(i)}
+
+    def history(self, symbol: str, *, period: str = None, start=None, end=None) -> Tuple[np.ndarray, np.ndarray]:
+        self._request('history')
+
+        if not self.known(symbol):
+            return market_data.EMPTY_HISTORY
+
+        series = self.series(symbol)
+        if start is not None or end is not None:
+            series = series.loc[start:end]
+        elif period not in (None, 'max'):
+            from utils import calculate_start_date
+            series = series.loc[calculate_start_date(period, self.today):]
+
+        return series.index.to_numpy(dtype='datetime64[ns]'), series.to_numpy(dtype=np.float64)
+
+    def fx_rates(self, currencies: Iterable[str]) -> Dict[str, float]:
+        self._request('fx')
+        return {i: float(self.series(fx_symbol(i)).iloc[-1]) for i in currencies}
+
+    def search(self, text: str) -> List[str]:
+        self._request('search')
+
+        text = text.upper()
+        return [text[:i] for i in range(len(text), 0, -1) if self.known(text[:i])][:5]
+
+    # logo bucket
+    async def head(self, session, url: str) -> int:
+        self.calls['head'] = self.calls.get('head', 0) + 1
+        await asyncio.sleep(self.latency)
+        return 200 if url.endswith('_US_EQ.png') else 404
+
+
+@contextmanager
+def patched_market(market: FakeMarket):
+    """Serve the market data of the bot from `market`, and route its logo and symbol listing requests to it."""
+    from apis.logo_resolver import LogoResolver
+    from apis.symbol_index import SymbolIndex
+
+    patches = [
+        (market_data, 'provider', market),
+        (SymbolIndex, 'refresh', lambda self, path: market._request('listing')),
+        (LogoResolver, '_head', lambda self, session, url: market.head(session, url)),
+    ]
+
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    try:
+        for obj, name, value in patches:
+            setattr(obj, name, value)
+        yield market
+    finally:
+        for obj, name, value in originals:
+            setattr(obj, name, value)
+
+
+# discord
+class FakeMember:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+        self.bot = False
+        self.display_name = f"user-{user_id}"
+        self.avatar = SimpleNamespace(url=f"https://cdn.example/avatars/{user_id}.png")
+        self.display_avatar = self.avatar
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int) -> None:
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+
+    def get_member(self, user_id: int) -> FakeMember:
+        return FakeMember(user_id)
+
+
+class FakeResponse:
+    def __init__(self, interaction: 'FakeInteraction') -> None:
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, **kwargs) -> None:
+        self._done = True
+
+    async def send_message(self, content: str = None, **kwargs) -> None:
+        self._done = True
+        self.interaction.sent.append((content, kwargs))
+
+    async def edit_message(self, **kwargs) -> None:
+        self._done = True
+        self.interaction.sent.append((None, kwargs))
+
+
+class FakeFollowup:
+    def __init__(self, interaction: 'FakeInteraction') -> None:
+        self.interaction = interaction
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        self.interaction.sent.append((content, kwargs))
+
+
+class FakeInteraction:
+    """Slash command interaction of `user_id` in `guild_id`, keeping every message sent back."""
+    _ids = itertools.count(1)
+
+    def __init__(self, guild_id: int, user_id: int) -> None:
+        self.id = next(self._ids)
+        self.type = discord.InteractionType.application_command
+        self.guild = FakeGuild(guild_id)
+        self.guild_id = guild_id
+        self.user = FakeMember(user_id)
+
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.sent: List[tuple] = []
+
+    async def edit_original_response(self, **kwargs) -> None:
+        self.sent.append((None, kwargs))
+
+    @property
+    def last_content(self) -> Optional[str]:
+        return self.sent[-1][0] if self.sent else None
+
+    @property
+    def replied(self) -> bool:
+        """True if an embed or a file was sent back, rather than only an error message."""
+        return any(kwargs.get('embed') is not None or kwargs.get('file') is not None for _, kwargs in self.sent)
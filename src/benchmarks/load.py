@@ -0,0 +1,166 @@
+"""
+Multi-process load test of the shared SQLite database.
+
+Seeds a shared database, then runs trades from 1, 2, 4... worker processes
+at once on the same users, each process with its own database cache and
+trade engine, exactly like several bot processes would. Every trade buys
+or sells $1 at a fixed price, so the expected total cash is known and any
+lost update shows up as a mismatch.
+
+Reports the throughput of every process count, its speedup over a single
+process, and the conflicts retried by the optimistic concurrency.
+
+Usage (from the src folder):
+    python -m benchmarks.load --processes 8 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from benchmarks.memory_footprint import SYMBOLS
+from benchmarks.run import build_raw_database
+
+PRICE = 100.0
+
+
+def worker(path: str, users: List[Tuple[int, int]], start_at: float, duration: float, concurrency: int, seed: int) -> Dict[str, int]:
+    """Trade on random users from `start_at` for `duration` seconds, in a fresh process."""
+    from database.database import InMemoryDatabase
+    from database.storage import create_storage
+    from trading import TradeEngine, TradeError
+
+    db = InMemoryDatabase(storage=create_storage('shared', path))
+    engine = TradeEngine(db)
+    rng = random.Random(seed)
+    counts = {'buys': 0, 'sells': 0, 'rejected': 0}
+
+    async def client(deadline: float):
+        while time.time() < deadline:
+            guild_id, user_id = rng.choice(users)
+            symbol = rng.choice(SYMBOLS)
+
+            try:
+                if rng.random() < 0.5:
+                    await engine.buy(guild_id, user_id, symbol, value=1.0, price=PRICE)
+                    counts['buys'] += 1
+                else:
+                    await engine.sell(guild_id, user_id, symbol, value=1.0, price=PRICE)
+                    counts['sells'] += 1
+            except TradeError:
+                counts['rejected'] += 1
+
+            # let the other clients of this process in, like concurrent interactions
+            await asyncio.sleep(0)
+
+    async def run():
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        deadline = start_at + duration
+        await asyncio.gather(*(client(deadline) for _ in range(concurrency)))
+
+    asyncio.run(run())
+    db.close()
+
+    counts['conflicts'] = engine.conflicts
+    return counts
+
+def total_cash(path: str) -> float:
+    from database.storage import create_storage
+
+    storage = create_storage('shared', path)
+    try:
+        return sum(user['cash'] for guild in storage.load_all().values() for user in guild.values())
+    finally:
+        storage.close()
+
+
+def run(args, workdir: str) -> List[dict]:
+    from database.storage import create_storage
+
+    path = os.path.join(workdir, 'data.sqlite')
+    raw = build_raw_database(args.guilds, args.users, args.positions, args.seed)
+
+    storage = create_storage('shared', path)
+    storage.save_all(raw)
+    storage.close()
+
+    rng = random.Random(args.seed)
+    everyone = [(int(i, 16), int(j, 16)) for i, guild in raw.items() for j in guild]
+    users = rng.sample(everyone, min(args.hot_users, len(everyone)))
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    processes = 1
+
+    while processes <= args.processes:
+        cash_before = total_cash(path)
+
+        with ProcessPoolExecutor(processes, mp_context=context) as pool:
+            # leave the workers time to start, then trade all at once
+            start_at = time.time() + 2 + processes * 0.5
+            futures = [
+                pool.submit(worker, path, users, start_at, args.duration, args.concurrency, args.seed + i)
+                for i in range(processes)
+            ]
+            counts = [i.result() for i in futures]
+
+        buys, sells = sum(i['buys'] for i in counts), sum(i['sells'] for i in counts)
+        result = {
+            'processes': processes,
+            'trades': buys + sells,
+            'trades_per_s': round((buys + sells) / args.duration, 1),
+            'rejected': sum(i['rejected'] for i in counts),
+            'conflicts': sum(i['conflicts'] for i in counts),
+            # every buy costs $1 and every sell brings $1
+            'cash_drift': round(total_cash(path) - (cash_before - buys + sells), 6),
+        }
+        result['speedup'] = round(result['trades_per_s'] / results[0]['trades_per_s'], 2) if results else 1.0
+        results.append(result)
+
+        print(
+            f"{processes:>3} processes {result['trades_per_s']:>10.1f} trades/s  x{result['speedup']:<5} "
+            f"conflicts {result['conflicts']:>6}  rejected {result['rejected']:>6}  cash drift {result['cash_drift']}"
+        )
+        processes *= 2
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=100)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--positions', type=int, default=3, help="average positions per user")
+    parser.add_argument('--hot-users', type=int, default=200, help="users the trades are spread over, fewer means more conflicts")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help="up to this many worker processes")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent trades per process")
+    parser.add_argument('--duration', type=float, default=5, help="seconds of trading per process count")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    # the workers are spawned, they import the bot from the src folder
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [src, os.environ.get('PYTHONPATH')]))
+    sys.path.insert(0, src)
+
+    workdir = tempfile.mkdtemp(prefix='tradingbot-load-')
+    try:
+        results = run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'cpus': os.cpu_count(), 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Memory footprint of the domain model.
+
+Builds a guild of synthetic users and reports the bytes retained per user,
+both by the raw JSON dicts the model is loaded from and by a Guild loaded
+from them, once the raw dicts are released.
+
+Usage (from the src folder):
+    python -m benchmarks.memory_footprint --users 100000 --positions 3
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+
+from database.guild import Guild
+
+SYMBOLS = ['AAPL', 'MSFT', 'NVDA', 'TSLA', 'AMZN', 'GOOGL', 'META', 'AMD', 'NFLX', 'KO', 'PEP', 'JPM']
+
+
+def build_raw_guild(users: int, positions: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+
+    return {
+        hex(10**17 + i): {
+            'cash': rng.uniform(0, 4000),
+            'stocks': {
+                symbol: {'number_owned': rng.uniform(0, 50), 'valued_invested': rng.uniform(0, 2000)}
+                for symbol in rng.sample(SYMBOLS, positions)
+            }
+        }
+        for i in range(users)
+    }
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    obj = build()
+
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del obj
+    return after - before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--positions', type=int, default=3)
+    args = parser.parse_args()
+
+    raw_bytes = measure(lambda: build_raw_guild(args.users, args.positions))
+    model_bytes = measure(lambda: Guild(1, build_raw_guild(args.users, args.positions)))
+
+    print(f"users: {args.users}, positions per user: {args.positions}")
+    print(f"raw json dicts: {raw_bytes / 2**20:8.1f} MiB  {raw_bytes / args.users:7.0f} B/user")
+    print(f"domain model:   {model_bytes / 2**20:8.1f} MiB  {model_bytes / args.users:7.0f} B/user")
+
+if __name__ == '__main__':
+    main()
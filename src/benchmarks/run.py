@@ -0,0 +1,292 @@
+"""
+Offline benchmark suite.
+
+Builds a synthetic database, routes every market data request to a fake
+market with a fixed latency and times the database, the valuation, the
+chart rendering and the command handlers, called with fake interactions.
+
+The report is JSON with sorted keys, so two runs can be diffed directly
+or compared with --compare.
+
+Usage (from the src folder):
+    python -m benchmarks.run --guilds 1000 --users 100000 --output before.json
+    python -m benchmarks.run --guilds 1000 --users 100000 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from benchmarks.fakes import FakeInteraction, FakeMarket, patched_market
+from benchmarks.memory_footprint import SYMBOLS
+
+REPORT_VERSION = 1
+
+
+def build_raw_database(guilds: int, users: int, positions: int, seed: int = 0) -> Dict[str, dict]:
+    """
+    Serialized database with `users` spread over `guilds`, a few guilds holding most of them.
+
+    Every user holds between 0 and 2 * `positions` positions.
+    """
+    rng = random.Random(seed)
+    resp: Dict[str, dict] = {}
+
+    for i in range(users):
+        guild = min(int(rng.paretovariate(1.2)) - 1, guilds - 1)
+        n_positions = min(rng.randint(0, 2 * positions), len(SYMBOLS))
+
+        resp.setdefault(hex(10**17 + guild), {})[hex(10**17 + i)] = {
+            'cash': rng.uniform(0, 4000),
+            'stocks': {
+                symbol: {'number_owned': rng.uniform(0.1, 50), 'valued_invested': rng.uniform(10, 2000)}
+                for symbol in rng.sample(SYMBOLS, n_positions)
+            }
+        }
+
+    # guilds nobody landed in still exist
+    for guild in range(guilds):
+        resp.setdefault(hex(10**17 + guild), {})
+
+    return resp
+
+
+class Suite:
+    def __init__(self, repeat: int) -> None:
+        self.repeat = repeat
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, samples: List[float]) -> None:
+        samples = sorted(samples)
+
+        self.results[name] = {
+            'n': len(samples),
+            'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+            'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+            'p95_ms': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000, 3),
+            'min_ms': round(samples[0] * 1000, 3),
+        }
+        print(f"{name:<40} {self.results[name]['p50_ms']:>10.3f} ms p50 {self.results[name]['p95_ms']:>10.3f} ms p95")
+
+    def bench(self, name: str, func: Callable[[], object], repeat: int = None) -> None:
+        samples = []
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+
+        self.record(name, samples)
+
+    async def abench(self, name: str, func: Callable[[], Awaitable[object]], repeat: int = None) -> None:
+        samples = []
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            await func()
+            samples.append(time.perf_counter() - start)
+
+        self.record(name, samples)
+
+
+def bench_database(suite: Suite, raw: Dict[str, dict]):
+    from database.database import InMemoryDatabase
+    from database.storage import JsonStorage
+    from valuation import Holdings
+
+    with open('data.json', 'w') as f:
+        json.dump(raw, f)
+
+    storage = JsonStorage('data.json')
+    db = InMemoryDatabase(storage=storage)
+
+    suite.bench('db.load_data', db._load_data, repeat=max(1, suite.repeat // 10))
+    suite.bench('db.save_data', db.save_data, repeat=max(1, suite.repeat // 10))
+
+    keys = [(guild_id, user_id) for guild_id, guild in db.data.items() for user_id in guild.data]
+    rng = random.Random(1)
+    lookups = [rng.choice(keys) for _ in range(10_000)]
+
+    def get_users():
+        for guild_id, user_id in lookups:
+            db.get_user(guild_id, user_id)
+
+    suite.bench('db.get_user x10k', get_users)
+
+    largest = max(db.data.values(), key=lambda i: len(i.data))
+    users = list(largest.data.values())
+    prices = {symbol: 100.0 + i for i, symbol in enumerate(SYMBOLS)}
+    suite.bench(f'Holdings build ({len(users)} users)', lambda: Holdings(users))
+
+    # the holdings a leaderboard keeps, updated by trades and valued by price ticks
+    holdings = Holdings(users)
+    suite.bench(f'Holdings.valuate ({len(users)} users)', lambda: holdings.valuate(prices))
+    suite.bench(f'Holdings.update ({len(users)} users)', lambda: [holdings.update(i) for i in users])
+
+    return db, largest.guild_id
+
+
+async def bench_rendering(suite: Suite, market: FakeMarket):
+    from render_worker import render_sync
+    from rendering import renderer
+
+    history = market.series('AAPL').iloc[-126:]
+    data = {'dates': history.index.to_numpy(), 'close': history.to_numpy(), 'theme': 'dark'}
+    positions = {symbol: 1000.0 + i for i, symbol in enumerate(SYMBOLS)}
+
+    suite.bench('render.history (in process)', lambda: render_sync('history', data))
+    suite.bench('render.bar (in process)', lambda: render_sync('bar', {'positions': positions}))
+
+    await renderer.render('history', data)  # start the workers
+    await suite.abench('renderer.render history (pool)', lambda: renderer.render('history', data))
+
+    renderer.shutdown()
+
+
+async def bench_commands(suite: Suite, db, guild_id: int):
+    import main
+    from database.position import Position
+    from apis.quote_cache import quote_cache
+    from leaderboard import leaderboards
+    from orders import OrderBook
+    from trading import TradeEngine
+
+    main.db = db
+    main.trade_engine = TradeEngine(db)
+    main.order_book = OrderBook(main.trade_engine)
+
+    user_ids = list(db.data[guild_id].data)
+    rng = random.Random(2)
+
+    # users with enough cash and AAPL for every trade of the benchmark
+    traders = user_ids[:100]
+    for user_id in traders:
+        user = db.get_user(guild_id, user_id)
+        user.cash = max(user.cash, 1000)
+        user.stocks['AAPL'] = Position('AAPL', {'number_owned': 10_000, 'valued_invested': 10_000})
+
+    def command(callback, *args, users: List[int] = user_ids, **kwargs):
+        async def handler():
+            interaction = FakeInteraction(guild_id, rng.choice(users))
+            await callback(*args[:1], interaction, *args[1:], **kwargs)
+
+            # an error message is much faster than a real answer, it must not be timed as one
+            if not interaction.replied:
+                raise AssertionError(f"{callback.__qualname__} answered {interaction.last_content!r} instead of an embed or a file")
+
+        return handler
+
+    async def cold(handler):
+        quote_cache.clear()
+        await handler()
+
+    buy, sell = main.BuyGroup(), main.SellGroup()
+
+    commands = {
+        'profile': command(main.profile.callback),
+        'portfolio': command(main.view_portfolio.callback),
+        'stock': command(main.stock.callback, name='AAPL'),
+        'buy price': command(main.BuyGroup.buy_price.callback, buy, symbol='AAPL', value=1, users=traders),
+        'sell quantity': command(main.SellGroup.sell_quantity.callback, sell, symbol='AAPL', quantity=1, users=traders),
+    }
+
+    for name, handler in commands.items():
+        await handler()  # warm up, e.g. start the render workers
+        await suite.abench(f'command {name} (cold quotes)', lambda: cold(handler))
+        await suite.abench(f'command {name} (warm)', handler)
+
+    ranking = command(main.guild_ranking.callback)
+
+    leaderboards.boards.clear()
+    await suite.abench('command ranking (first)', ranking, repeat=1)
+    await suite.abench('command ranking (warm)', ranking)
+
+    await main.shutdown()
+
+
+def compare(old: dict, new: dict) -> None:
+    print(f"\n{'benchmark':<40} {'old p50':>10} {'new p50':>10} {'change':>8}")
+
+    for name in sorted(set(old['results']) | set(new['results'])):
+        before = old['results'].get(name, {}).get('p50_ms')
+        after = new['results'].get(name, {}).get('p50_ms')
+
+        if before is None or after is None:
+            print(f"{name:<40} {before or '-':>10} {after or '-':>10} {'':>8}")
+            continue
+
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:<40} {before:>10.3f} {after:>10.3f} {change:>+7.1f}%")
+
+
+async def run(args) -> dict:
+    suite = Suite(args.repeat)
+    market = FakeMarket(latency=args.latency / 1000, seed=args.seed)
+
+    with patched_market(market):
+        raw = build_raw_database(args.guilds, args.users, args.positions, args.seed)
+        db, guild_id = bench_database(suite, raw)
+        del raw
+
+        if not args.skip_render:
+            await bench_rendering(suite, market)
+
+        await bench_commands(suite, db, guild_id)
+
+    return {
+        'version': REPORT_VERSION,
+        'config': {
+            'guilds': args.guilds,
+            'users': args.users,
+            'positions': args.positions,
+            'latency_ms': args.latency,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'requests': dict(sorted(market.calls.items())),
+        'results': suite.results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=100)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--positions', type=int, default=3, help="average positions per user")
+    parser.add_argument('--latency', type=float, default=50, help="latency of every fake request, in ms")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-render', action='store_true')
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--compare', help="JSON report of a previous run to compare against")
+    args = parser.parse_args()
+
+    # every file the bot writes (database, history, charts...) goes to a scratch folder
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='tradingbot-bench-')
+    sys.path.insert(0, cwd)
+    os.chdir(workdir)
+
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Startup benchmark.
+
+Starts the bot in fresh interpreters, without connecting to Discord, and
+times the import of every module `main` loads directly (from
+`python -X importtime`), the time until the bot is ready to connect
+(interpreter start, imports and `main.setup()` loading the database) and
+the background warm-up that runs after `on_ready`.
+
+The report has the format of `benchmarks.run`, so --compare works the same.
+
+Usage (from the src folder):
+    python -m benchmarks.startup --users 100000 --output before.json
+    python -m benchmarks.startup --users 100000 --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.run import REPORT_VERSION, Suite, build_raw_database, compare
+from database.storage import create_storage
+
+# runs in the fresh interpreter, prints the timestamps of every step as JSON
+CHILD = """
+import asyncio, json, time
+start = time.time()
+
+import main
+imported = time.time()
+
+main.setup()
+ready = time.time()
+
+async def after_ready():
+    await main.warm_up()
+    warm = time.time()
+    await main.renderer.render('bar', {'positions': {'AAPL': 1.0}})
+    return warm, time.time()
+
+warm, chart = asyncio.run(after_ready())
+main.renderer.shutdown()
+print(json.dumps({'start': start, 'imported': imported, 'ready': ready, 'warm': warm, 'chart': chart}))
+"""
+
+
+def import_times(src: str) -> Dict[str, float]:
+    """Cumulative import time in seconds of `main` and of every module it imports directly."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=src, capture_output=True, text=True, check=True,
+    )
+
+    # a module is listed after everything it imported, one level deeper
+    resp = {}
+    children = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+
+        if depth == 1:
+            children[name.strip()] = int(cumulative) / 1e6
+        elif depth == 0:
+            if name.strip() == 'main':
+                resp.update(children)
+                resp['main'] = int(cumulative) / 1e6
+            children = {}
+
+    return resp
+
+def time_to_ready(src: str, workdir: str) -> Dict[str, float]:
+    """Seconds from launching the interpreter to each startup step."""
+    env = dict(os.environ, PYTHONPATH=src)
+
+    launched = time.time()
+    proc = subprocess.run([sys.executable, '-c', CHILD], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    # the bot prints too, e.g. when it saves on exit
+    steps = json.loads(next(i for i in proc.stdout.splitlines() if i.startswith('{')))
+
+    return {
+        'interpreter': steps['start'] - launched,
+        'import main': steps['imported'] - steps['start'],
+        'setup': steps['ready'] - steps['imported'],
+        'time to ready': steps['ready'] - launched,
+        'warm up': steps['warm'] - steps['ready'],
+        'first chart after warm up': steps['chart'] - steps['warm'],
+    }
+
+
+def run(args, src: str, workdir: str) -> dict:
+    suite = Suite(args.repeat)
+
+    raw = build_raw_database(args.guilds, args.users, args.positions, args.seed)
+    with open(os.path.join(workdir, 'data.json'), 'w') as f:
+        json.dump(raw, f)
+
+    # the files of the default backend too, so no run times the import of data.json
+    storage = create_storage('guilds', os.path.join(workdir, 'data.json'))
+    storage.save_all(raw)
+    storage.close()
+    del raw
+
+    imports: Dict[str, List[float]] = {}
+    steps: Dict[str, List[float]] = {}
+
+    for _ in range(args.repeat):
+        for name, seconds in import_times(src).items():
+            imports.setdefault(name, []).append(seconds)
+
+        for name, seconds in time_to_ready(src, workdir).items():
+            steps.setdefault(name, []).append(seconds)
+
+    for name, samples in steps.items():
+        suite.record(f'startup {name}', samples)
+
+    # heaviest imports first
+    for name, samples in sorted(imports.items(), key=lambda i: -sum(i[1]) / len(i[1])):
+        suite.record(f'import {name}', samples)
+
+    return {
+        'version': REPORT_VERSION,
+        'config': {
+            'guilds': args.guilds,
+            'users': args.users,
+            'positions': args.positions,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'results': suite.results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guilds', type=int, default=100)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--positions', type=int, default=3, help="average positions per user")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--compare', help="JSON report of a previous run to compare against")
+    args = parser.parse_args()
+
+    # the bot runs from a scratch folder holding the generated database
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='tradingbot-startup-')
+
+    try:
+        report = run(args, src, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
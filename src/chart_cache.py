@@ -0,0 +1,129 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+from typing import Dict, Optional
+
+if TYPE_CHECKING:
+    from utils import Stock
+
+
+class ChartCache:
+    """
+    Two-tier LRU cache of rendered charts, as PNG bytes.
+
+    The memory tier holds the most recent charts, the disk tier keeps more of
+    them across restarts. A disk hit is promoted back to memory. Only the
+    memory tier (`get`, `put`) may be used from the event loop, the disk
+    tier (`load`, `save`) does file IO.
+
+    Args:
+        directory (str, optional): Folder of the disk tier. Defaults to './charts'.
+        max_memory_items (int, optional): Charts kept in memory. Defaults to 64.
+        max_disk_items (int, optional): Charts kept on disk. Defaults to 1024.
+    """
+
+    def __init__(self, directory: str = './charts', max_memory_items: int = 64, max_disk_items: int = 1024) -> None:
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(symbol: str, range: str, last_timestamp, last_value: float, theme: str) -> str:
+        raw = f"{symbol}|{range}|{last_timestamp}|{last_value!r}|{theme}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    @classmethod
+    def key_for_stock(cls, stock: Stock, theme: str = 'dark') -> str:
+        """Cache key of the history graph of a stock, it changes whenever a new data point arrives."""
+        history = stock.history
+
+        if history.empty:
+            return cls.key(stock.symbol, stock.range, None, None, theme)
+
+        return cls.key(stock.symbol, stock.range, history.index[-1], float(history['Close'].iloc[-1]), theme)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Look a chart up in the memory tier only, cheap enough for the event loop."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+
+        return data
+
+    def load(self, key: str) -> Optional[bytes]:
+        """Look a chart up in the disk tier and promote it to memory. Blocking, run it off the event loop."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+        except OSError:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        self.put(key, data)
+        return data
+
+    def stats(self) -> Dict[str, float]:
+        total = self.memory_hits + self.disk_hits + self.misses
+
+        return {
+            'memory_size': len(self._memory),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / total if total else 0.0,
+        }
+
+    def put(self, key: str, data: bytes) -> None:
+        """Keep a chart in the memory tier."""
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def save(self, key: str, data: bytes) -> None:
+        """Write a chart to the disk tier, evicting the least recently used ones. Blocking, run it off the event loop."""
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = self._path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        entries = [i for i in os.scandir(self.directory) if i.name.endswith('.png')]
+        if len(entries) <= self.max_disk_items:
+            return
+
+        entries.sort(key=lambda i: i.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_items]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+
+chart_cache = ChartCache()
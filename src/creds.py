@@ -1,2 +1,8 @@
 BOT_TOKEN = ""
-OWNER_ID = 0
\ No newline at end of file
+OWNER_ID = 0
+
+# optional settings
+DATABASE_BACKEND = "guilds"  # "guilds", "json", "journal", "sqlite" or "shared"
+MARKET_DATA = "yahoo"  # "yahoo" or "replay"
+SHARD_COUNT = None  # total shards, None to run without sharding
+SHARD_IDS = None  # shards run by this process, None for all of them
@@ -1,39 +1,143 @@
 import json
+import threading
 from pprint import pprint
-from typing import Dict, List
+from typing import Any, Callable, Dict, List, Set
 
 from database.user import User
-from utils import default_data_file
+from executor import run_io
+from metrics import metrics
 
 from .guild import Guild
+from .storage import JsonStorage, StorageBackend
 
 
 class InMemoryDatabase:
-    def __init__(self, data_json_path: str):
-        default_data_file(data_json_path)
+    """
+    Every guild and user of the bot, kept in memory and persisted through a storage backend.
+
+    With a shared storage the memory only caches the store: other processes
+    trade on the same users, so a user is reloaded when its stored version
+    moved, and is saved only if it didn't move since it was read. Those
+    reads and saves wait on the locks of the other processes, the event
+    loop makes them through `run`.
+    """
+
+    def __init__(self, data_json_path: str = None, *, storage: StorageBackend = None):
+        self.storage = JsonStorage(data_json_path) if storage is None else storage
+        self.shared = self.storage.shared
         
         self.file_path = data_json_path
-        self.data = self._load_data(data_json_path)
+        self.dirty_guilds: Set[int] = set()
+        self._guilds_lock = threading.Lock()
+        self.data = {} if self.storage.lazy else self._load_data()
     
-    def _load_data(self, file_path) -> Dict[str, Guild]:
-        if file_path is None:
-            return {}
-        
-        with open(file_path, 'r') as f:
-            raw_data: dict = json.load(f)
+    def _load_data(self) -> Dict[int, Guild]:
+        raw_data = self.storage.load_all()
 
         resp = {}
         for guild_id, data in raw_data.items():
-            resp[guild_id] = Guild(guild_id, data)
+            guild_id = int(guild_id, 16)
+            resp[guild_id] = Guild(guild_id, data, self._mark_dirty)
 
         return resp
+
+    def _mark_dirty(self, guild_id: int):
+        self.dirty_guilds.add(guild_id)
     
     def save_data(self):
-        if self.file_path is None:
+        # a shared store holds every trade already, a snapshot would overwrite other processes' ones
+        if not self.shared:
+            self.storage.save_all(self.serialize())
+        self._clear_dirty(list(self.dirty_guilds))
+
+    async def autosave(self):
+        """
+        Persist the guilds changed since the last save.
+
+        With partial saves, the changed guilds are copied on the event loop,
+        so the copy is consistent, and written from a worker thread. A full
+        snapshot is both taken and written from a worker thread: a trade
+        it catches halfway marks its guild changed again, for the next save.
+        """
+        if not self.dirty_guilds:
+            return
+
+        guild_ids = list(self.dirty_guilds)
+        self._clear_dirty(guild_ids)
+
+        if self.shared:
+            return
+
+        try:
+            if self.storage.partial_saves:
+                snapshot = {hex(i): self.data[i].serialize() for i in guild_ids}
+                with metrics.timer('db_autosave'):
+                    await run_io(self.storage.save_guilds, snapshot)
+            elif self.storage.persists_trades:
+                # the trades are durable already, only fold them once there are enough
+                if self.storage.needs_snapshot:
+                    self.storage.compact(self.serialize)
+            else:
+                with metrics.timer('db_autosave'):
+                    await run_io(self._save_snapshot)
+        except Exception:
+            # try again on the next autosave
+            for i in guild_ids:
+                self.data[i].mark_dirty()
+            raise
+
+    def _save_snapshot(self):
+        self.storage.save_all(self.serialize())
+
+    def _clear_dirty(self, guild_ids: List[int]):
+        for i in guild_ids:
+            self.data[i].clear_dirty()
+            self.dirty_guilds.discard(i)
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """
+        Call a method of the database from the event loop.
+
+        With a shared storage the call reads or writes the store, possibly
+        waiting for another process to commit, so it runs on the IO thread
+        pool. Otherwise it only touches memory, or appends to a local file,
+        and runs right away.
+        """
+        if self.shared:
+            return await run_io(func, *args)
+
+        return func(*args)
+
+    def save_user(self, guild_id: int, user_id: int, user: User = None):
+        """
+        Persist a single user, meant to be called after every trade.
+
+        Args:
+            guild_id (int): The guild of the user.
+            user_id (int): The user id.
+            user (User, optional): The user the trade changed. Defaults to the cached one.
+
+        Raises:
+            ConcurrentUpdate: With a shared storage, if another process saved the user since it was read.
+        """
+        # not reloaded, that would drop the changes to save
+        if user is None:
+            user = self._guild(guild_id).get_user(user_id)
+
+        if self.shared:
+            with metrics.timer('db_save_user'):
+                user.version = self.storage.save_user_if(guild_id, user_id, user.serialize(), user.version)
             return
-        
-        with open(self.file_path, 'w') as f:
-            json.dump(self.serialize(), f, indent=4)
+
+        with metrics.timer('db_save_user'):
+            self.storage.save_user(guild_id, user_id, user.serialize())
+
+        if self.storage.needs_snapshot:
+            # the snapshot is taken and written in the background
+            self.storage.compact(self.serialize)
+
+    def close(self):
+        self.storage.close()
 
     def display_all(self):
         pprint(self.data)
@@ -42,31 +146,70 @@ class InMemoryDatabase:
         return list(self.get_guild(guild_id).data.values())
 
     def get_guild(self, guild_id: int) -> Guild:
-        guild_id = hex(guild_id)
-        
-        # check if the guild exists
-        if guild_id not in self.data:
-            self.data[guild_id] = Guild(guild_id)
-        
-        return self.data[guild_id]
+        guild = self._guild(guild_id)
+
+        if self.shared:
+            self.refresh_guild(guild_id)
+
+        return guild
 
     def get_user(self, guild_id: int, auther_id: int):
+        guild = self._guild(guild_id)
+
+        if self.shared:
+            user = guild.data.get(auther_id)
+            version = self.storage.user_version(guild_id, auther_id)
+
+            if version and (user is None or user.version != version):
+                return self._reload_user(guild, auther_id)
+
+        return guild.get_user(auther_id)
+
+    def refresh_guild(self, guild_id: int) -> List[User]:
+        """
+        Reload the users of a guild saved by other processes since they were read, for shared storages.
+
+        Returns:
+            List[User]: The reloaded users.
+        """
+        guild = self._guild(guild_id)
+        versions = self.storage.user_versions(guild_id)
+
+        return [
+            self._reload_user(guild, user_id)
+            for user_id, version in versions.items()
+            if user_id not in guild.data or guild.data[user_id].version != version
+        ]
+
+    def _guild(self, guild_id: int) -> Guild:
+        guild = self.data.get(guild_id)
         
-        guild_id = hex(guild_id)
-        
-        # check if the guild exists
-        if guild_id not in self.data:
-            self.data[guild_id] = Guild(guild_id)
-        
-        guild = self.data[guild_id]
+        # check if the guild exists, once for the threads of a shared storage
+        if guild is None:
+            with self._guilds_lock:
+                guild = self.data.get(guild_id)
+                if guild is None:
+                    raw_data = self.storage.load_guild(guild_id) if self.storage.lazy else None
+                    guild = self.data[guild_id] = Guild(guild_id, raw_data, self._mark_dirty)
         
-        return guild.get_user(auther_id)
+        return guild
+
+    def reload_user(self, guild_id: int, user_id: int) -> User:
+        """Drop the cached user for the stored one, e.g. after its save failed."""
+        return self._reload_user(self._guild(guild_id), user_id)
+
+    def _reload_user(self, guild: Guild, user_id: int) -> User:
+        data = self.storage.load_user(guild.guild_id, user_id)
+        user = guild.data[user_id] = User(user_id, data, guild.mark_dirty)
+
+        return user
 
     def serialize(self) -> Dict[str, dict]:
         resp = {}
         
-        for i in self.data:
-            resp[i] = self.data[i].serialize()
+        # copies of the dicts, so a snapshot can be taken from a worker thread
+        for i, guild in list(self.data.items()):
+            resp[hex(i)] = guild.serialize()
         
         return resp
 
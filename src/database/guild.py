@@ -1,40 +1,62 @@
-import copy
 import json
-from typing import Dict
+from typing import Callable, Dict
 
 from .user import User
 
-DEFAULT_STATS = {}
 
 class Guild:
-    def __init__(self, guild_id: str, data: dict=None) -> None:
+    __slots__ = ('guild_id', 'data', 'dirty', 'on_change')
+
+    def __init__(self, guild_id: int, data: dict=None, on_change: Callable[[int], None] = None) -> None:
         self.guild_id = guild_id
+
+        self.on_change = on_change
+        self.dirty = False
         
-        self.data = copy.deepcopy(DEFAULT_STATS) if data is None else self._load_data(data)
+        self.data: Dict[int, User] = {} if data is None else self._load_data(data)
 
     
-    def _load_data(self, raw_data: dict) -> Dict[str, User]:
+    def _load_data(self, raw_data: dict) -> Dict[int, User]:
+        mark_dirty = self.mark_dirty
+
         resp = {}
         for user_id, data in raw_data.items():
-            resp[user_id] = User(int(user_id, 16), data)
+            user_id = int(user_id, 16)
+            resp[user_id] = User(user_id, data, mark_dirty)
     
         return resp
+
+    def mark_dirty(self) -> None:
+        if self.dirty:
+            return
+
+        self.dirty = True
+
+        if self.on_change is not None:
+            self.on_change(self.guild_id)
+
+    def clear_dirty(self) -> None:
+        self.dirty = False
+
+        for user in self.data.values():
+            if user.dirty:
+                user.clear_dirty()
     
     def get_user(self, user_id: int) -> User:
+        user = self.data.get(user_id)
 
-        user_id = hex(user_id)
-
-        if user_id not in self.data:
-            self.data[user_id] = User(user_id)
+        if user is None:
+            user = self.data[user_id] = User(user_id, on_change=self.mark_dirty)
+            self.mark_dirty()
         
-        return self.data[user_id]
+        return user
     
     
     def serialize(self) -> Dict[str, dict]:
         resp = {}
         
-        for i in self.data:
-            resp[i] = self.data[i].serialize()
+        for i, user in list(self.data.items()):
+            resp[hex(i)] = user.serialize()
         
         return resp
     
@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .storage import StorageBackend
+
+
+class TradeJournal:
+    """
+    Append-only, line-oriented log of user states.
+
+    Every entry holds the full state of one user after a trade, so replaying
+    an entry twice is harmless. Appends are buffered and written by a
+    background thread that fsyncs once per batch (group commit), so an append
+    costs no disk I/O on the caller and at most `commit_interval` seconds of
+    trades can be lost on a crash.
+
+    Args:
+        path (str): Path of the journal file.
+        commit_interval (float, optional): Seconds the writer waits to group appends. Defaults to 0.05.
+    """
+
+    def __init__(self, path: str, commit_interval: float = 0.05) -> None:
+        self.path = path
+        self.commit_interval = commit_interval
+
+        self._pending: List[str] = []
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._file = open(path, 'a', encoding='utf-8')
+
+        self._rotation = max((i for i, _ in self.rotated_paths()), default=0)
+        # entries in no snapshot yet, those written before a restart included
+        self.entries = self._count_entries()
+
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+
+    def rotated_paths(self) -> List[Tuple[int, str]]:
+        """Rotated journals still on disk, as (rotation, path), oldest first."""
+        directory = os.path.dirname(self.path) or '.'
+        prefix = os.path.basename(self.path) + '.'
+
+        resp = []
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                resp.append((int(name[len(prefix):]), os.path.join(directory, name)))
+
+        return sorted(resp)
+
+    def append(self, guild_id: int, user_id: int, data: dict) -> None:
+        line = json.dumps({'g': guild_id, 'u': user_id, 'd': data}, separators=(',', ':'))
+
+        with self._cond:
+            self._pending.append(line)
+            self.entries += 1
+            self._cond.notify()
+
+    def flush(self) -> None:
+        """Write and fsync every pending entry."""
+        with self._io_lock:
+            with self._cond:
+                lines, self._pending = self._pending, []
+
+            self._write(lines)
+
+    def rotate(self) -> int:
+        """
+        Move the journal aside, numbered, and start an empty one.
+
+        Entries of the rotated journal stay replayable until `discard_rotated`
+        is called with its number, once a snapshot containing them is durable.
+
+        Returns:
+            int: The number of the rotation.
+        """
+        with self._io_lock:
+            with self._cond:
+                lines, self._pending = self._pending, []
+                self.entries = 0
+
+            self._write(lines)
+            self._file.close()
+
+            self._rotation += 1
+            os.replace(self.path, f"{self.path}.{self._rotation}")
+
+            self._file = open(self.path, 'a', encoding='utf-8')
+            return self._rotation
+
+    def discard_rotated(self, rotation: int) -> None:
+        """Delete the journals rotated up to `rotation`, a snapshot taken at that rotation holds their entries."""
+        for i, path in self.rotated_paths():
+            if i <= rotation:
+                os.remove(path)
+
+    def replay(self) -> Iterator[Tuple[int, int, dict]]:
+        """Yield every entry of the rotated journals, oldest first, then of the current one."""
+        for path in [i for _, i in self.rotated_paths()] + [self.path]:
+            if not os.path.exists(path):
+                continue
+
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn write of the last line before a crash
+
+                    yield entry['g'], entry['u'], entry['d']
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+        self._writer.join()
+        self.flush()
+        self._file.close()
+
+    def _count_entries(self) -> int:
+        count = 0
+
+        for path in [i for _, i in self.rotated_paths()] + [self.path]:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    count += chunk.count(b'\n')
+
+        return count
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+
+                if self._closed and not self._pending:
+                    return
+
+            # let more appends join this batch
+            time.sleep(self.commit_interval)
+            self.flush()
+
+    def _write(self, lines: List[str]) -> None:
+        if not lines:
+            return
+
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+class JournaledStorage(StorageBackend):
+    """
+    Snapshot backend plus a trade journal.
+
+    Trades are appended to the journal, and every `compact_every` entries the
+    database is folded into a new snapshot by a background thread, which
+    rotates the journal, takes the snapshot and writes it. Startup loads the
+    snapshot and replays the journal on top of it.
+
+    Args:
+        snapshot (StorageBackend): Backend holding the snapshots.
+        journal_path (str): Path of the journal file.
+        compact_every (int, optional): Journal entries between snapshots. Defaults to 1000.
+    """
+
+    persists_trades = True
+
+    def __init__(self, snapshot: StorageBackend, journal_path: str, compact_every: int = 1000) -> None:
+        self.snapshot = snapshot
+        self.compact_every = compact_every
+
+        self.journal = TradeJournal(journal_path)
+        self._compactor: Optional[threading.Thread] = None
+
+    @property
+    def needs_snapshot(self) -> bool:
+        compacting = self._compactor is not None and self._compactor.is_alive()
+        return not compacting and self.journal.entries >= self.compact_every
+
+    def load_all(self) -> Dict[str, dict]:
+        data = self.snapshot.load_all()
+
+        for guild_id, user_id, user in self.journal.replay():
+            data.setdefault(hex(guild_id), {})[hex(user_id)] = user
+
+        return data
+
+    def load_guild(self, guild_id: int) -> Optional[Dict[str, dict]]:
+        return self.load_all().get(hex(guild_id))
+
+    def is_empty(self) -> bool:
+        return self.snapshot.is_empty() and next(self.journal.replay(), None) is None
+
+    def save_user(self, guild_id: int, user_id: int, data: dict) -> None:
+        self.journal.append(guild_id, user_id, data)
+
+    def save_all(self, data: Dict[str, dict]) -> None:
+        self._join_compactor()
+
+        rotation = self.journal.rotate()
+        self.snapshot.save_all(data)
+        self.journal.discard_rotated(rotation)
+
+    def compact(self, snapshot: Callable[[], Dict[str, dict]]) -> None:
+        """
+        Fold the journal into a snapshot without blocking the caller.
+
+        The journal is rotated before `snapshot` is called, so every trade
+        the snapshot may miss is in the new journal. A compaction still
+        running is waited for first, so snapshots are written in order and
+        each one only discards the journals it holds.
+        """
+        self._join_compactor()
+
+        def write_snapshot():
+            rotation = self.journal.rotate()
+            self.snapshot.save_all(snapshot())
+            self.journal.discard_rotated(rotation)
+
+        self._compactor = threading.Thread(target=write_snapshot, name="journal-compactor", daemon=True)
+        self._compactor.start()
+
+    def close(self) -> None:
+        self._join_compactor()
+
+        self.journal.close()
+        self.snapshot.close()
+
+    def _join_compactor(self) -> None:
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
@@ -1,5 +1,4 @@
-import copy
-from typing import Dict
+from typing import Callable, Dict
 
 
 DEFAULT_STATS = {
@@ -8,41 +7,51 @@ DEFAULT_STATS = {
 }
 
 class Position:
-    def __init__(self, symbol: str, data:dict = None) -> None:
-        self.data = copy.deepcopy(DEFAULT_STATS) if data is None else data
+    __slots__ = ('symbol', '_number_owned', '_valued_invested', 'dirty', 'on_change')
+
+    def __init__(self, symbol: str, data:dict = None, on_change: Callable[[], None] = None) -> None:
         self.symbol = symbol
+
+        if data is None:
+            data = DEFAULT_STATS
+
+        self._number_owned = data.get('number_owned', DEFAULT_STATS['number_owned'])
+        self._valued_invested = data.get('valued_invested', DEFAULT_STATS['valued_invested'])
+
+        self.on_change = on_change
+        self.dirty = data is DEFAULT_STATS
     
+    def mark_dirty(self) -> None:
+        self.dirty = True
+
+        if self.on_change is not None:
+            self.on_change()
+
     @property
     def number_owned(self) -> float:
-        if 'number_owned' not in self.data:
-            self.data['number_owned'] = DEFAULT_STATS['number_owned']
-         
-        return self.data['number_owned']
+        return self._number_owned
     
     @number_owned.setter
     def number_owned(self, value: int) -> None:
-        self.data['number_owned'] = value
+        self._number_owned = value
+        self.mark_dirty()
 
 
     @property
     def valued_invested(self) -> float:
-        if 'valued_invested' not in self.data:
-            self.data['valued_invested'] = DEFAULT_STATS['valued_invested']
-         
-        return self.data['valued_invested']
+        return self._valued_invested
     
     @valued_invested.setter
     def valued_invested(self, value: int) -> None:
-        self.data['valued_invested'] = value
+        self._valued_invested = value
+        self.mark_dirty()
     
     
     def serialize(self) -> Dict[str, float]:
-        resp = {}
-
-        for i in self.data:
-            resp[i] = self.data[i]
-            
-        return resp
+        return {
+            'number_owned': self._number_owned,
+            'valued_invested': self._valued_invested,
+        }
     
     def __repr__(self) -> str:
-        return self.data.__repr__()
\ No newline at end of file
+        return self.serialize().__repr__()
@@ -0,0 +1,129 @@
+import glob
+import os
+import re
+from typing import Dict, Iterable, List, Tuple
+
+from .storage import create_storage
+
+# tag a partition adds to the name of its files, e.g. data.shards-0-1-of-4.json
+PARTITION_TAG = re.compile(r'\.shards-\d+(?:-\d+)*-of-\d+$')
+
+
+def shard_for(guild_id: int, shard_count: int) -> int:
+    """Shard Discord sends the events of a guild to."""
+    return (guild_id >> 22) % shard_count
+
+
+class ShardPartition:
+    """
+    The guilds owned by a process: those of the shards it runs.
+
+    A process owning a subset of the shards keeps its data in files of its
+    own, tagged with its shards, so it only loads and saves its partition.
+
+    Args:
+        shard_count (int, optional): Total number of shards. Defaults to 1.
+        shard_ids (Iterable[int], optional): Shards run by this process. Defaults to all of them.
+    """
+
+    def __init__(self, shard_count: int = 1, shard_ids: Iterable[int] = None) -> None:
+        self.shard_count = shard_count
+        self.shard_ids = sorted(set(range(shard_count) if shard_ids is None else shard_ids))
+
+        if not self.shard_ids or not all(0 <= i < shard_count for i in self.shard_ids):
+            raise ValueError(f"Shard ids {self.shard_ids} are not within {shard_count} shards")
+
+        self._owned = frozenset(self.shard_ids)
+
+    @property
+    def owns_all(self) -> bool:
+        return len(self.shard_ids) == self.shard_count
+
+    @property
+    def name(self) -> str:
+        return f"shards-{'-'.join(map(str, self.shard_ids))}-of-{self.shard_count}"
+
+    def path(self, path: str) -> str:
+        """Path of this partition's copy of a data file, the file itself when every shard is owned."""
+        if self.owns_all:
+            return path
+
+        root, ext = os.path.splitext(path)
+        return f"{root}.{self.name}{ext}"
+
+    def filter(self, data: Dict[str, dict]) -> Dict[str, dict]:
+        """Keep the owned guilds of serialized data, keyed by guild id in hex."""
+        return {i: j for i, j in data.items() if int(i, 16) in self}
+
+    def __contains__(self, guild_id: int) -> bool:
+        return self.owns_all or shard_for(guild_id, self.shard_count) in self._owned
+
+    def __repr__(self) -> str:
+        return f"ShardPartition({self.name})"
+
+
+def file_partition(path: str) -> ShardPartition:
+    """Partition whose data a file holds, from the tag in its name, every shard for an untagged file."""
+    tag = PARTITION_TAG.search(os.path.splitext(path)[0]) or PARTITION_TAG.search(path)
+    if tag is None:
+        return ShardPartition()
+
+    # e.g. '.shards-0-1-of-4'
+    *shard_ids, _, shard_count = tag.group()[len('.shards-'):].split('-')
+    return ShardPartition(int(shard_count), map(int, shard_ids))
+
+def storage_path(backend: str, path: str) -> str:
+    """What a backend keeps on disk for a data file: the file itself, or a folder for the guilds backend."""
+    return os.path.splitext(path)[0] if backend == 'guilds' else path
+
+def exists(backend: str, path: str) -> bool:
+    return os.path.exists(storage_path(backend, path))
+
+def partition_files(backend: str, path: str, exclude: str = None) -> List[str]:
+    """
+    Every existing partition of a data file, the unpartitioned one included, oldest first.
+
+    Args:
+        backend (str): The storage backend.
+        path (str): The unpartitioned data file, e.g. './data.json'.
+        exclude (str, optional): A path to leave out, usually the one being created.
+
+    Returns:
+        List[str]: The paths, ordered by modification time.
+    """
+    root, ext = os.path.splitext(path)
+
+    resp = {path} if exists(backend, path) else set()
+    for i in glob.glob(f"{glob.escape(root)}.shards-*"):
+        tag = PARTITION_TAG.search(os.path.splitext(i)[0] if i.endswith(ext) else i)
+        if tag is not None and exists(backend, f"{root}{tag.group()}{ext}"):
+            resp.add(f"{root}{tag.group()}{ext}")
+
+    resp.discard(exclude)
+    return sorted(resp, key=lambda i: os.path.getmtime(storage_path(backend, i)))
+
+def collect_guilds(sources: List[Tuple[str, str]], partition: ShardPartition) -> Dict[str, dict]:
+    """
+    Gather the guilds of a partition from other layouts of the database.
+
+    Used on the first start with a new shard layout or backend. The guilds of
+    the later sources win, so sources should be ordered oldest first.
+
+    Args:
+        sources (List[Tuple[str, str]]): (backend, path) of every source.
+        partition (ShardPartition): The partition whose guilds are collected.
+
+    Returns:
+        Dict[str, dict]: Serialized guilds of the partition.
+    """
+    resp = {}
+
+    for backend, path in sources:
+        storage = create_storage(backend, path)
+        try:
+            resp.update(partition.filter(storage.load_all()))
+        finally:
+            storage.close()
+
+    return resp
+
@@ -0,0 +1,433 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+
+from utils import default_data_file
+
+"""
+Every backend speaks the serialized format of the database:
+
+{
+    "<guild id in hex>": {
+        "<user id in hex>": {
+            "cash": 3535.0,
+            "stocks": {
+                "AAPL": {"number_owned": 13.75, "valued_invested": 125}
+            }
+        }
+    }
+}
+"""
+
+
+class ConcurrentUpdate(Exception):
+    """A user changed in the store since it was read, e.g. by another process."""
+
+
+class StorageBackend(ABC):
+    # if True, guilds are loaded on first access instead of at startup
+    lazy = False
+    # if True, the database should have compact() take a full snapshot
+    needs_snapshot = False
+    # if True, save_user makes every trade durable, full snapshots are only needed when needs_snapshot says so
+    persists_trades = False
+    # if True, save_guilds can persist a subset of the guilds, see PartialSaveStorage
+    partial_saves = False
+    # if True, other processes write the same store, users are saved with save_user_if
+    shared = False
+
+    @abstractmethod
+    def load_all(self) -> Dict[str, dict]:
+        """Load every guild."""
+
+    @abstractmethod
+    def load_guild(self, guild_id: int) -> Optional[Dict[str, dict]]:
+        """Load the users of a guild, None if the guild is unknown."""
+
+    @abstractmethod
+    def save_all(self, data: Dict[str, dict]) -> None:
+        """Persist every guild."""
+
+    @abstractmethod
+    def save_user(self, guild_id: int, user_id: int, data: dict) -> None:
+        """Persist a single user, called after every trade."""
+
+    def is_empty(self) -> bool:
+        """Whether no guild is stored yet."""
+        return not self.load_all()
+
+    def compact(self, snapshot: Callable[[], Dict[str, dict]]) -> None:
+        """Persist the full snapshot `snapshot` returns, backends may take and write it in the background."""
+        self.save_all(snapshot())
+
+    def close(self) -> None:
+        pass
+
+
+class PartialSaveStorage(StorageBackend):
+    """Backend able to persist a subset of the guilds, so the autosave only writes the changed ones."""
+    partial_saves = True
+
+    @abstractmethod
+    def save_guilds(self, data: Dict[str, dict]) -> None:
+        """Persist only the given guilds, leaving the others as stored."""
+
+
+class JsonStorage(StorageBackend):
+    """The whole database in a single JSON file, written on save_all only."""
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self._lock = threading.Lock()
+
+        if file_path is not None:
+            default_data_file(file_path)
+
+    def load_all(self) -> Dict[str, dict]:
+        if self.file_path is None:
+            return {}
+
+        with open(self.file_path, 'r') as f:
+            return json.load(f)
+
+    def load_guild(self, guild_id: int) -> Optional[Dict[str, dict]]:
+        return self.load_all().get(hex(guild_id))
+
+    def is_empty(self) -> bool:
+        # an empty database is saved as "{}", no need to parse the file
+        return self.file_path is None or os.path.getsize(self.file_path) <= 2
+
+    def save_all(self, data: Dict[str, dict]) -> None:
+        if self.file_path is None:
+            return
+
+        with self._lock:
+            _write_json(self.file_path, data, indent=4)
+
+    def save_user(self, guild_id: int, user_id: int, data: dict) -> None:
+        # the whole file is written by the autosave and at exit
+        pass
+
+
+class GuildFilesStorage(PartialSaveStorage):
+    """
+    One JSON file per guild, so a save only rewrites the guilds that changed.
+
+    Args:
+        directory (str): Folder holding the guild files.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def is_empty(self) -> bool:
+        return not any(i.endswith('.json') for i in os.listdir(self.directory))
+
+    def load_all(self) -> Dict[str, dict]:
+        resp = {}
+
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+
+            with open(os.path.join(self.directory, name), 'r') as f:
+                resp[name[:-5]] = json.load(f)
+
+        return resp
+
+    def load_guild(self, guild_id: int) -> Optional[Dict[str, dict]]:
+        path = self._path(hex(guild_id))
+        if not os.path.isfile(path):
+            return None
+
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def save_all(self, data: Dict[str, dict]) -> None:
+        self.save_guilds(data)
+
+    def save_guilds(self, data: Dict[str, dict]) -> None:
+        with self._lock:
+            for guild_key, users in data.items():
+                _write_json(self._path(guild_key), users)
+
+    def save_user(self, guild_id: int, user_id: int, data: dict) -> None:
+        # guild files are written by the autosave
+        pass
+
+    def _path(self, guild_key: str) -> str:
+        return os.path.join(self.directory, f"{guild_key}.json")
+
+
+class SqliteStorage(PartialSaveStorage):
+    """
+    SQLite database in WAL mode with one row per guild, user and position.
+
+    Every trade is an upsert of a single user inside a transaction, and guilds
+    are loaded on demand through indexed queries.
+
+    Args:
+        file_path (str): Path of the SQLite database.
+    """
+    lazy = True
+    busy_timeout = 5.0  # seconds
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS guilds (
+            guild_id INTEGER PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            guild_id INTEGER NOT NULL REFERENCES guilds(guild_id),
+            user_id INTEGER NOT NULL,
+            cash REAL NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS positions (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            number_owned REAL NOT NULL,
+            valued_invested REAL NOT NULL,
+            PRIMARY KEY (guild_id, user_id, symbol),
+            FOREIGN KEY (guild_id, user_id) REFERENCES users(guild_id, user_id)
+        );
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+
+        self._conn = sqlite3.connect(file_path, timeout=self.busy_timeout, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+
+        # wait for the write lock of another process rather than failing at once
+        self._conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+        # databases created before users were versioned
+        columns = [i[1] for i in self._conn.execute("PRAGMA table_info(users)")]
+        if 'version' not in columns:
+            self._conn.execute("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM guilds LIMIT 1").fetchone() is None
+
+    def load_all(self) -> Dict[str, dict]:
+        with self._lock:
+            guild_ids = [i[0] for i in self._conn.execute("SELECT guild_id FROM guilds")]
+
+        return {hex(i): self.load_guild(i) for i in guild_ids}
+
+    def load_guild(self, guild_id: int) -> Optional[Dict[str, dict]]:
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM guilds WHERE guild_id = ?", (guild_id,)).fetchone() is None:
+                return None
+
+            users = self._conn.execute(
+                "SELECT user_id, cash, version FROM users WHERE guild_id = ?", (guild_id,)
+            ).fetchall()
+            positions = self._conn.execute(
+                "SELECT user_id, symbol, number_owned, valued_invested FROM positions WHERE guild_id = ?", (guild_id,)
+            ).fetchall()
+
+        resp = {hex(user_id): {'cash': cash, 'version': version, 'stocks': {}} for user_id, cash, version in users}
+        for user_id, symbol, number_owned, valued_invested in positions:
+            resp[hex(user_id)]['stocks'][symbol] = {'number_owned': number_owned, 'valued_invested': valued_invested}
+
+        return resp
+
+    def load_user(self, guild_id: int, user_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cash, version FROM users WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+            ).fetchone()
+            if row is None:
+                return None
+
+            positions = self._conn.execute(
+                "SELECT symbol, number_owned, valued_invested FROM positions WHERE guild_id = ? AND user_id = ?",
+                (guild_id, user_id)
+            ).fetchall()
+
+        return {
+            'cash': row[0],
+            'version': row[1],
+            'stocks': {i: {'number_owned': j, 'valued_invested': k} for i, j, k in positions},
+        }
+
+    def save_all(self, data: Dict[str, dict]) -> None:
+        with self._lock, self._transaction():
+            for guild_hex, users in data.items():
+                guild_id = int(guild_hex, 16)
+                self._conn.execute("INSERT OR IGNORE INTO guilds (guild_id) VALUES (?)", (guild_id,))
+
+                for user_hex, user in users.items():
+                    self._upsert_user(guild_id, int(user_hex, 16), user)
+
+    def save_guilds(self, data: Dict[str, dict]) -> None:
+        self.save_all(data)
+
+    def save_user(self, guild_id: int, user_id: int, data: dict) -> None:
+        with self._lock, self._transaction():
+            self._conn.execute("INSERT OR IGNORE INTO guilds (guild_id) VALUES (?)", (guild_id,))
+            self._upsert_user(guild_id, user_id, data)
+
+    def _upsert_user(self, guild_id: int, user_id: int, data: dict) -> None:
+        self._conn.execute(
+            "INSERT INTO users (guild_id, user_id, cash, version) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT (guild_id, user_id) DO UPDATE SET cash = excluded.cash, version = version + 1",
+            (guild_id, user_id, data['cash'])
+        )
+        self._upsert_positions(guild_id, user_id, data)
+
+    def _upsert_positions(self, guild_id: int, user_id: int, data: dict) -> None:
+        stocks = data['stocks']
+        self._conn.executemany(
+            "INSERT INTO positions (guild_id, user_id, symbol, number_owned, valued_invested) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (guild_id, user_id, symbol) DO UPDATE SET "
+            "number_owned = excluded.number_owned, valued_invested = excluded.valued_invested",
+            [
+                (guild_id, user_id, symbol, i.get('number_owned', 0), i.get('valued_invested', 0))
+                for symbol, i in stocks.items()
+            ]
+        )
+
+        # positions sold out since the last save
+        placeholders = ','.join('?' * len(stocks))
+        self._conn.execute(
+            "DELETE FROM positions WHERE guild_id = ? AND user_id = ?" +
+            (f" AND symbol NOT IN ({placeholders})" if stocks else ""),
+            (guild_id, user_id, *stocks)
+        )
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SharedSqliteStorage(SqliteStorage):
+    """
+    SQLite database written by several bot processes at once.
+
+    Every user row has a version, bumped on each save. A process saves a
+    user only if the version is still the one it read, otherwise it gets a
+    ConcurrentUpdate and retries on the fresh row (optimistic concurrency).
+    The database never saves it in bulk, a snapshot would overwrite the
+    trades of the other processes.
+
+    Args:
+        file_path (str): Path of the SQLite database, shared by every process.
+    """
+    shared = True
+
+    def user_versions(self, guild_id: int) -> Dict[int, int]:
+        """Current version of every stored user of a guild."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT user_id, version FROM users WHERE guild_id = ?", (guild_id,)))
+
+    def user_version(self, guild_id: int, user_id: int) -> int:
+        """Current version of a user, 0 if it was never stored."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM users WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+            ).fetchone()
+
+        return 0 if row is None else row[0]
+
+    def save_user_if(self, guild_id: int, user_id: int, data: dict, version: int) -> int:
+        """
+        Persist a user if it is still at the version it was read at.
+
+        Args:
+            guild_id (int): The guild of the user.
+            user_id (int): The user id.
+            data (dict): The serialized user.
+            version (int): The version the user was read at, 0 for a user never stored.
+
+        Returns:
+            int: The new version of the user.
+
+        Raises:
+            ConcurrentUpdate: If the user was saved by someone else since.
+        """
+        with self._lock, self._transaction():
+            if version == 0:
+                self._conn.execute("INSERT OR IGNORE INTO guilds (guild_id) VALUES (?)", (guild_id,))
+                updated = self._conn.execute(
+                    "INSERT OR IGNORE INTO users (guild_id, user_id, cash, version) VALUES (?, ?, ?, 1)",
+                    (guild_id, user_id, data['cash'])
+                ).rowcount
+            else:
+                updated = self._conn.execute(
+                    "UPDATE users SET cash = ?, version = version + 1 WHERE guild_id = ? AND user_id = ? AND version = ?",
+                    (data['cash'], guild_id, user_id, version)
+                ).rowcount
+
+            if not updated:
+                raise ConcurrentUpdate(f"User {user_id} of guild {guild_id} changed since version {version}")
+
+            self._upsert_positions(guild_id, user_id, data)
+
+        return version + 1
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def _write_json(path: str, data: dict, **kwargs) -> None:
+    """Write a JSON file atomically, readers see either the old or the new content."""
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+def create_storage(backend: str, path: str) -> StorageBackend:
+    """
+    Create a storage backend by name.
+
+    Args:
+        backend (str): 'json', 'journal', 'guilds', 'sqlite' or 'shared'.
+        path (str): Path of the database file, the journal and the guilds folder are kept next to it.
+
+    Returns:
+        StorageBackend: The storage backend.
+    """
+    if backend == 'json':
+        return JsonStorage(path)
+    if backend == 'journal':
+        from .journal import JournaledStorage
+        return JournaledStorage(JsonStorage(path), os.path.splitext(path)[0] + '.journal')
+    if backend == 'guilds':
+        return GuildFilesStorage(os.path.splitext(path)[0])
+    if backend == 'sqlite':
+        return SqliteStorage(path)
+    if backend == 'shared':
+        return SharedSqliteStorage(path)
+
+    raise ValueError(f"Unknown storage backend {backend}")
@@ -1,6 +1,5 @@
-import copy
 import json
-from typing import Dict
+from typing import Callable, Dict
 
 from database.position import Position
 
@@ -9,52 +8,84 @@ DEFAULT_STATS = {
     "stocks" : {}
 }
 
+class PositionMap(dict):
+    """Positions of a user by symbol, adding or removing one marks the user as changed."""
+    __slots__ = ('on_change',)
+
+    def __init__(self, on_change: Callable[[], None]) -> None:
+        super().__init__()
+        self.on_change = on_change
+
+    def __setitem__(self, symbol: str, position: Position) -> None:
+        position.on_change = self.on_change
+        super().__setitem__(symbol, position)
+        self.on_change()
+
+    def __delitem__(self, symbol: str) -> None:
+        super().__delitem__(symbol)
+        self.on_change()
+
+    def pop(self, symbol: str, *args) -> Position:
+        resp = super().pop(symbol, *args)
+        self.on_change()
+        return resp
+
+
 class User:
-    def __init__(self, user_id: str, data: dict=None) -> None:
+    __slots__ = ('user_id', '_cash', 'stocks', 'version', 'dirty', 'on_change')
+
+    def __init__(self, user_id: int, data: dict=None, on_change: Callable[[], None] = None) -> None:
         self.user_id = user_id
 
-        self.data = copy.deepcopy(DEFAULT_STATS) if data is None else self._load_data(data)
+        self.on_change = on_change
+        self.dirty = data is None
 
-    def _load_data(self, raw_data: dict) -> Dict[str, Position]:
-        resp = {}
-        
-        resp['cash'] = raw_data['cash']
-        resp['stocks'] = {}
-        
-        for symbol, data in raw_data['stocks'].items():
-            resp['stocks'][symbol] = Position(symbol, data)
-    
-        return resp
+        if data is None:
+            data = DEFAULT_STATS
+
+        self._cash = data.get('cash', DEFAULT_STATS['cash'])
+        self.version = data.get('version', 0)  # version of the stored row, in a shared database
+
+        # positions share one bound method instead of creating one each
+        mark_dirty = self.mark_dirty
+        self.stocks: Dict[str, Position] = PositionMap(mark_dirty)
+
+        for symbol, position in data.get('stocks', {}).items():
+            dict.__setitem__(self.stocks, symbol, Position(symbol, position, mark_dirty))
+
+    def mark_dirty(self) -> None:
+        self.dirty = True
+
+        if self.on_change is not None:
+            self.on_change()
+
+    def clear_dirty(self) -> None:
+        self.dirty = False
+
+        for position in self.stocks.values():
+            position.dirty = False
 
     @property
     def cash(self) -> int:
-        if 'cash' not in self.data:
-            self.data['cash'] = DEFAULT_STATS['cash']
-        
-        return self.data['cash']
+        return self._cash
         
     @cash.setter
     def cash(self, value: int) -> None:
-        self.data['cash'] = value
-    
-    @property
-    def stocks(self) -> Dict[str, Position]:
-        if 'stocks' not in self.data:
-            self.data['stocks'] = DEFAULT_STATS['stocks']
-         
-        return self.data['stocks']
+        self._cash = value
+        self.mark_dirty()
     
     
     def serialize(self) -> Dict[str, dict]:
         resp = {}
         
-        resp['cash'] = self.cash
+        resp['cash'] = self._cash
         resp['stocks'] = {}
 
-        for i in self.stocks:
-            resp['stocks'][i] = self.stocks[i].serialize()
+        # a copy, a background snapshot may serialize the user while a trade adds a position
+        for i, position in list(self.stocks.items()):
+            resp['stocks'][i] = position.serialize()
         
         return resp
     
     def __repr__(self) -> str:
-        return self.data.__repr__()
+        return self.serialize().__repr__()
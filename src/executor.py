@@ -0,0 +1,39 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+IO_WORKERS = 16
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+
+def io_pool() -> ThreadPoolExecutor:
+    """Thread pool for blocking network calls (yfinance, requests)."""
+    global _io_pool
+
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+
+    return _io_pool
+
+async def run_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking function on the IO thread pool without blocking the event loop.
+
+    Args:
+        func (Callable): The blocking function.
+        *args, **kwargs: Arguments forwarded to the function.
+
+    Returns:
+        Any: The value returned by the function.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_pool(), partial(func, *args, **kwargs))
+
+def shutdown() -> None:
+    global _io_pool
+
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
@@ -0,0 +1,177 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+import bisect
+from collections import defaultdict
+
+from valuation import Holdings
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, List, Optional, Set, Tuple
+    from database.user import User
+
+
+class Leaderboard:
+    """
+    Net worth ranking of a guild, kept sorted as trades and prices come in.
+
+    Entries live in a list sorted by (-net worth, user id), so a rank is a
+    binary search and a page is a slice. Re-ranking a user removes and
+    inserts an entry, which shifts the entries after it: O(n), but a single
+    memmove that takes microseconds even for the largest guilds. The holdings
+    of the guild are kept next to it and updated by every trade: a trade
+    re-values the row of the trader, and a price tick only the column of the
+    symbol that moved, shifting the net worth of its holders by the change.
+
+    Args:
+        guild_id (int): The guild id.
+        prices (Dict[str, float]): Price in USD of each symbol, shared with the other leaderboards.
+    """
+
+    def __init__(self, guild_id: int, prices: Dict[str, float]) -> None:
+        self.guild_id = guild_id
+        self.prices = prices
+
+        self.users: Dict[int, User] = {}
+        self.holdings = Holdings()
+        self.worth: Dict[int, float] = {}
+
+        self._sorted: List[Tuple[float, int]] = []
+
+    def build(self, users: Iterable[User]) -> None:
+        """Rank every user of the guild at once."""
+        holdings = self.holdings = Holdings(users)
+        valuation = holdings.valuate(self.prices)
+
+        self.users = {i.user_id: i for i in holdings.users}
+        self.worth = {i.user_id: float(worth) for i, worth in zip(holdings.users, valuation.net_worth)}
+        self._sorted = sorted((-worth, user_id) for user_id, worth in self.worth.items())
+
+    def update_user(self, user: User) -> None:
+        """Re-rank a user after a trade."""
+        self.users[user.user_id] = user
+        row = self.holdings.update(user)
+        self._rerank(user.user_id, self.holdings.net_worth(row, self.prices))
+
+    def add_users(self, users: Iterable[User]) -> None:
+        """Rank the users that joined the guild since the leaderboard was built."""
+        for user in users:
+            if user.user_id not in self.users:
+                self.update_user(user)
+
+    def reprice(self, changes: Dict[str, Tuple[float, float]]) -> None:
+        """
+        Re-rank the holders of symbols whose price changed.
+
+        Args:
+            changes (Dict[str, Tuple[float, float]]): Old and new price in USD of each symbol that moved.
+        """
+        deltas: Dict[int, float] = defaultdict(float)  # row -> change of net worth
+        for symbol, (old, new) in changes.items():
+            rows, quantities = self.holdings.holders(symbol)
+            for row, delta in zip(rows.tolist(), (quantities * (new - old)).tolist()):
+                deltas[row] += delta
+
+        users = self.holdings.users
+        for row, delta in deltas.items():
+            user_id = users[row].user_id
+            self._rerank(user_id, self.worth[user_id] + delta)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank of a user, None if the user is not ranked."""
+        worth = self.worth.get(user_id)
+        if worth is None:
+            return None
+
+        return bisect.bisect_left(self._sorted, (-worth, user_id)) + 1
+
+    def top(self, k: int) -> List[Tuple[int, float]]:
+        return self.page(0, k)
+
+    def page(self, page: int, per_page: int) -> List[Tuple[int, float]]:
+        """Users of a page with their net worth, richest first."""
+        start = page * per_page
+        return [(user_id, -worth) for worth, user_id in self._sorted[start:start + per_page]]
+
+    def _rerank(self, user_id: int, worth: float) -> None:
+        old = self.worth.get(user_id)
+        if old is not None:
+            del self._sorted[bisect.bisect_left(self._sorted, (-old, user_id))]
+
+        self.worth[user_id] = worth
+        bisect.insort(self._sorted, (-worth, user_id))
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+
+class Leaderboards:
+    """
+    Leaderboards of every guild, built on first use and then kept up to date.
+
+    Trades re-rank the trader and price ticks re-rank the holders of the
+    symbols that moved, so reading a ranking never re-prices the guild.
+    """
+
+    def __init__(self) -> None:
+        self.prices: Dict[str, float] = {}
+        self.boards: Dict[int, Leaderboard] = {}
+
+    def get(self, guild_id: int) -> Optional[Leaderboard]:
+        return self.boards.get(guild_id)
+
+    def build(self, guild_id: int, users: Iterable[User], prices: Dict[str, float]) -> Leaderboard:
+        """
+        Build the leaderboard of a guild.
+
+        Args:
+            guild_id (int): The guild id.
+            users (Iterable[User]): Every user of the guild.
+            prices (Dict[str, float]): Price in USD of the symbols held in the guild.
+
+        Returns:
+            Leaderboard: The leaderboard of the guild.
+        """
+        self.on_prices(prices)
+
+        board = Leaderboard(guild_id, self.prices)
+        board.build(users)
+
+        self.boards[guild_id] = board
+        return board
+
+    def missing_prices(self, users: Iterable[User]) -> Set[str]:
+        return {symbol for user in users for symbol in user.stocks if symbol not in self.prices}
+
+    def on_trade(self, guild_id: int, user: User, prices: Dict[str, float] = None) -> None:
+        """
+        Re-rank a user after a trade.
+
+        Args:
+            guild_id (int): The guild of the user.
+            user (User): The user that traded.
+            prices (Dict[str, float], optional): Prices in USD seen by the trade, applied as a price tick.
+        """
+        if prices:
+            self.on_prices(prices)
+
+        board = self.boards.get(guild_id)
+        if board is not None:
+            board.update_user(user)
+
+    def on_prices(self, prices: Dict[str, float]) -> None:
+        """Apply a price tick, re-ranking only the holders of symbols that moved."""
+        # symbols without a price so far were valued at 0
+        changes = {
+            symbol: (self.prices.get(symbol, 0.0), price)
+            for symbol, price in prices.items() if self.prices.get(symbol) != price
+        }
+        if not changes:
+            return
+
+        self.prices.update(prices)
+        for board in self.boards.values():
+            board.reprice(changes)
+
+
+leaderboards = Leaderboards()
@@ -1,31 +1,143 @@
+import asyncio
 import atexit
 import math
-from typing import Optional
+import os
+import time
+from typing import Dict, Literal, Optional
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ui import Button, View
 
-from creds import *
-from apis.yfinance_api import *
-from utils import only_users_allowed, calculate_portfolios_netwoth
+import creds
+from apis import market_data
+from apis.fx import fx_table
+from apis.logo_resolver import logo_resolver
+from apis.symbol_index import SYMBOLS_PATH, symbol_index
+from apis.yfinance_api import check_stock_validaty, get_stock_data, get_stocks_values
+from executor import run_io
+import executor
+from utils import only_users_allowed
+from valuation import valuate_user
 from database.database import InMemoryDatabase
-from database.position import Position
-
-from view import *
+from database.sharding import ShardPartition, collect_guilds, exists, partition_files
+from database.storage import create_storage
+from leaderboard import leaderboards
+from refresher import PriceRefresher
+from trading import TradeEngine, TradeError
+from orders import OrderBook
+from portfolio import SORT_MODES, PortfolioSnapshot
+from rendering import renderer
+from metrics import metrics
+from apis.quote_cache import quote_cache
+from chart_cache import chart_cache
+
+from view import (
+    create_order_embed, create_orders_embed, create_profile_embed, create_ranking_embed, create_stock_embed
+)
+
+# with SHARD_COUNT set, this process runs the SHARD_IDS shards (all by default) and owns only their guilds
+SHARD_COUNT = getattr(creds, 'SHARD_COUNT', None)
+SHARD_IDS = getattr(creds, 'SHARD_IDS', None)
+
+partition = ShardPartition(SHARD_COUNT or 1, SHARD_IDS)
+if SHARD_COUNT:
+    client = commands.AutoShardedBot(
+        command_prefix='!', intents=discord.Intents.all(), shard_count=SHARD_COUNT, shard_ids=partition.shard_ids
+    )
+else:
+    client = commands.Bot(command_prefix='!', intents=discord.Intents.all())
 
-client = commands.Bot(command_prefix='!', intents=discord.Intents.all())
 db: InMemoryDatabase = None
+price_refresher: PriceRefresher = None
+trade_engine: TradeEngine = None
+order_book: OrderBook = None
+warm_up_task: asyncio.Task = None
 
 @client.event
 async def on_ready():
+    global warm_up_task
+
+    if warm_up_task is None:
+        warm_up_task = asyncio.create_task(warm_up())
+
+    if not refresh_fx_rates.is_running():
+        refresh_fx_rates.start()
+
+    price_refresher.start()
+
+    if not refresh_symbol_index.is_running():
+        refresh_symbol_index.start()
+
+    if not autosave.is_running():
+        autosave.start()
+
+    metrics_port = getattr(creds, 'METRICS_PORT', 9108)
+    if metrics_port and not metrics.serving:
+        try:
+            await metrics.start_server('127.0.0.1', metrics_port)
+        except OSError as e:
+            print(f"Metrics endpoint failed to start: {e}")
+
     print("Bot online")
 
 
+async def warm_up():
+    """Load the heavy libraries in the background once online, so the first commands don't wait for them."""
+    start = time.perf_counter()
+
+    try:
+        await asyncio.gather(renderer.warm_up(), run_io(market_data.provider.warm_up))
+    except Exception as e:
+        print(f"Warm up failed: {e}")
+
+    print(f"Warmed up in {time.perf_counter() - start:.2f}s")
+
+
+async def on_price_tick(prices: Dict[str, float]):
+    leaderboards.on_prices(prices)
+    await order_book.on_prices(prices)
+
+
+@client.event
+async def on_interaction(interaction: discord.Interaction):
+    if interaction.type == discord.InteractionType.application_command:
+        metrics.command_started(interaction.id)
+
+
+@client.event
+async def on_app_command_completion(interaction: discord.Interaction, command: app_commands.Command):
+    metrics.command_completed(interaction.id, command.qualified_name)
+
+
+@tasks.loop(seconds=fx_table.refresh_interval)
+async def refresh_fx_rates():
+    try:
+        await run_io(fx_table.refresh)
+    except Exception as e:
+        print(f"FX refresh failed: {e}")
+
+
+@tasks.loop(seconds=30)
+async def autosave():
+    try:
+        await db.autosave()
+    except Exception as e:
+        print(f"Autosave failed: {e}")
+
+
+@tasks.loop(hours=24)
+async def refresh_symbol_index():
+    try:
+        await run_io(symbol_index.refresh, SYMBOLS_PATH)
+    except Exception as e:
+        print(f"Symbol index refresh failed: {e}")
+
+
 @client.command()
 @only_users_allowed()
 async def sync(ctx: commands.Context):
-    if ctx.author.id != OWNER_ID:
+    if ctx.author.id != creds.OWNER_ID:
         await ctx.send("Not owner")
         return
 
@@ -38,6 +150,17 @@ async def sync(ctx: commands.Context):
         print(e)
 
 
+@client.command()
+@only_users_allowed()
+async def stats(ctx: commands.Context):
+    if ctx.author.id != creds.OWNER_ID:
+        await ctx.send("Not owner")
+        return
+
+    summary = metrics.summary()
+    await ctx.send(f"```\n{summary[:1900]}\n```")
+
+
 @client.tree.command(name="profile")
 @only_users_allowed()
 @app_commands.describe(member="user to see the profile")
@@ -49,17 +172,18 @@ async def profile(iter: discord.Interaction, member: Optional[discord.Member] =
     # pull relevant data    
     if member is None:
         user = iter.user
-        user_db_info = db.get_user(iter.guild.id, user.id)
+        user_db_info = await db.run(db.get_user, iter.guild.id, user.id)
     else:
         user = member
-        user_db_info = db.get_user(iter.guild.id, member.id)
+        user_db_info = await db.run(db.get_user, iter.guild.id, member.id)
 
 
     # calc values
-    stock_values = get_stock_position(user_db_info.stocks)
+    prices = await run_io(get_stocks_values, list(user_db_info.stocks))
+    valuation = valuate_user(user_db_info, prices)
     
     # construct message
-    embed, file = create_profile_embed(user, user_db_info, stock_values)
+    embed, file = await create_profile_embed(user, valuation)
     
     await iter.followup.send(embed=embed, file=file)
     
@@ -79,10 +203,10 @@ async def stock(iter: discord.Interaction, name: str, range: str='6mo'):
     await iter.response.defer()
     
     # Get historical prices for the last 6 months
-    stock_data = get_stock_data(name, range)
+    stock_data = await run_io(get_stock_data, name, range)
     
     # Create and send the embedded message with the graph image attached
-    embed, file = create_stock_embed(stock_data)
+    embed, file = await create_stock_embed(stock_data)
     
     await iter.followup.send(embed=embed, file=file)
 
@@ -97,51 +221,61 @@ async def view_portfolio(iter: discord.Interaction, member: Optional[discord.Mem
     # get relevant data
     if member is None:
         user = iter.user
-        user_db_info = db.get_user(iter.guild.id, user.id)
+        user_db_info = await db.run(db.get_user, iter.guild.id, user.id)
     else:
         user = member
-        user_db_info = db.get_user(iter.guild.id, member.id)
+        user_db_info = await db.run(db.get_user, iter.guild.id, member.id)
 
-    user_stocks = list(user_db_info.stocks.values())
-    stock_values = get_stock_position(user_db_info.stocks)
+    prices = await run_io(get_stocks_values, list(user_db_info.stocks))
+    snapshot = PortfolioSnapshot(user, user_db_info, prices)
 
     # build message
-    position_per_page = 5
-    total_pages = math.ceil(len(user_stocks) / position_per_page)
     current_page = 0
-
-    def generate_embed(page: int, per_page: int = position_per_page):
-        return create_portfolio_embed(user, user_stocks, stock_values, page, per_page)
-
-    async def update_message(page):
-        await iter.edit_original_response(embed=generate_embed(page), view=view)
+    current_sort = 'value'
 
     class PortfolioView(View):
         def __init__(self):
-            super().__init__()
+            super().__init__(timeout=600)
+
+        async def show(self, interaction: discord.Interaction):
+            await interaction.response.edit_message(embed=snapshot.page(current_page, current_sort), view=self)
 
         @discord.ui.button(label='Previous', style=discord.ButtonStyle.secondary)
         async def previous_page(self, interaction: discord.Interaction, button: Button):
             nonlocal current_page
-            if current_page > 0:
-                current_page -= 1
-                await interaction.response.defer()  # Acknowledge the interaction
-                await update_message(current_page)
-            else:
-                await interaction.response.defer()  # Acknowledge the interaction
+            current_page = max(current_page - 1, 0)
+            await self.show(interaction)
 
         @discord.ui.button(label='Next', style=discord.ButtonStyle.secondary)
         async def next_page(self, interaction: discord.Interaction, button: Button):
             nonlocal current_page
-            if current_page < total_pages - 1:
-                current_page += 1
-                await interaction.response.defer()  # Acknowledge the interaction
-                await update_message(current_page)
-            else:
-                await interaction.response.defer()  # Acknowledge the interaction
+            current_page = min(current_page + 1, snapshot.total_pages - 1)
+            await self.show(interaction)
+
+        @discord.ui.button(label='Refresh', style=discord.ButtonStyle.primary)
+        async def refresh(self, interaction: discord.Interaction, button: Button):
+            nonlocal current_page
+            await interaction.response.defer()  # Acknowledge the interaction
+
+            # fresh quotes come from the cache, only stale ones are downloaded
+            prices = await run_io(get_stocks_values, list(user_db_info.stocks))
+            if snapshot.update(prices):
+                current_page = min(current_page, snapshot.total_pages - 1)
+
+            await interaction.edit_original_response(embed=snapshot.page(current_page, current_sort), view=self)
+
+        @discord.ui.select(
+            placeholder='Sort by',
+            options=[discord.SelectOption(label=f"Sort by {i}", value=i) for i in SORT_MODES]
+        )
+        async def sort(self, interaction: discord.Interaction, select: discord.ui.Select):
+            nonlocal current_page, current_sort
+            current_sort = select.values[0]
+            current_page = 0
+            await self.show(interaction)
 
     view = PortfolioView()
-    embed = generate_embed(current_page)
+    embed = snapshot.page(current_page, current_sort)
     
     await iter.followup.send(embed=embed, view=view)
 
@@ -154,20 +288,64 @@ async def guild_ranking(iter: discord.Interaction):
     # Acknowledge the interaction immediately
     await iter.response.defer()
     
-    # pull relevant info
-    guild_users = db.get_guild_users(iter.guild_id)  # users
-    all_stocks = set()  # all stocks in the server
-    for i in guild_users:
-        all_stocks.update(i.stocks.keys())
-        
-    # calcs
-    general_stock_values = get_stocks_values(all_stocks)
-    users_networth = calculate_portfolios_netwoth(guild_users, general_stock_values)
-    
-    
-    embed = create_ranking_embed(iter.guild, users_networth)
+    # the leaderboard is built once, then kept up to date by trades and price ticks
+    board = leaderboards.get(iter.guild_id)
+    if board is None:
+        guild_users = await db.run(db.get_guild_users, iter.guild_id)
+        prices = await run_io(get_stocks_values, leaderboards.missing_prices(guild_users))
+        board = leaderboards.build(iter.guild_id, guild_users, prices)
+
+    else:
+        if db.shared:
+            # trades made by the other processes
+            changed = await db.run(db.refresh_guild, iter.guild_id)
+            prices = await run_io(get_stocks_values, leaderboards.missing_prices(changed))
+            for user in changed:
+                leaderboards.on_trade(iter.guild_id, user, prices)
+
+        # members who joined since the board was built and have not traded yet
+        guild_users = db.data[iter.guild_id].data
+        if len(guild_users) > len(board):
+            # copied at once, the IO threads of a shared database may add users meanwhile
+            board.add_users(list(guild_users.values()))
+
+    caller_rank = board.rank(iter.user.id)
+
+    # build message
+    users_per_page = 10
+    total_pages = max(1, math.ceil(len(board) / users_per_page))
+    current_page = 0
+
+    def generate_embed(page: int, per_page: int = users_per_page):
+        return create_ranking_embed(iter.guild, board.page(page, per_page), page, per_page, len(board), caller_rank)
+
+    async def update_message(page):
+        await iter.edit_original_response(embed=generate_embed(page), view=view)
+
+    class RankingView(View):
+        def __init__(self):
+            super().__init__()
+
+        @discord.ui.button(label='Previous', style=discord.ButtonStyle.secondary)
+        async def previous_page(self, interaction: discord.Interaction, button: Button):
+            nonlocal current_page
+            await interaction.response.defer()  # Acknowledge the interaction
+            if current_page > 0:
+                current_page -= 1
+                await update_message(current_page)
+
+        @discord.ui.button(label='Next', style=discord.ButtonStyle.secondary)
+        async def next_page(self, interaction: discord.Interaction, button: Button):
+            nonlocal current_page
+            await interaction.response.defer()  # Acknowledge the interaction
+            if current_page < total_pages - 1:
+                current_page += 1
+                await update_message(current_page)
+
+    view = RankingView()
+    embed = generate_embed(current_page)
     
-    await iter.followup.send(embed=embed)
+    await iter.followup.send(embed=embed, view=view)
 
 
 class BuyGroup(app_commands.Group):
@@ -193,31 +371,19 @@ class BuyGroup(app_commands.Group):
         # Acknowledge the interaction immediately
         await iter.response.defer()
     
-        # get relevant data
-        user = db.get_user(iter.guild_id, iter.user.id)
-        stock_current_value = get_stock_current_value(symbol, currency="USD")
-        
-        # check transation
-        if user.cash < value:
-            await iter.followup.send(f"You cant afford this. You just have **{user.cash} $**.", ephemeral=True)
+        try:
+            trade = await trade_engine.buy(iter.guild_id, iter.user.id, symbol, value=value)
+        except TradeError as e:
+            await iter.followup.send(str(e), ephemeral=True)
             return
 
-        # update values
-        user.cash -= value
-
-        if symbol not in user.stocks:
-            user.stocks[symbol] = Position(symbol)
-        
-        user.stocks[symbol].number_owned += value / stock_current_value
-        user.stocks[symbol].valued_invested += value
-
         # construct message
         embed = discord.Embed(title="Buy ticket")
 
         embed.add_field(name="Symbol", value=symbol, inline=True)
-        embed.add_field(name="Current Price", value=f"{stock_current_value:.2f} $", inline=True)
+        embed.add_field(name="Current Price", value=f"{trade.price:.2f} $", inline=True)
         embed.add_field(name="Spent", value=f"{value} $", inline=True)
-        embed.add_field(name="Total", value=f"{value / stock_current_value:.3f} shares", inline=False)
+        embed.add_field(name="Total", value=f"{trade.shares:.3f} shares", inline=False)
         
         await iter.followup.send(embed=embed)
 
@@ -240,34 +406,19 @@ class BuyGroup(app_commands.Group):
         # Acknowledge the interaction immediately
         await iter.response.defer()
         
-        # get relevant data
-        user = db.get_user(iter.guild_id, iter.user.id)
-        stock_current_value = get_stock_current_value(symbol, currency="USD")
-        
-        # check transation
-        if user.cash < stock_current_value * quantity:
-            await iter.followup.send(
-                f"You cant afford this. You just have **{user.cash} $** (**{user.cash/stock_current_value:.3f}** stocks of {symbol}).", 
-                ephemeral=True
-            )
+        try:
+            trade = await trade_engine.buy(iter.guild_id, iter.user.id, symbol, quantity=quantity)
+        except TradeError as e:
+            await iter.followup.send(str(e), ephemeral=True)
             return
-        
-        # update values
-        user.cash -= quantity * stock_current_value
 
-        if symbol not in user.stocks:
-            user.stocks[symbol] = Position(symbol)
-        
-        user.stocks[symbol].number_owned += quantity
-        user.stocks[symbol].valued_invested += quantity * stock_current_value
-        
         # construct message
         embed = discord.Embed(title="Buy ticket")
 
         embed.add_field(name="Symbol", value=symbol, inline=True)
-        embed.add_field(name="Current Price", value=f"{stock_current_value:.2f} $", inline=True)
+        embed.add_field(name="Current Price", value=f"{trade.price:.2f} $", inline=True)
         embed.add_field(name="Shares", value=quantity, inline=True)
-        embed.add_field(name="Total", value=f"{quantity * stock_current_value:.2f} $", inline=False)
+        embed.add_field(name="Total", value=f"{trade.value:.2f} $", inline=False)
         
         await iter.followup.send(embed=embed)
 
@@ -295,37 +446,19 @@ class SellGroup(app_commands.Group):
         # Acknowledge the interaction immediately
         await iter.response.defer()
         
-        # get relevant data
-        user = db.get_user(iter.guild_id, iter.user.id)
-        stock_current_value = get_stock_current_value(symbol, currency="USD")
-        shares_to_sell = value / stock_current_value
-        
-        # check transation
-        if symbol not in user.stocks or user.stocks[symbol].number_owned < shares_to_sell:
-            current_owned = user.stocks[symbol].number_owned if symbol in user.stocks else 0
-            await iter.followup.send(
-                f"You dont have enouth of that stock to complete the transaction. You own **{current_owned * stock_current_value:.5f} $** of {symbol} stocks", 
-                ephemeral=True
-            )
+        try:
+            trade = await trade_engine.sell(iter.guild_id, iter.user.id, symbol, value=value)
+        except TradeError as e:
+            await iter.followup.send(str(e), ephemeral=True)
             return
 
-        # update values
-        avg_cost_per_share = user.stocks[symbol].valued_invested / user.stocks[symbol].number_owned
-        
-        user.cash += value
-        user.stocks[symbol].number_owned -= shares_to_sell
-        user.stocks[symbol].valued_invested -= avg_cost_per_share * shares_to_sell
-        
-        if user.stocks[symbol].number_owned == 0:
-            user.stocks.pop(symbol)
-        
         # construct message
         embed = discord.Embed(title="Sell ticket")
 
         embed.add_field(name="Symbol", value=symbol, inline=True)
-        embed.add_field(name="Current Price", value=f"{stock_current_value:.2f} $", inline=True)
+        embed.add_field(name="Current Price", value=f"{trade.price:.2f} $", inline=True)
         embed.add_field(name="Sold", value=f"{value} $", inline=True)
-        embed.add_field(name="Total", value=f"{shares_to_sell:.3f} shares", inline=False)
+        embed.add_field(name="Total", value=f"{trade.shares:.3f} shares", inline=False)
         
         await iter.followup.send(embed=embed)
 
@@ -348,56 +481,189 @@ class SellGroup(app_commands.Group):
         # Acknowledge the interaction immediately
         await iter.response.defer()
         
-        # get relevant data
-        user = db.get_user(iter.guild_id, iter.user.id)
-        stock_current_value = get_stock_current_value(symbol, currency="USD")
-        
-        # check transation
-        if symbol not in user.stocks or user.stocks[symbol].number_owned < quantity:
-            current_owned = user.stocks[symbol].number_owned if symbol in user.stocks else 0
-            await iter.followup.send(
-                f"You dont have enouth of that stock to complete the transaction. You own **{current_owned:.5f}** stocks of {symbol}", 
-                ephemeral=True
-            )
+        try:
+            trade = await trade_engine.sell(iter.guild_id, iter.user.id, symbol, quantity=quantity)
+        except TradeError as e:
+            await iter.followup.send(str(e), ephemeral=True)
             return
-        
-        # update values
-        avg_cost_per_share = user.stocks[symbol].valued_invested / user.stocks[symbol].number_owned
-        
-        user.cash += quantity * stock_current_value
-        user.stocks[symbol].number_owned -= quantity
-        user.stocks[symbol].valued_invested -= avg_cost_per_share * quantity
-        
-        if user.stocks[symbol].number_owned == 0:
-            user.stocks.pop(symbol)
-        
+
         # construct message
         embed = discord.Embed(title="Sell ticket")
 
         embed.add_field(name="Symbol", value=symbol, inline=True)
-        embed.add_field(name="Current Price", value=f"{stock_current_value:.2f} $", inline=True)
+        embed.add_field(name="Current Price", value=f"{trade.price:.2f} $", inline=True)
         embed.add_field(name="Shares", value=quantity, inline=True)
-        embed.add_field(name="Total", value=f"{quantity * stock_current_value:.2f} $", inline=False)
+        embed.add_field(name="Total", value=f"{trade.value:.2f} $", inline=False)
         
         await iter.followup.send(embed=embed)
 
+class OrderGroup(app_commands.Group):
+    def __init__(self):
+        super().__init__(name="order", description="Place and manage limit and stop orders")
+
+    @app_commands.command(name="limit", description="Buy at or below a price, or sell at or above it")
+    @app_commands.describe(
+        symbol="The stock symbol of the order",
+        side="Whether to buy or sell",
+        quantity="The quantity of stocks to trade",
+        price="The limit price in USD"
+    )
+    @only_users_allowed()
+    @check_stock_validaty(1)
+    async def limit(self, iter: discord.Interaction, symbol: str, side: Literal['buy', 'sell'], quantity: float, price: float):
+        await self.place(iter, symbol, side, 'limit', quantity, price)
+
+    @app_commands.command(name="stop", description="Buy once the price rises to a level, or sell once it falls to it")
+    @app_commands.describe(
+        symbol="The stock symbol of the order",
+        side="Whether to buy or sell",
+        quantity="The quantity of stocks to trade",
+        price="The stop price in USD"
+    )
+    @only_users_allowed()
+    @check_stock_validaty(1)
+    async def stop(self, iter: discord.Interaction, symbol: str, side: Literal['buy', 'sell'], quantity: float, price: float):
+        await self.place(iter, symbol, side, 'stop', quantity, price)
+
+    @app_commands.command(name="list", description="List your open orders")
+    @only_users_allowed()
+    async def list_orders(self, iter: discord.Interaction):
+        orders = order_book.user_orders(iter.guild_id, iter.user.id)
+        await iter.response.send_message(embed=create_orders_embed(iter.user, orders), ephemeral=True)
+
+    @app_commands.command(name="cancel", description="Cancel an open order")
+    @app_commands.describe(order_id="The number of the order to cancel")
+    @only_users_allowed()
+    async def cancel(self, iter: discord.Interaction, order_id: int):
+        order = order_book.cancel(order_id, iter.user.id)
+        if order is None:
+            await iter.response.send_message(f"You have no open order `#{order_id}`.", ephemeral=True)
+            return
+
+        await iter.response.send_message(f"Order `#{order_id}` cancelled.", ephemeral=True)
+        await order_book.persist()
+
+    async def place(self, iter: discord.Interaction, symbol: str, side: str, kind: str, quantity: float, price: float):
+        # arguments check
+        if quantity <= 0 or price <= 0:
+            await iter.response.send_message(
+                "The **quantity** and the **price** of an order must be positive numbers.",
+                ephemeral=True
+            )
+            return
+
+        # Acknowledge the interaction immediately
+        await iter.response.defer()
+
+        # also checks the symbol exists
+        current_price = await trade_engine.quote(symbol)
+
+        order = order_book.place(iter.guild_id, iter.user.id, symbol, side, kind, price, quantity)
+        await order_book.persist()
+
+        await iter.followup.send(embed=create_order_embed(order, current_price))
+
 client.tree.add_command(BuyGroup())
 client.tree.add_command(SellGroup())
+client.tree.add_command(OrderGroup())
 
 
 def save_data_on_exit():
+    if order_book:
+        order_book.save()
+
     if db:
         db.save_data()
+        db.close()
     
     print("Data saved.")
+    executor.shutdown()
+    renderer.shutdown()
 
-def main():
-    global db
-    
-    db = InMemoryDatabase("./data.json")
+def load_storage():
+    backend = getattr(creds, 'DATABASE_BACKEND', 'guilds')
+    base_path = "./data.sqlite" if backend in ('sqlite', 'shared') else "./data.json"
+    # the orders stay in a file per partition, several unsharded processes would all fill them
+    if backend == 'shared' and not SHARD_COUNT:
+        raise ValueError("The shared database needs SHARD_COUNT, and SHARD_IDS for every process")
+
+    # every process of a shared database uses the same file, holding every guild
+    owned = ShardPartition() if backend == 'shared' else partition
+    path = owned.path(base_path)
+
+    is_new = not exists(backend, path)
+    storage = create_storage(backend, path)
+
+    # first start on a new backend or shard layout, carry over the owned guilds
+    if is_new or storage.is_empty():
+        sources = [(backend, i) for i in partition_files(backend, base_path, exclude=path)]
+        if backend not in ('json', 'journal'):
+            sources = [('json', i) for i in partition_files('json', "./data.json")] + sources
+
+        data = collect_guilds(sources, owned)
+        if data:
+            storage.save_all(data)
+
+    return storage
+
+def load_orders(engine: TradeEngine) -> OrderBook:
+    path = partition.path("./orders.json")
+    is_new = not os.path.isfile(path)
+
+    book = OrderBook(engine, path)
+    book.load()
+
+    # first start with a new shard layout, take over the orders of this partition
+    if is_new:
+        book.adopt(partition_files('json', "./orders.json", exclude=path), partition)
+
+    return book
+
+def load_market_data():
+    name = getattr(creds, 'MARKET_DATA', 'yahoo')
+    options = {'directory': getattr(creds, 'REPLAY_DIRECTORY', './replay')} if name == 'replay' else {}
+
+    market_data.set_provider(market_data.create_provider(name, **options))
+
+def setup():
+    """Load the data and wire the services, everything the bot needs before connecting to Discord."""
+    global db, price_refresher, trade_engine, order_book
+
+    load_market_data()
+    db = InMemoryDatabase(storage=load_storage())
+    logo_resolver.load()
+    trade_engine = TradeEngine(db)
+    order_book = load_orders(trade_engine)
+
+    price_refresher = PriceRefresher(db)
+    price_refresher.watch(order_book.symbols)
+    price_refresher.add_listener(on_price_tick)
+
+    metrics.register('quote_cache', quote_cache.stats)
+    metrics.register('chart_cache', chart_cache.stats)
+    metrics.register('renderer', renderer.stats)
     atexit.register(save_data_on_exit)
-    
-    client.run(BOT_TOKEN)
+
+async def shutdown():
+    """Release what lives on the event loop, before the loop closes."""
+    await logo_resolver.close()
+
+async def run():
+    async with client:
+        try:
+            await client.start(creds.BOT_TOKEN)
+        finally:
+            await shutdown()
+
+def main():
+    setup()
+
+    # what client.run does, with the shutdown of the event loop services
+    discord.utils.setup_logging()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
     main()
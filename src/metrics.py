@@ -0,0 +1,215 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from aiohttp import web
+
+if TYPE_CHECKING:
+    from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# seconds, from a cached lookup to a slow Yahoo request
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """
+    Cumulative histogram of durations, in the Prometheus layout.
+
+    Args:
+        buckets (Sequence[float], optional): Upper bounds of the buckets, in seconds.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile, an estimate good enough for a summary."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+
+            target = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= target:
+                    return bound
+
+        return float('inf')
+
+    def snapshot(self) -> Tuple[List[Tuple[str, int]], float, int]:
+        """Cumulative buckets, sum and count, read together so they agree."""
+        with self._lock:
+            buckets = []
+            seen = 0
+            for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+                seen += count
+                buckets.append((str(bound), seen))
+
+            return buckets, self.sum, self.count
+
+
+class Metrics:
+    """
+    Registry of latency histograms and collected gauges.
+
+    Histograms are keyed by metric name and a single label value, like the
+    command name or the dependency. Gauges are read from collector callables
+    when the metrics are rendered, so caches keep counting on their own.
+    """
+
+    def __init__(self) -> None:
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self.collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+        self._lock = threading.Lock()
+        self._started: OrderedDict[int, float] = OrderedDict()
+        self._server: Optional[web.AppRunner] = None
+
+    def histogram(self, name: str, label: str, value: str) -> Histogram:
+        key = (name, label, value)
+
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+
+        return histogram
+
+    def observe_dependency(self, dependency: str, seconds: float) -> None:
+        self.histogram('dependency_seconds', 'dependency', dependency).observe(seconds)
+
+    @contextmanager
+    def timer(self, dependency: str) -> Iterator[None]:
+        """Time a call to a dependency, works around an await too."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_dependency(dependency, time.perf_counter() - start)
+
+    def command_started(self, interaction_id: int) -> None:
+        self._started[interaction_id] = time.perf_counter()
+
+        # commands that failed never complete, don't keep them forever
+        while len(self._started) > 1024:
+            self._started.popitem(last=False)
+
+    def command_completed(self, interaction_id: int, command: str) -> None:
+        start = self._started.pop(interaction_id, None)
+        if start is not None:
+            self.histogram('command_seconds', 'command', command).observe(time.perf_counter() - start)
+
+    def _sorted_histograms(self) -> List[Tuple[Tuple[str, str, str], Histogram]]:
+        """The histograms by key, copied under the lock as commands may add some meanwhile."""
+        with self._lock:
+            items = list(self.histograms.items())
+
+        return sorted(items, key=lambda i: i[0])
+
+    def register(self, name: str, collector: Callable[[], Dict[str, float]]) -> None:
+        """Register a callable returning gauges, exported as `<name>_<key>`."""
+        self.collectors[name] = collector
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text format."""
+        lines = []
+
+        by_name: Dict[str, List[Tuple[str, str, Histogram]]] = {}
+        for (name, label, value), histogram in self._sorted_histograms():
+            by_name.setdefault(name, []).append((label, value, histogram))
+
+        for name, histograms in by_name.items():
+            metric = f"tradingbot_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+
+            for label, value, histogram in histograms:
+                buckets, total, count = histogram.snapshot()
+                for bound, seen in buckets:
+                    lines.append(f'{metric}_bucket{{{label}="{value}",le="{bound}"}} {seen}')
+                lines.append(f'{metric}_sum{{{label}="{value}"}} {total}')
+                lines.append(f'{metric}_count{{{label}="{value}"}} {count}')
+
+        for name, values in self.collect().items():
+            for key, value in values.items():
+                metric = f"tradingbot_{name}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def collect(self) -> Dict[str, Dict[str, float]]:
+        resp = {}
+        for name, collector in self.collectors.items():
+            try:
+                resp[name] = collector()
+            except Exception as e:
+                print(f"Metrics collector {name} failed: {e}")
+
+        return resp
+
+    def summary(self) -> str:
+        """Short human readable report, for the !stats command."""
+        lines = []
+
+        for (name, _, value), histogram in self._sorted_histograms():
+            if not histogram.count:
+                continue
+            lines.append(
+                f"{name.rsplit('_', 1)[0]} {value}: n={histogram.count} avg={histogram.sum / histogram.count * 1000:.0f}ms "
+                f"p50≤{histogram.quantile(0.5) * 1000:.0f}ms p95≤{histogram.quantile(0.95) * 1000:.0f}ms"
+            )
+
+        for name, values in self.collect().items():
+            lines.append(f"{name}: " + ' '.join(
+                f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}" for key, value in values.items()
+            ))
+
+        return '\n'.join(lines) or "No metrics yet."
+
+    @property
+    def serving(self) -> bool:
+        return self._server is not None
+
+    async def start_server(self, host: str = '127.0.0.1', port: int = 9108) -> None:
+        """Serve the metrics on http://host:port/metrics, meant for a local Prometheus scraper."""
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle)
+
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host, port).start()
+        except BaseException:
+            # e.g. the port is taken, don't report the server as running
+            await runner.cleanup()
+            raise
+
+        self._server = runner
+
+    async def stop_server(self) -> None:
+        if self._server is not None:
+            await self._server.cleanup()
+            self._server = None
+
+
+metrics = Metrics()
@@ -0,0 +1,244 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, NamedTuple
+
+import asyncio
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+
+from database.sharding import file_partition
+from executor import run_io
+from trading import TradeError
+
+if TYPE_CHECKING:
+    from typing import Container, Dict, List, Optional, Set, Tuple
+    from trading import Trade, TradeEngine
+
+logger = logging.getLogger(__name__)
+
+
+class Order(NamedTuple):
+    order_id: int
+    guild_id: int
+    user_id: int
+    symbol: str
+    side: str  # 'buy' or 'sell'
+    kind: str  # 'limit' or 'stop'
+    price: float  # trigger price in USD
+    quantity: float
+    created_at: float
+
+    @property
+    def triggers_on_fall(self) -> bool:
+        """True if the order triggers once the price drops to its level, False if once it rises to it."""
+        return (self.side == 'buy') == (self.kind == 'limit')
+
+
+class OrderBook:
+    """
+    Resting limit and stop orders, matched against every price tick.
+
+    Every symbol has two heaps of trigger prices: orders that trigger when the
+    price drops to their level (limit buys, stop sells) and orders that
+    trigger when it rises to it (limit sells, stop buys). A tick only pops the
+    orders it crosses, the rest are never looked at. Cancelled orders are
+    dropped from the heaps lazily, when they reach the top.
+
+    Triggered orders are filled at the tick price through the trade engine,
+    orders the user can no longer afford or cover are dropped.
+
+    Args:
+        engine (TradeEngine): Engine the orders are filled through.
+        path (str, optional): Path of the on-disk orders. Defaults to './orders.json'.
+    """
+
+    def __init__(self, engine: TradeEngine, path: str = './orders.json') -> None:
+        self.engine = engine
+        self.path = path
+
+        self.orders: Dict[int, Order] = {}
+        self._next_id = 1
+
+        # symbol -> (falling heap of (-price, id), rising heap of (price, id))
+        self._heaps: Dict[str, Tuple[List[Tuple[float, int]], List[Tuple[float, int]]]] = {}
+        self._open: Dict[str, int] = {}  # resting orders per symbol
+
+        self._save_lock = threading.Lock()
+        self._changes = 0
+        self._saved_changes = 0
+
+    def load(self) -> None:
+        """Load the on-disk orders, meant to be called at startup."""
+        if not os.path.isfile(self.path):
+            return
+
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+
+        self._next_id = data.get('next_id', 1)
+        for i in data.get('orders', []):
+            self._index(Order(**i))
+
+    def adopt(self, paths: List[str], guilds: Container[int]) -> int:
+        """
+        Take over the orders of other order files, e.g. after the shard layout changed.
+
+        The orders of a guild are taken from the newest file covering its
+        shard only, even when that file holds none of them anymore: they were
+        filled or cancelled there. Adopted orders get new ids.
+
+        Args:
+            paths (List[str]): The order files, oldest first.
+            guilds (Container[int]): The guilds whose orders are adopted.
+
+        Returns:
+            int: Number of adopted orders.
+        """
+        partitions = [file_partition(i) for i in paths]
+        adopted = 0
+
+        for n, path in enumerate(paths):
+            newer = partitions[n + 1:]
+
+            with open(path, 'r') as f:
+                data = json.load(f)
+
+            for i in data.get('orders', []):
+                guild_id = i['guild_id']
+                if guild_id not in guilds or any(guild_id in j for j in newer):
+                    continue
+
+                self._index(Order(**dict(i, order_id=self._next_id)))
+                self._next_id += 1
+                adopted += 1
+
+        return adopted
+
+    def save(self, data: dict = None, changes: int = None) -> None:
+        """
+        Write the orders, or a snapshot of them taken after `changes` changes.
+
+        A snapshot older than the one already written is skipped.
+        """
+        with self._save_lock:
+            if changes is not None:
+                if changes <= self._saved_changes:
+                    return
+                self._saved_changes = changes
+
+            tmp_path = self.path + '.tmp'
+
+            with open(tmp_path, 'w') as f:
+                json.dump(self.serialize() if data is None else data, f)
+
+            os.replace(tmp_path, self.path)
+
+    async def persist(self) -> None:
+        """Write a snapshot of the orders from the IO pool, after they changed."""
+        self._changes += 1
+
+        try:
+            await run_io(self.save, self.serialize(), self._changes)
+        except OSError:
+            # the orders stay in memory, the next save writes them
+            logger.exception("Saving the orders failed")
+
+    def serialize(self) -> dict:
+        return {'next_id': self._next_id, 'orders': [i._asdict() for i in self.orders.values()]}
+
+    def place(self, guild_id: int, user_id: int, symbol: str, side: str, kind: str, price: float, quantity: float) -> Order:
+        order = Order(self._next_id, guild_id, user_id, symbol, side, kind, price, quantity, time.time())
+        self._next_id += 1
+
+        self._index(order)
+        return order
+
+    def cancel(self, order_id: int, user_id: int = None) -> Optional[Order]:
+        """Cancel an order, only if it belongs to `user_id` when given."""
+        order = self.orders.get(order_id)
+        if order is None or (user_id is not None and order.user_id != user_id):
+            return None
+
+        self._closed(order.symbol)
+        return self.orders.pop(order_id)
+
+    def user_orders(self, guild_id: int, user_id: int) -> List[Order]:
+        return [i for i in self.orders.values() if i.guild_id == guild_id and i.user_id == user_id]
+
+    def symbols(self) -> Set[str]:
+        """Symbols with resting orders, whose prices must be kept fresh."""
+        return set(self._open)
+
+    def crossed(self, prices: Dict[str, float]) -> List[Tuple[Order, float]]:
+        """Remove and return the orders triggered by a price tick, with the price that triggered them."""
+        resp = []
+
+        for symbol, price in prices.items():
+            heaps = self._heaps.get(symbol)
+            if heaps is None:
+                continue
+
+            falling, rising = heaps
+
+            triggered = []
+            while falling and -falling[0][0] >= price:
+                triggered.append(heapq.heappop(falling)[1])
+            while rising and rising[0][0] <= price:
+                triggered.append(heapq.heappop(rising)[1])
+
+            for order_id in triggered:
+                order = self.orders.pop(order_id, None)
+                if order is not None:
+                    resp.append((order, price))
+                    self._closed(symbol)
+
+        return resp
+
+    async def on_prices(self, prices: Dict[str, float]) -> List[Trade]:
+        """
+        Fill every order crossed by a price tick.
+
+        Args:
+            prices (Dict[str, float]): Price in USD of the refreshed symbols.
+
+        Returns:
+            List[Trade]: The trades of the filled orders.
+        """
+        crossed = self.crossed(prices)
+        if not crossed:
+            return []
+
+        results = await asyncio.gather(*(self._fill(order, price) for order, price in crossed))
+        await self.persist()
+
+        return [i for i in results if i is not None]
+
+    async def _fill(self, order: Order, price: float) -> Optional[Trade]:
+        trade = self.engine.buy if order.side == 'buy' else self.engine.sell
+
+        try:
+            return await trade(order.guild_id, order.user_id, order.symbol, quantity=order.quantity, price=price)
+        except TradeError:
+            return None
+
+    def _index(self, order: Order) -> None:
+        self.orders[order.order_id] = order
+
+        self._open[order.symbol] = self._open.get(order.symbol, 0) + 1
+
+        falling, rising = self._heaps.setdefault(order.symbol, ([], []))
+        if order.triggers_on_fall:
+            heapq.heappush(falling, (-order.price, order.order_id))
+        else:
+            heapq.heappush(rising, (order.price, order.order_id))
+
+    def _closed(self, symbol: str) -> None:
+        self._open[symbol] -= 1
+
+        if not self._open[symbol]:
+            # drops the cancelled orders still in the heaps too
+            del self._open[symbol]
+            del self._heaps[symbol]
@@ -0,0 +1,99 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+import math
+
+from database.position import Position
+from valuation import valuate_user
+from view import create_portfolio_embed
+
+if TYPE_CHECKING:
+    from typing import Dict, List
+    from discord import Embed, Member
+    from database.user import User
+
+SORT_MODES = ('value', 'gain', 'symbol')
+
+
+class PortfolioSnapshot:
+    """
+    Priced copy of a user's positions, rendered into page embeds.
+
+    All pages of a sort order are rendered at once, on its first use, so
+    paging only picks an already built embed. A refresh re-prices the
+    snapshot and drops the pages only if a price or a position changed.
+
+    Args:
+        member (Member): The owner of the portfolio.
+        user (User): The database entry of the owner.
+        prices (Dict[str, float]): Price in USD of each held symbol.
+        per_page (int, optional): Positions per page. Defaults to 5.
+    """
+
+    def __init__(self, member: Member, user: User, prices: Dict[str, float], per_page: int = 5) -> None:
+        self.member = member
+        self.user = user
+        self.per_page = per_page
+
+        self.prices: Dict[str, float] = {}
+        self.positions: List[Position] = []
+        self.values: Dict[str, float] = {}
+
+        self._pages: Dict[str, List[Embed]] = {}
+
+        self.update(prices)
+
+    @property
+    def total_pages(self) -> int:
+        return max(1, math.ceil(len(self.positions) / self.per_page))
+
+    def update(self, prices: Dict[str, float]) -> bool:
+        """
+        Re-price the snapshot against the current positions of the user.
+
+        Args:
+            prices (Dict[str, float]): Price in USD of each held symbol.
+
+        Returns:
+            bool: True if anything changed and the pages were rendered again.
+        """
+        positions = {symbol: i.serialize() for symbol, i in self.user.stocks.items()}
+        changed = {symbol for symbol in positions if prices.get(symbol) != self.prices.get(symbol)}
+
+        if not changed and positions == {i.symbol: i.serialize() for i in self.positions}:
+            return False
+
+        # detached copies, later trades don't leak into the pages
+        self.positions = [Position(symbol, data) for symbol, data in positions.items()]
+        self.prices = {symbol: prices[symbol] for symbol in positions if symbol in prices}
+        self.values = valuate_user(self.user, self.prices).positions
+        self._pages = {}
+
+        return True
+
+    def page(self, page: int, sort: str = 'value') -> Embed:
+        pages = self._pages.get(sort)
+        if pages is None:
+            pages = self._pages[sort] = self._render(sort)
+
+        return pages[min(page, len(pages) - 1)]
+
+    def _sorted(self, sort: str) -> List[Position]:
+        if sort == 'symbol':
+            return sorted(self.positions, key=lambda i: i.symbol)
+        if sort == 'gain':
+            return sorted(self.positions, key=lambda i: self.values.get(i.symbol, 0) - i.valued_invested, reverse=True)
+
+        return sorted(self.positions, key=lambda i: self.values.get(i.symbol, 0), reverse=True)
+
+    def _render(self, sort: str) -> List[Embed]:
+        positions = self._sorted(sort)
+        total_pages = self.total_pages
+
+        resp = []
+        for page in range(total_pages):
+            embed = create_portfolio_embed(self.member, positions, self.values, page, self.per_page)
+            embed.set_footer(text=f"Page {page + 1}/{total_pages} • Sorted by {sort}")
+            resp.append(embed)
+
+        return resp
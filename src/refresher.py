@@ -0,0 +1,163 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from datetime import datetime, time as dt_time
+import time
+from zoneinfo import ZoneInfo
+from discord.ext import tasks
+
+from apis.quote_cache import quote_cache
+from apis.yfinance_api import get_stock_quotes, quotes_to_usd
+from executor import run_io
+
+if TYPE_CHECKING:
+    from typing import Awaitable, Callable, Dict, Iterable, List, Set
+    from database.database import InMemoryDatabase
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = dt_time(9, 30)
+MARKET_CLOSE = dt_time(16, 0)
+
+
+def is_market_open(now: datetime = None) -> bool:
+    """Check if the US stock market is in its regular trading session."""
+    now = datetime.now(MARKET_TIMEZONE) if now is None else now.astimezone(MARKET_TIMEZONE)
+
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() <= MARKET_CLOSE
+
+
+class PriceRefresher:
+    """
+    Background loop that keeps the quotes of held and recently looked-up symbols warm.
+
+    Symbols looked up in the last `hot_window` seconds are refreshed every
+    `hot_interval` seconds, the remaining held symbols every `idle_interval`
+    and, outside market hours, everything only every `closed_interval`.
+    Symbols of watched sources, like resting orders, are always hot.
+    Listeners get the refreshed prices, in USD, after every batch.
+
+    Args:
+        db (InMemoryDatabase): The database holding every user position.
+        hot_interval (float, optional): Refresh interval of hot symbols. Defaults to 30.
+        idle_interval (float, optional): Refresh interval of idle symbols. Defaults to 300.
+        closed_interval (float, optional): Refresh interval outside market hours. Defaults to 1800.
+        hot_window (float, optional): Seconds since the last lookup for a symbol to be hot. Defaults to 600.
+        recent_window (float, optional): Seconds a looked-up symbol is kept warm even if nobody holds it. Defaults to 3600.
+        batch_size (int, optional): Maximum number of symbols per request. Defaults to 100.
+    """
+
+    def __init__(
+        self,
+        db: InMemoryDatabase,
+        *,
+        hot_interval: float = 30,
+        idle_interval: float = 300,
+        closed_interval: float = 1800,
+        hot_window: float = 600,
+        recent_window: float = 3600,
+        batch_size: int = 100
+    ) -> None:
+        self.db = db
+        self.hot_interval = hot_interval
+        self.idle_interval = idle_interval
+        self.closed_interval = closed_interval
+        self.hot_window = hot_window
+        self.recent_window = recent_window
+        self.batch_size = batch_size
+
+        self._last_refresh: Dict[str, float] = {}
+        self._listeners: List[Callable[[Dict[str, float]], Awaitable[None]]] = []
+        self._sources: List[Callable[[], Iterable[str]]] = []
+        self.loop = tasks.loop(seconds=hot_interval)(self._tick)
+
+    def start(self) -> None:
+        if not self.loop.is_running():
+            self.loop.start()
+
+    def stop(self) -> None:
+        self.loop.cancel()
+
+    def add_listener(self, listener: Callable[[Dict[str, float]], Awaitable[None]]) -> None:
+        """Register a coroutine called with the price in USD of every refreshed symbol."""
+        self._listeners.append(listener)
+
+    def watch(self, source: Callable[[], Iterable[str]]) -> None:
+        """Register a callable returning symbols to refresh at the hot interval."""
+        self._sources.append(source)
+
+    def watched_symbols(self) -> Set[str]:
+        return {symbol for source in self._sources for symbol in source()}
+
+    def held_symbols(self) -> Set[str]:
+        return {
+            symbol
+            for guild in self.db.data.values()
+            for user in guild.data.values()
+            for symbol in user.stocks
+        }
+
+    def tracked_symbols(self) -> Set[str]:
+        return self.held_symbols() | set(quote_cache.recent_symbols(self.recent_window))
+
+    def interval_for(self, symbol: str, now: float, market_open: bool, watched: Set[str] = frozenset()) -> float:
+        if not market_open:
+            return self.closed_interval
+
+        if symbol in watched:
+            return self.hot_interval
+
+        last_access = quote_cache.last_access(symbol)
+        if last_access is not None and now - last_access <= self.hot_window:
+            return self.hot_interval
+
+        return self.idle_interval
+
+    def due_symbols(self) -> List[str]:
+        now = time.monotonic()
+        market_open = is_market_open()
+
+        watched = self.watched_symbols()
+        tracked = self.tracked_symbols() | watched
+
+        # forget symbols nobody holds or looks up anymore
+        for symbol in self._last_refresh.keys() - tracked:
+            del self._last_refresh[symbol]
+            quote_cache.set_ttl(symbol, None)
+
+        resp = []
+        for symbol in tracked:
+            interval = self.interval_for(symbol, now, market_open, watched)
+
+            # keep the quote fresh until the next scheduled refresh
+            quote_cache.set_ttl(symbol, interval * 2)
+
+            if now - self._last_refresh.get(symbol, float('-inf')) >= interval:
+                resp.append(symbol)
+
+        return resp
+
+    async def refresh(self, symbols: List[str]) -> None:
+        for start in range(0, len(symbols), self.batch_size):
+            batch = symbols[start:start + self.batch_size]
+            quotes = await run_io(get_stock_quotes, batch, force=True)
+
+            now = time.monotonic()
+            for symbol in batch:
+                self._last_refresh[symbol] = now
+
+            if self._listeners and quotes:
+                # convert the fetched quotes directly, reading them back from the cache would count as accesses
+                await self.notify(await run_io(quotes_to_usd, quotes))
+
+    async def notify(self, prices: Dict[str, float]) -> None:
+        for listener in self._listeners:
+            try:
+                await listener(prices)
+            except Exception as e:
+                print(f"Price listener failed: {e}")
+
+    async def _tick(self) -> None:
+        try:
+            await self.refresh(self.due_symbols())
+        except Exception as e:
+            print(f"Price refresh failed: {e}")
@@ -0,0 +1,183 @@
+"""
+Worker side of the chart rendering.
+
+The render workers are spawned processes, and a spawned process imports
+the main module of its parent again before running anything. For the bot
+that is `main`, imported under another name so its
+`if __name__ == '__main__'` guard keeps it from starting the bot; the
+rendering itself only needs this module. Nothing here is imported at
+module level beyond the standard library, matplotlib is loaded on the
+first render.
+"""
+from __future__ import annotations
+
+import io
+import random
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+# graph themes
+THEMES = {
+    'dark': {
+        'background': '#282b30',
+        'line': '#7289da',
+        'text': 'white',
+        'grid': 'darkgray',
+    },
+}
+
+FIGSIZE = (10, 6)
+SUBPLOT_PARAMS = ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')
+
+
+# drawing functions
+def draw_history_graph(fig: Figure, data: Dict[str, Any]) -> None:
+    """
+    Draw a graph of the historical stock data.
+
+    Args:
+        fig (Figure): The figure to draw on.
+        data (Dict[str, Any]): 'dates' and 'close' arrays, and optionally the 'theme' name.
+    """
+    colors = THEMES[data.get('theme', 'dark')]
+
+    ax = fig.add_subplot()
+    fig.set_facecolor(colors['background'])
+    ax.patch.set_facecolor(colors['background'])  # Set background color for the graph area
+    ax.plot(data['dates'], data['close'], color=colors['line'], linestyle='-', linewidth=2.0)
+    ax.set_xlabel('Date', color=colors['text'])  # Set x-axis label color
+    ax.set_ylabel('Price (USD)', color=colors['text'])  # Set y-axis label color
+    ax.tick_params(axis='x', colors=colors['text'])  # Set x-axis tick color
+    ax.tick_params(axis='y', colors=colors['text'])  # Set y-axis tick color
+    ax.grid(color=colors['grid']) # Set grid color
+    for spine in ax.spines.values():
+        spine.set_color(colors['text'])
+    fig.autofmt_xdate(rotation=-45, ha='left') # Rotate x-axis labels diagonally
+    fig.tight_layout() # Adjust layout to accommodate rotated labels
+
+def draw_positions_smipie(fig: Figure, data: Dict[str, Any]) -> None:
+    """
+    Draw a pie chart of stock positions with random colors.
+
+    Args:
+        fig (Figure): The figure to draw on.
+        data (Dict[str, Any]): 'positions', a list of tuples containing stock symbols and their positions.
+    """
+
+    import matplotlib
+    import matplotlib.colors as mcolors
+
+    def generate_random_colors(num_colors: int) -> List[str]:
+        cmap = matplotlib.colormaps['tab10']
+        return [mcolors.to_hex(cmap(random.random())) for _ in range(num_colors)]
+
+    positions: List[Tuple[str, float]] = sorted(data['positions'], key=lambda x: x[1])
+
+    labels = [i[0] for i in positions]
+    values = [i[1] for i in positions]
+
+    ax = fig.add_subplot()
+    fig.set_facecolor('#282b30')
+    fig.subplots_adjust(left=0.02, bottom=0.02, right=0.98, top=0.98)
+    ax.patch.set_facecolor("#282b30")
+
+    ax.pie(
+        values + [sum(values)],
+        labels=labels + [''],
+        colors=generate_random_colors(len(positions)) + ['#282b30'],
+        textprops={'color': 'white'},
+    )
+    ax.pie([1], colors=['#282b30'], radius=0.8)
+
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+def draw_positions_bar(fig: Figure, data: Dict[str, Any]) -> None:
+    """
+    Draw a bar graph of stock positions.
+
+    Args:
+        fig (Figure): The figure to draw on.
+        data (Dict[str, Any]): 'positions', a dictionary where keys are stock symbols and values are their positions.
+    """
+    positions_lst = sorted(data['positions'].items(), key=lambda x: -x[1])
+
+    labels = [i[0] for i in positions_lst]
+    values = [i[1] for i in positions_lst]
+
+    ax = fig.add_subplot()
+    fig.set_facecolor("#282b30")
+    ax.patch.set_facecolor("#282b30")
+
+    ax.barh(labels, values, color='#7289da')
+    ax.set_xlabel('Position Value', color='white')  # Set x-axis label color
+    ax.set_ylabel('Stock Symbol', color='white')  # Set y-axis label color
+    ax.tick_params(axis='x', colors='white')  # Set x-axis tick color
+    ax.tick_params(axis='y', colors='white')  # Set y-axis tick color
+    ax.invert_yaxis()  # To have the largest position at the top
+
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+DRAWERS = {
+    'history': draw_history_graph,
+    'bar': draw_positions_bar,
+    'pie': draw_positions_smipie,
+}
+
+
+# one reusable figure per chart kind, per worker process
+_templates: Dict[str, Figure] = {}
+
+def _template(kind: str) -> Figure:
+    fig = _templates.get(kind)
+
+    if fig is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=FIGSIZE)
+        FigureCanvasAgg(fig)
+        _templates[kind] = fig
+
+    return fig
+
+def render_sync(kind: str, data: Dict[str, Any]) -> bytes:
+    """
+    Render a chart in the current process.
+
+    Args:
+        kind (str): The chart kind, one of DRAWERS.
+        data (Dict[str, Any]): The data the drawer of that kind expects.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    import matplotlib
+
+    fig = _template(kind)
+
+    try:
+        DRAWERS[kind](fig, data)
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png')
+        return buffer.getvalue()
+
+    finally:
+        # release every artist, keep the figure for the next render
+        fig.clear()
+        fig.subplots_adjust(**{i: matplotlib.rcParams[f'figure.subplot.{i}'] for i in SUBPLOT_PARAMS})
+
+def render_job(kind: str, data: Dict[str, Any]) -> Tuple[bytes, float]:
+    start = time.perf_counter()
+    image = render_sync(kind, data)
+
+    return image, time.perf_counter() - start
+
+def warm_job() -> None:
+    for kind in DRAWERS:
+        _template(kind)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict
+
+from metrics import metrics
+from render_worker import DRAWERS, render_job, warm_job
+
+
+class Renderer:
+    """
+    Pool of worker processes rendering charts.
+
+    Workers are recycled every `max_tasks_per_child` renders so a leak in
+    matplotlib can't grow a worker forever, and at most `max_pending` renders
+    are queued at once.
+
+    Args:
+        workers (int, optional): Number of worker processes. Defaults to 2.
+        max_pending (int, optional): Renders accepted before callers wait. Defaults to 32.
+        max_tasks_per_child (int, optional): Renders before a worker is replaced. Defaults to 200.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 32, max_tasks_per_child: int = 200) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_tasks_per_child = max_tasks_per_child
+
+        self._pool: ProcessPoolExecutor = None
+        self._slots: asyncio.Semaphore = None
+
+        self.queue_depth = 0
+        self.rendered = 0
+        self.failed = 0
+        self.render_times = deque(maxlen=1000)
+
+    def _ensure_pool(self) -> None:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                max_tasks_per_child=self.max_tasks_per_child,
+            )
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+    async def render(self, kind: str, data: Dict[str, Any]) -> bytes:
+        """
+        Render a chart in a worker process.
+
+        Args:
+            kind (str): The chart kind ('history', 'bar' or 'pie').
+            data (Dict[str, Any]): The data the drawer of that kind expects.
+
+        Returns:
+            bytes: The PNG image.
+        """
+        if kind not in DRAWERS:
+            raise ValueError(f"Unknown chart kind {kind}")
+
+        self._ensure_pool()
+        loop = asyncio.get_running_loop()
+
+        self.queue_depth += 1
+        try:
+            async with self._slots:
+                image, elapsed = await loop.run_in_executor(self._pool, render_job, kind, data)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.queue_depth -= 1
+
+        self.rendered += 1
+        self.render_times.append(elapsed)
+        metrics.observe_dependency('render', elapsed)
+        return image
+
+    async def warm_up(self) -> None:
+        """Start the workers and have them load matplotlib, so the first chart doesn't wait for it."""
+        self._ensure_pool()
+        loop = asyncio.get_running_loop()
+
+        await asyncio.gather(*(loop.run_in_executor(self._pool, warm_job) for _ in range(self.workers)))
+
+    def stats(self) -> Dict[str, float]:
+        times = sorted(self.render_times)
+
+        return {
+            'queue_depth': self.queue_depth,
+            'rendered': self.rendered,
+            'failed': self.failed,
+            'render_time_avg': sum(times) / len(times) if times else 0.0,
+            'render_time_p95': times[int(len(times) * 0.95)] if times else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+renderer = Renderer()
@@ -0,0 +1,241 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, NamedTuple
+
+import asyncio
+import sqlite3
+from collections import deque
+
+from apis.yfinance_api import get_stock_current_value
+from database.position import Position
+from database.storage import ConcurrentUpdate
+from executor import run_io
+from leaderboard import leaderboards
+
+if TYPE_CHECKING:
+    from typing import Any, Awaitable, Callable, Deque, Dict, Set, Tuple
+    from database.database import InMemoryDatabase
+    from database.user import User
+
+
+# positions left with fewer shares are closed, selling by value leaves rounding dust
+DUST = 1e-9
+
+
+class TradeError(Exception):
+    """A trade that can't be executed, the message is meant for the user."""
+
+class InsufficientFunds(TradeError):
+    pass
+
+class InsufficientShares(TradeError):
+    pass
+
+
+class Trade(NamedTuple):
+    side: str  # 'buy' or 'sell'
+    symbol: str
+    price: float  # price in USD of one share
+    shares: float
+    value: float  # value in USD of the trade
+
+
+class TradeEngine:
+    """
+    Executes trades one user at a time.
+
+    Every user has a mailbox of pending trades drained by a single task, so
+    the balance check and the position update of a trade never interleave
+    with another trade of the same user. Trades of different users run
+    concurrently, and concurrent quotes of the same symbol share one fetch.
+
+    Args:
+        db (InMemoryDatabase): The database holding every user.
+    """
+
+    max_attempts = 5
+
+    def __init__(self, db: InMemoryDatabase) -> None:
+        self.db = db
+
+        self.conflicts = 0  # saves that lost a race with another process
+
+        self._mailboxes: Dict[Tuple[int, int], Deque[Tuple[Callable[[], Awaitable[Any]], asyncio.Future]]] = {}
+        self._quotes: Dict[str, asyncio.Future] = {}
+        self._workers: Set[asyncio.Task] = set()
+
+    async def quote(self, symbol: str) -> float:
+        """Price in USD of a stock, concurrent calls for the same symbol share one fetch."""
+        future = self._quotes.get(symbol)
+
+        if future is None:
+            future = asyncio.ensure_future(run_io(get_stock_current_value, symbol, currency="USD"))
+            self._quotes[symbol] = future
+            future.add_done_callback(lambda _: self._quotes.pop(symbol, None))
+
+        return await asyncio.shield(future)
+
+    async def submit(self, guild_id: int, user_id: int, job: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a job after every job already submitted for the same user.
+
+        Args:
+            guild_id (int): The guild of the user.
+            user_id (int): The user id.
+            job (Callable[[], Awaitable[Any]]): Coroutine function to run.
+
+        Returns:
+            Any: The result of the job.
+        """
+        key = (guild_id, user_id)
+        future = asyncio.get_running_loop().create_future()
+
+        mailbox = self._mailboxes.get(key)
+        if mailbox is None:
+            mailbox = self._mailboxes[key] = deque()
+            worker = asyncio.create_task(self._drain(key, mailbox))
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+
+        mailbox.append((job, future))
+        return await future
+
+    async def buy(
+        self, guild_id: int, user_id: int, symbol: str, *, value: float = None, quantity: float = None, price: float = None
+    ) -> Trade:
+        """
+        Buy a stock, either `value` dollars of it or `quantity` shares.
+
+        The trade executes at `price` if given, at the current price otherwise.
+
+        Raises:
+            InsufficientFunds: If the user can't afford the trade.
+        """
+
+        async def job():
+            trade_price = await self.quote(symbol) if price is None else price
+            return await self._execute(guild_id, user_id, lambda user: apply(user, trade_price))
+
+        def apply(user: User, trade_price: float) -> Trade:
+            shares = value / trade_price if quantity is None else quantity
+            cost = shares * trade_price if value is None else value
+
+            if user.cash < cost:
+                if quantity is None:
+                    raise InsufficientFunds(f"You cant afford this. You just have **{user.cash} $**.")
+                raise InsufficientFunds(
+                    f"You cant afford this. You just have **{user.cash} $** (**{user.cash/trade_price:.3f}** stocks of {symbol})."
+                )
+
+            user.cash -= cost
+
+            if symbol not in user.stocks:
+                user.stocks[symbol] = Position(symbol)
+
+            user.stocks[symbol].number_owned += shares
+            user.stocks[symbol].valued_invested += cost
+
+            return Trade('buy', symbol, trade_price, shares, cost)
+
+        return await self.submit(guild_id, user_id, job)
+
+    async def sell(
+        self, guild_id: int, user_id: int, symbol: str, *, value: float = None, quantity: float = None, price: float = None
+    ) -> Trade:
+        """
+        Sell a stock, either `value` dollars of it or `quantity` shares.
+
+        The trade executes at `price` if given, at the current price otherwise.
+
+        Raises:
+            InsufficientShares: If the user doesn't own enough of the stock.
+        """
+
+        async def job():
+            trade_price = await self.quote(symbol) if price is None else price
+            return await self._execute(guild_id, user_id, lambda user: apply(user, trade_price))
+
+        def apply(user: User, trade_price: float) -> Trade:
+            shares = value / trade_price if quantity is None else quantity
+            proceeds = shares * trade_price if value is None else value
+
+            position = user.stocks.get(symbol)
+            if position is None or position.number_owned < shares - DUST:
+                current_owned = position.number_owned if position is not None else 0
+                if quantity is None:
+                    raise InsufficientShares(
+                        f"You dont have enouth of that stock to complete the transaction. You own **{current_owned * trade_price:.5f} $** of {symbol} stocks"
+                    )
+                raise InsufficientShares(
+                    f"You dont have enouth of that stock to complete the transaction. You own **{current_owned:.5f}** stocks of {symbol}"
+                )
+
+            avg_cost_per_share = position.valued_invested / position.number_owned
+
+            user.cash += proceeds
+            position.number_owned -= shares
+            position.valued_invested -= avg_cost_per_share * shares
+
+            if position.number_owned < DUST:
+                user.stocks.pop(symbol)
+
+            return Trade('sell', symbol, trade_price, shares, proceeds)
+
+        return await self.submit(guild_id, user_id, job)
+
+    async def _execute(self, guild_id: int, user_id: int, apply: Callable[[User], Trade]) -> Trade:
+        """
+        Apply a trade to a user and persist it.
+
+        With a shared storage, the trade is applied again on the fresh user if
+        another process saved it meanwhile, or if the store stayed locked by
+        another process for longer than its busy timeout.
+        """
+        db = self.db
+
+        def attempt() -> Tuple[User, Trade]:
+            user = db.get_user(guild_id, user_id)
+            trade = apply(user)
+            db.save_user(guild_id, user_id, user)
+
+            return user, trade
+
+        for n in range(self.max_attempts):
+            try:
+                user, trade = await db.run(attempt)
+            except (ConcurrentUpdate, sqlite3.OperationalError) as e:
+                if isinstance(e, sqlite3.OperationalError):
+                    if 'locked' not in str(e):
+                        raise
+                    # the stored user didn't move, drop the unsaved trade by hand
+                    await db.run(db.reload_user, guild_id, user_id)
+
+                # otherwise the next get_user reloads the user
+                self.conflicts += 1
+                if n == self.max_attempts - 1:
+                    raise TradeError("Your account is busy, try again.")
+                continue
+
+            leaderboards.on_trade(guild_id, user, {trade.symbol: trade.price})
+            return trade
+
+    async def _drain(self, key: Tuple[int, int], mailbox: Deque) -> None:
+        try:
+            while mailbox:
+                job, future = mailbox.popleft()
+                if future.done():
+                    continue  # the caller went away
+
+                try:
+                    result = await job()
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # no await since the last check, nothing was added in between
+            del self._mailboxes[key]
+
+            for _, future in mailbox:
+                future.cancel()
@@ -0,0 +1,260 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+    from database.user import User
+
+
+class UserValuation(NamedTuple):
+    positions: Dict[str, float]  # value in USD of each priced position
+    portfolio_value: float
+    invested: float
+    cash: float
+
+    @property
+    def net_worth(self) -> float:
+        return self.portfolio_value + self.cash
+
+    @property
+    def return_value(self) -> float:
+        return self.portfolio_value - self.invested
+
+    @property
+    def return_per(self) -> float:
+        return (self.return_value * 100 / self.invested) if self.invested != 0 else 0
+
+
+class Holdings:
+    """
+    Holdings of a group of users as a sparse users x symbols matrix.
+
+    The matrix is kept in coordinate form: one entry per position, with its
+    row (user), column (symbol), quantity and amount invested. It is built
+    once and then kept up to date with `update` after every trade, the
+    entries of sold out positions being zeroed and reused by new ones. The
+    entries are indexed both by row and by column, so the positions of one
+    user or the holders of one symbol are found without a scan.
+
+    Args:
+        users (Sequence[User], optional): The users, in row order.
+    """
+
+    def __init__(self, users: Sequence[User] = ()) -> None:
+        self.users = list(users)
+        self.symbols: List[str] = []
+
+        self._rows: Dict[int, int] = {}  # user id -> row
+        self._columns: Dict[str, int] = {}  # symbol -> column
+        self._entries: List[Dict[int, int]] = []  # row -> entry of every column
+        self._holders: List[Dict[int, int]] = []  # column -> entry of every row
+        self._free: List[int] = []  # entries of sold out positions
+
+        rows, cols, quantities, invested = [], [], [], []
+
+        for row, user in enumerate(self.users):
+            self._rows[user.user_id] = row
+            entries = {}
+
+            for symbol, position in user.stocks.items():
+                col = self._column(symbol)
+                entries[col] = self._holders[col][row] = len(rows)
+
+                rows.append(row)
+                cols.append(col)
+                quantities.append(position.number_owned)
+                invested.append(position.valued_invested)
+
+            self._entries.append(entries)
+
+        self.size = len(rows)
+        self._rows_array = np.array(rows, dtype=np.intp)
+        self._cols_array = np.array(cols, dtype=np.intp)
+        self._quantities = np.array(quantities, dtype=np.float64)
+        self._invested = np.array(invested, dtype=np.float64)
+        self._cash = np.array([i.cash for i in self.users], dtype=np.float64)
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self._rows_array[:self.size]
+
+    @property
+    def cols(self) -> np.ndarray:
+        return self._cols_array[:self.size]
+
+    @property
+    def quantities(self) -> np.ndarray:
+        return self._quantities[:self.size]
+
+    @property
+    def invested(self) -> np.ndarray:
+        return self._invested[:self.size]
+
+    @property
+    def cash(self) -> np.ndarray:
+        return self._cash[:len(self.users)]
+
+    def row(self, user_id: int) -> Optional[int]:
+        return self._rows.get(user_id)
+
+    def entries(self, row: int) -> Iterable[int]:
+        """Entries of the positions of a row."""
+        return self._entries[row].values()
+
+    def holders(self, symbol: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows holding a symbol, with the quantity each of them holds."""
+        col = self._columns.get(symbol)
+        if col is None:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+        holders = self._holders[col]
+        rows = np.fromiter(holders.keys(), dtype=np.intp, count=len(holders))
+        entries = np.fromiter(holders.values(), dtype=np.intp, count=len(holders))
+        return rows, self._quantities[entries]
+
+    def net_worth(self, row: int, prices: Dict[str, float]) -> float:
+        """Net worth of a single row, symbols without a price being valued at 0."""
+        symbols, quantities = self.symbols, self._quantities
+        return float(self._cash[row]) + sum(
+            float(quantities[entry]) * prices.get(symbols[col], 0) for col, entry in self._entries[row].items()
+        )
+
+    def update(self, user: User) -> int:
+        """
+        Write the cash and positions of a user, adding the user if needed.
+
+        Args:
+            user (User): The user, usually after a trade.
+
+        Returns:
+            int: The row of the user.
+        """
+        row = self._rows.get(user.user_id)
+        if row is None:
+            row = self._rows[user.user_id] = len(self.users)
+            self.users.append(user)
+            self._entries.append({})
+            self._cash = _grow(self._cash, len(self.users))
+        else:
+            self.users[row] = user
+
+        self._cash[row] = user.cash
+
+        old = self._entries[row]
+        new = {}
+        for symbol, position in user.stocks.items():
+            col = self._column(symbol)
+            entry = old.pop(col, None)
+            if entry is None:
+                entry = self._add_entry(row, col)
+
+            self._quantities[entry] = position.number_owned
+            self._invested[entry] = position.valued_invested
+            new[col] = entry
+
+        # sold out positions weigh nothing until reused
+        for col, entry in old.items():
+            del self._holders[col][row]
+            self._quantities[entry] = 0
+            self._invested[entry] = 0
+            self._free.append(entry)
+
+        self._entries[row] = new
+        return row
+
+    def _column(self, symbol: str) -> int:
+        col = self._columns.get(symbol)
+        if col is None:
+            col = self._columns[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            self._holders.append({})
+
+        return col
+
+    def _add_entry(self, row: int, col: int) -> int:
+        if self._free:
+            entry = self._free.pop()
+        else:
+            entry = self.size
+            self.size += 1
+
+            self._rows_array = _grow(self._rows_array, self.size)
+            self._cols_array = _grow(self._cols_array, self.size)
+            self._quantities = _grow(self._quantities, self.size)
+            self._invested = _grow(self._invested, self.size)
+
+        self._rows_array[entry] = row
+        self._cols_array[entry] = col
+        self._holders[col][row] = entry
+        return entry
+
+    def price_vector(self, prices: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Prices in column order, and a mask of the symbols that have one."""
+        vector = np.array([prices.get(i, np.nan) for i in self.symbols], dtype=np.float64)
+        priced = ~np.isnan(vector)
+
+        return np.where(priced, vector, 0.0), priced
+
+    def valuate(self, prices: Dict[str, float]) -> Valuation:
+        """
+        Value every position against a price vector.
+
+        Args:
+            prices (Dict[str, float]): Price in USD of each symbol. Symbols without one are valued at 0.
+
+        Returns:
+            Valuation: The valuation of every user.
+        """
+        vector, priced = self.price_vector(prices)
+        n_users = len(self.users)
+        rows, cols = self.rows, self.cols
+
+        entry_values = self.quantities * vector[cols]
+        portfolio = np.bincount(rows, weights=entry_values, minlength=n_users)
+        invested = np.bincount(rows, weights=self.invested, minlength=n_users)
+
+        return Valuation(self, entry_values, priced[cols], portfolio, invested)
+
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    """`array` with room for `size` items, doubling its capacity when full."""
+    if size <= len(array):
+        return array
+
+    resp = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    resp[:len(array)] = array
+    return resp
+
+
+class Valuation:
+    def __init__(self, holdings: Holdings, entry_values: np.ndarray, entry_priced: np.ndarray, portfolio: np.ndarray, invested: np.ndarray) -> None:
+        self.holdings = holdings
+        self.entry_values = entry_values
+        self.entry_priced = entry_priced
+
+        self.portfolio = portfolio
+        self.invested = invested
+        self.net_worth = portfolio + holdings.cash
+        self.returns = portfolio - invested
+
+    def for_user(self, row: int) -> UserValuation:
+        holdings = self.holdings
+        entries = [i for i in holdings.entries(row) if self.entry_priced[i]]
+
+        return UserValuation(
+            positions={holdings.symbols[holdings.cols[i]]: float(self.entry_values[i]) for i in entries},
+            portfolio_value=float(self.portfolio[row]),
+            invested=float(self.invested[row]),
+            cash=float(holdings.cash[row]),
+        )
+
+    def ranking(self) -> List[Tuple[User, float]]:
+        """Users with their net worth, richest first."""
+        order = np.argsort(-self.net_worth, kind='stable')
+        return [(self.holdings.users[i], float(self.net_worth[i])) for i in order]
+
+
+def valuate_user(user: User, prices: Dict[str, float]) -> UserValuation:
+    return Holdings([user]).valuate(prices).for_user(0)
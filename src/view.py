@@ -4,25 +4,31 @@ from typing import TYPE_CHECKING
 # func
 import discord
 from datetime import datetime
+import io
+import math
+from apis.logo_resolver import logo_resolver
 from apis.yfinance_api import convert_currency, get_currency_symbol
-from utils import build_history_graph, plot_stock_positions_bar
+from chart_cache import chart_cache
+from executor import run_io
+from rendering import renderer
 
 # typing
 if TYPE_CHECKING:
-    from typing import Dict, List, Tuple
+    from typing import Dict, List, Optional, Tuple
     from database.position import Position
-    from database.user import User
+    from orders import Order
     from discord import Member, Guild
     from utils import Stock
+    from valuation import UserValuation
 
 
-def create_profile_embed(user: Member, user_db_info: User, stock_values: Dict[str, float]):
-    graph = plot_stock_positions_bar(stock_values)
+async def create_profile_embed(user: Member, valuation: UserValuation):
+    graph = io.BytesIO(await renderer.render('bar', {'positions': valuation.positions}))
     
-    portfolio_value = sum(i for i in stock_values.values())
-    value_invested = sum(map(lambda x: x.valued_invested, user_db_info.stocks.values()))
-    return_value = portfolio_value - value_invested
-    return_value_per = (return_value * 100 / value_invested) if value_invested != 0 else 0
+    portfolio_value = valuation.portfolio_value
+    value_invested = valuation.invested
+    return_value = valuation.return_value
+    return_value_per = valuation.return_per
 
     embed = discord.Embed(
         color=discord.Color.dark_teal(),
@@ -31,7 +37,7 @@ def create_profile_embed(user: Member, user_db_info: User, stock_values: Dict[st
     embed.set_thumbnail(url=user.avatar.url)
 
     embed.add_field(name="Portfolio", value=f"${portfolio_value:.2f}", inline=False)
-    embed.add_field(name="Cash", value=f"${user_db_info.cash:.2f}", inline=True)
+    embed.add_field(name="Cash", value=f"${valuation.cash:.2f}", inline=True)
     embed.add_field(name="Invested", value=f"${value_invested:.2f}", inline=True)
     embed.add_field(name="Return", value=f'${return_value:.2f} ({"+-"[int(return_value < 0)]}{abs(return_value_per):.2f}%)', inline=True)
     
@@ -41,8 +47,24 @@ def create_profile_embed(user: Member, user_db_info: User, stock_values: Dict[st
     return embed, file
 
 
-def create_stock_embed(stock_data: Stock):
-    buffer = build_history_graph(stock_data)
+async def create_stock_embed(stock_data: Stock, theme: str = 'dark'):
+    graph_key = chart_cache.key_for_stock(stock_data, theme)
+    graph = chart_cache.get(graph_key)
+    if graph is None:
+        graph = await run_io(chart_cache.load, graph_key)
+
+    if graph is None:
+        graph = await renderer.render('history', {
+            'dates': stock_data.history.index.to_numpy(),
+            'close': stock_data.history['Close'].to_numpy(),
+            'theme': theme,
+        })
+        chart_cache.put(graph_key, graph)
+        await run_io(chart_cache.save, graph_key, graph)
+
+    buffer = io.BytesIO(graph)
+    converted = await run_io(convert_currency, stock_data.value, stock_data.currency, 'USD')
+    image_url = await logo_resolver.resolve(stock_data.symbol)
     
     embed = discord.Embed(title=stock_data.name, colour=0x0076f5, timestamp=datetime.now())
     embed.add_field(name="Symbol", value=stock_data.symbol, inline=True)
@@ -53,11 +75,11 @@ def create_stock_embed(stock_data: Stock):
     )
     embed.add_field(
         name="Converted",
-        value=f"$ {convert_currency(stock_data.value, stock_data.currency, 'USD'):.2f}",
+        value=f"$ {converted:.2f}",
         inline=True
     )
 
-    embed.set_thumbnail(url=stock_data.image_url())
+    embed.set_thumbnail(url=image_url)
 
     file = discord.File(buffer, filename='graph.png')
     embed.set_image(url='attachment://graph.png')
@@ -76,7 +98,8 @@ def create_portfolio_embed(user: Member, positions: List[Position], stock_values
     embed.set_thumbnail(url=user.avatar.url)
 
     for position in positions[start:end]:
-        gain = stock_values[position.symbol] - position.valued_invested
+        value = stock_values.get(position.symbol, 0)
+        gain = value - position.valued_invested
         
         embed.add_field(
             name=f"{position.symbol}",
@@ -84,7 +107,7 @@ def create_portfolio_embed(user: Member, positions: List[Position], stock_values
             inline=True
         )
         embed.add_field(
-            name=f"$ {stock_values[position.symbol]:.2f}",
+            name=f"$ {value:.2f}",
             value=f"+${gain:.2f} ({gain/position.valued_invested:.2f}%)",
             inline=True
         )
@@ -93,20 +116,57 @@ def create_portfolio_embed(user: Member, positions: List[Position], stock_values
     return embed
 
 
-def create_ranking_embed(guild: Guild, users_networth: List[Tuple[User, float]]):
-    
+def create_ranking_embed(guild: Guild, entries: List[Tuple[int, float]], page: int, per_page: int, total: int, caller_rank: Optional[int] = None):
+    total_pages = max(1, math.ceil(total / per_page))
+
     embed = discord.Embed(
         color=discord.Color.dark_teal(),
         title=f"{guild.name}'s Ranking",
         timestamp=datetime.now()
     )
 
-    for idx, (user, worth) in enumerate(users_networth):
-        user_disc = guild.get_member(user.user_id)
+    for idx, (user_id, worth) in enumerate(entries, page * per_page + 1):
+        user_disc = guild.get_member(user_id)
         embed.add_field(
-            name=f"{idx+1}. {user_disc.display_name}",
+            name=f"{idx}. {user_disc.display_name if user_disc is not None else user_id}",
             value=f"$ {worth:.2f}",
             inline=True
         )
+
+    footer = f"Page {page + 1}/{total_pages}"
+    if caller_rank is not None:
+        footer += f" • Your rank: #{caller_rank} of {total}"
+    embed.set_footer(text=footer)
         
     return embed
+
+
+def create_order_embed(order: Order, current_price: float):
+    embed = discord.Embed(title=f"{order.kind.capitalize()} {order.side} order #{order.order_id}", timestamp=datetime.now())
+
+    embed.add_field(name="Symbol", value=order.symbol, inline=True)
+    embed.add_field(name="Shares", value=order.quantity, inline=True)
+    embed.add_field(name="Trigger", value=f"{'≤' if order.triggers_on_fall else '≥'} {order.price:.2f} $", inline=True)
+    embed.add_field(name="Current Price", value=f"{current_price:.2f} $", inline=False)
+
+    return embed
+
+
+def create_orders_embed(user: Member, orders: List[Order]):
+    embed = discord.Embed(
+        color=discord.Color.dark_teal(),
+        title=f"{user.display_name}'s Orders",
+        timestamp=datetime.now()
+    )
+
+    for order in orders[:25]:
+        embed.add_field(
+            name=f"#{order.order_id} {order.kind} {order.side} {order.symbol}",
+            value=f"{order.quantity} shares at {'≤' if order.triggers_on_fall else '≥'} {order.price:.2f} $",
+            inline=False
+        )
+
+    if not orders:
+        embed.description = "No open orders."
+
+    return embed
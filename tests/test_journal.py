@@ -0,0 +1,108 @@
+import copy
+import json
+import threading
+
+from database.journal import JournaledStorage
+from database.storage import JsonStorage
+
+
+def user(cash: float) -> dict:
+    return {'cash': cash, 'stocks': {'AAPL': {'number_owned': 1.0, 'valued_invested': 100.0}}}
+
+def open_storage(tmp_path, compact_every: int = 1000) -> JournaledStorage:
+    return JournaledStorage(JsonStorage(str(tmp_path / 'data.json')), str(tmp_path / 'data.journal'), compact_every)
+
+
+def test_replay_restores_trades_after_restart(tmp_path):
+    storage = open_storage(tmp_path)
+    storage.save_user(1, 10, user(100))
+    storage.save_user(1, 10, user(90))
+    storage.save_user(2, 20, user(50))
+    storage.close()
+
+    storage = open_storage(tmp_path)
+    try:
+        data = storage.load_all()
+    finally:
+        storage.close()
+
+    # the last entry of a user wins
+    assert data == {hex(1): {hex(10): user(90)}, hex(2): {hex(20): user(50)}}
+
+def test_replay_skips_a_torn_last_line(tmp_path):
+    storage = open_storage(tmp_path)
+    storage.save_user(1, 10, user(100))
+    storage.close()
+
+    with open(tmp_path / 'data.journal', 'a') as f:
+        f.write('{"g":1,"u":10,"d":{"ca')
+
+    storage = open_storage(tmp_path)
+    try:
+        assert storage.load_all() == {hex(1): {hex(10): user(100)}}
+    finally:
+        storage.close()
+
+def test_compaction_folds_the_journal_into_the_snapshot(tmp_path):
+    storage = open_storage(tmp_path, compact_every=2)
+    state = {hex(1): {hex(10): user(100)}}
+    storage.save_user(1, 10, user(100))
+    assert not storage.needs_snapshot
+
+    state[hex(1)][hex(11)] = user(200)
+    storage.save_user(1, 11, user(200))
+    assert storage.needs_snapshot
+
+    # a trade made while the compactor runs is in the snapshot or in the new journal
+    release = threading.Event()
+
+    def snapshot():
+        release.wait()
+        return copy.deepcopy(state)
+
+    storage.compact(snapshot)
+    assert not storage.needs_snapshot
+
+    state[hex(1)][hex(10)] = user(80)
+    storage.save_user(1, 10, user(80))
+    release.set()
+    storage.close()
+
+    storage = open_storage(tmp_path)
+    try:
+        assert storage.journal.rotated_paths() == []
+        assert storage.load_all() == {hex(1): {hex(10): user(80), hex(11): user(200)}}
+    finally:
+        storage.close()
+
+    with open(tmp_path / 'data.json') as f:
+        assert json.load(f)[hex(1)][hex(11)] == user(200)
+
+def test_entries_written_before_a_restart_count_towards_compaction(tmp_path):
+    storage = open_storage(tmp_path, compact_every=3)
+    storage.save_user(1, 10, user(100))
+    storage.save_user(1, 10, user(90))
+    storage.close()
+
+    storage = open_storage(tmp_path, compact_every=3)
+    try:
+        assert storage.journal.entries == 2
+        storage.save_user(1, 10, user(80))
+        assert storage.needs_snapshot
+    finally:
+        storage.close()
+
+def test_rotated_journals_are_replayed_until_discarded(tmp_path):
+    storage = open_storage(tmp_path)
+    storage.save_user(1, 10, user(100))
+    storage.journal.rotate()
+    storage.save_user(1, 10, user(90))
+    storage.close()
+
+    # as after a crash while the snapshot was written
+    storage = open_storage(tmp_path)
+    try:
+        assert [i for _, i in storage.journal.rotated_paths()] == [str(tmp_path / 'data.journal.1')]
+        assert storage.load_all() == {hex(1): {hex(10): user(90)}}
+    finally:
+        storage.close()
@@ -0,0 +1,59 @@
+import pytest
+
+from database.position import Position
+from database.user import User
+from leaderboard import Leaderboards
+
+GUILD = 1
+
+
+def user(user_id, cash, **stocks):
+    return User(user_id, {'cash': cash, 'stocks': {s: {'number_owned': n, 'valued_invested': 0} for s, n in stocks.items()}})
+
+def full_worth(board):
+    valuation = board.holdings.valuate(board.prices)
+    return {i.user_id: pytest.approx(float(worth)) for i, worth in zip(board.holdings.users, valuation.net_worth)}
+
+
+def test_price_tick_shifts_only_the_holders():
+    boards = Leaderboards()
+    board = boards.build(GUILD, [user(1, 100, AAPL=2), user(2, 500), user(3, 0, AAPL=1, MSFT=3)], {'AAPL': 100, 'MSFT': 10})
+
+    assert board.top(3) == [(2, 500), (1, 300), (3, 130)]
+
+    boards.on_prices({'AAPL': 300, 'MSFT': 10})
+    assert board.worth == full_worth(board)
+    assert board.top(3) == [(1, 700), (2, 500), (3, 330)]
+
+def test_trade_revalues_the_trader():
+    boards = Leaderboards()
+    board = boards.build(GUILD, [user(1, 100, AAPL=2), user(2, 0, AAPL=1)], {'AAPL': 100})
+
+    trader = user(2, 150, MSFT=5)
+    boards.on_trade(GUILD, trader, {'MSFT': 20, 'AAPL': 150})
+    assert board.worth == full_worth(board)
+    assert board.rank(2) == 2
+
+    # sold out positions leave the column of the symbol
+    boards.on_prices({'AAPL': 50})
+    assert board.worth == full_worth(board)
+    assert board.worth[2] == 250
+
+def test_new_symbol_was_valued_at_zero():
+    boards = Leaderboards()
+    board = boards.build(GUILD, [user(1, 0, NEW=2)], {})
+
+    assert board.worth[1] == 0
+    boards.on_prices({'NEW': 5})
+    assert board.worth[1] == 10
+
+def test_trader_position_is_added_after_build():
+    boards = Leaderboards()
+    board = boards.build(GUILD, [user(1, 100)], {'AAPL': 10})
+
+    trader = board.users[1]
+    dict.__setitem__(trader.stocks, 'AAPL', Position('AAPL', {'number_owned': 3, 'valued_invested': 30}))
+    boards.on_trade(GUILD, trader)
+
+    boards.on_prices({'AAPL': 20})
+    assert board.worth[1] == 160
@@ -0,0 +1,114 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from database.database import InMemoryDatabase
+from database.storage import JsonStorage
+from orders import Order, OrderBook
+from trading import TradeEngine
+
+GUILD, USER = 1, 10
+# guilds of shard 0 and 1 out of 2
+GUILD_0, GUILD_1 = 2 << 22, 3 << 22
+
+
+@pytest.fixture
+def book(tmp_path):
+    return OrderBook(None, str(tmp_path / 'orders.json'))
+
+def ids(crossed):
+    return sorted(order.order_id for order, _ in crossed)
+
+
+@pytest.mark.parametrize('side, kind, on_fall', [
+    ('buy', 'limit', True),
+    ('sell', 'stop', True),
+    ('sell', 'limit', False),
+    ('buy', 'stop', False),
+])
+def test_trigger_direction(side, kind, on_fall):
+    order = Order(1, GUILD, USER, 'AAPL', side, kind, 100, 1, 0)
+    assert order.triggers_on_fall is on_fall
+
+@pytest.mark.parametrize('side, kind, untouched, crossing', [
+    ('buy', 'limit', 100.01, 100),
+    ('sell', 'stop', 100.01, 99),
+    ('sell', 'limit', 99.99, 100),
+    ('buy', 'stop', 99.99, 101),
+])
+def test_crossed_triggers_at_the_level_only(book, side, kind, untouched, crossing):
+    order = book.place(GUILD, USER, 'AAPL', side, kind, 100, 1)
+
+    assert book.crossed({'AAPL': untouched}) == []
+    assert book.crossed({'AAPL': crossing}) == [(order, crossing)]
+    assert book.orders == {} and book.symbols() == set()
+
+def test_crossed_pops_only_the_crossed_orders(book):
+    low = book.place(GUILD, USER, 'AAPL', 'buy', 'limit', 90, 1)
+    high = book.place(GUILD, USER, 'AAPL', 'buy', 'limit', 110, 1)
+    sell = book.place(GUILD, USER, 'AAPL', 'sell', 'limit', 120, 1)
+    other = book.place(GUILD, USER, 'MSFT', 'buy', 'limit', 500, 1)
+
+    assert ids(book.crossed({'AAPL': 100})) == [high.order_id]
+    assert ids(book.crossed({'AAPL': 80, 'MSFT': 600})) == [low.order_id]
+    assert set(book.orders) == {sell.order_id, other.order_id}
+
+def test_cancelled_orders_are_dropped_lazily(book):
+    cancelled = book.place(GUILD, USER, 'AAPL', 'buy', 'limit', 100, 1)
+    kept = book.place(GUILD, USER, 'AAPL', 'buy', 'limit', 90, 1)
+
+    assert book.cancel(cancelled.order_id, user_id=USER + 1) is None
+    assert book.cancel(cancelled.order_id, user_id=USER) == cancelled
+    assert book.cancel(cancelled.order_id) is None
+
+    # the cancelled order is still in the heap, above the kept one
+    assert book.crossed({'AAPL': 80}) == [(kept, 80)]
+    assert book.symbols() == set()
+
+def test_persist_keeps_the_newest_snapshot(book):
+    for i in range(20):
+        book.place(GUILD, USER, 'AAPL', 'buy', 'limit', 100 + i, 1)
+
+    snapshots = [(dict(book.serialize(), next_id=i), i) for i in range(1, 41)]
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda args: book.save(*args), reversed(snapshots)))
+
+    with open(book.path) as f:
+        assert json.load(f)['next_id'] == 40
+
+def test_adopt_takes_each_guild_from_its_newest_file(tmp_path, book):
+    def write(name, orders):
+        path = str(tmp_path / name)
+        with open(path, 'w') as f:
+            json.dump({'next_id': 10, 'orders': [i._asdict() for i in orders]}, f)
+        return path
+
+    old = write('orders-old.json', [
+        Order(1, GUILD_0, USER, 'AAPL', 'buy', 'limit', 100, 1, 0),  # filled since in the newer file
+        Order(2, GUILD_1, USER, 'MSFT', 'buy', 'limit', 100, 1, 0),
+    ])
+    new = write('orders.shards-0-of-2.json', [])
+
+    assert book.adopt([old, new], {GUILD_0, GUILD_1}) == 1
+    assert [(i.order_id, i.guild_id) for i in book.orders.values()] == [(1, GUILD_1)]
+
+    assert OrderBook(None, book.path).adopt([old, new], {GUILD_0}) == 0
+
+def test_on_prices_fills_through_the_engine(tmp_path):
+    engine = TradeEngine(InMemoryDatabase(storage=JsonStorage(str(tmp_path / 'data.json'))))
+    book = OrderBook(engine, str(tmp_path / 'orders.json'))
+
+    book.place(GUILD, USER, 'AAPL', 'buy', 'limit', 100, 2)
+    book.place(GUILD, USER, 'AAPL', 'buy', 'stop', 1000, 1000)  # can't be afforded
+
+    trades = asyncio.run(book.on_prices({'AAPL': 95}))
+    assert [(i.side, i.shares, i.price) for i in trades] == [('buy', 2, 95)]
+    assert engine.db.get_user(GUILD, USER).stocks['AAPL'].number_owned == 2
+
+    trades = asyncio.run(book.on_prices({'AAPL': 1000}))
+    assert trades == [] and book.orders == {}
+
+    with open(book.path) as f:
+        assert json.load(f)['orders'] == []
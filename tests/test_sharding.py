@@ -0,0 +1,46 @@
+import json
+import os
+
+from database.sharding import ShardPartition, collect_guilds, file_partition, partition_files, shard_for
+
+# guilds of shard 0 and 1 out of 2
+GUILD_0, GUILD_1 = 2 << 22, 3 << 22
+
+
+def write(path, data, mtime):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    os.utime(path, (mtime, mtime))
+
+def guild(cash):
+    return {hex(10): {'cash': cash, 'stocks': {}}}
+
+
+def test_shard_for():
+    assert shard_for(GUILD_0, 2) == 0
+    assert shard_for(GUILD_1, 2) == 1
+
+def test_file_partition_reads_the_name():
+    assert file_partition('./data.json').owns_all
+    assert file_partition('./orders.shards-0-2-of-4.json').shard_ids == [0, 2]
+    assert file_partition('./data.shards-1-of-2').shard_count == 2
+
+def test_collect_guilds_keeps_the_newest_file(tmp_path):
+    path = str(tmp_path / 'data.json')
+    write(path, {hex(GUILD_0): guild(1), hex(GUILD_1): guild(1)}, 1000)
+    write(str(tmp_path / 'data.shards-0-of-2.json'), {hex(GUILD_0): guild(2)}, 2000)
+    write(str(tmp_path / 'data.shards-1-of-2.json'), {hex(GUILD_1): guild(3)}, 500)
+
+    sources = partition_files('json', path)
+    assert [os.path.basename(i) for i in sources] == ['data.shards-1-of-2.json', 'data.json', 'data.shards-0-of-2.json']
+
+    # back to a single process: the newest copy of every guild wins
+    data = collect_guilds([('json', i) for i in sources], ShardPartition())
+    assert data == {hex(GUILD_0): guild(2), hex(GUILD_1): guild(1)}
+
+def test_collect_guilds_keeps_the_owned_guilds(tmp_path):
+    path = str(tmp_path / 'data.json')
+    write(path, {hex(GUILD_0): guild(1), hex(GUILD_1): guild(1)}, 1000)
+
+    data = collect_guilds([('json', path)], ShardPartition(2, [1]))
+    assert data == {hex(GUILD_1): guild(1)}
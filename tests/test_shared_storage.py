@@ -0,0 +1,94 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database.database import InMemoryDatabase
+from database.storage import ConcurrentUpdate, SharedSqliteStorage
+from trading import TradeEngine
+
+GUILD, USER = 1, 10
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'data.sqlite')
+
+@pytest.fixture
+def processes(path):
+    """Two databases on the same shared store, like two bot processes."""
+    dbs = [InMemoryDatabase(storage=SharedSqliteStorage(path)) for _ in range(2)]
+    yield dbs
+
+    for db in dbs:
+        db.close()
+
+
+def test_save_user_if_rejects_a_stale_version(path):
+    first, second = SharedSqliteStorage(path), SharedSqliteStorage(path)
+    try:
+        assert first.save_user_if(GUILD, USER, {'cash': 100, 'stocks': {}}, 0) == 1
+
+        # the second process never read the user
+        with pytest.raises(ConcurrentUpdate):
+            second.save_user_if(GUILD, USER, {'cash': 50, 'stocks': {}}, 0)
+
+        assert second.save_user_if(GUILD, USER, {'cash': 50, 'stocks': {}}, 1) == 2
+        with pytest.raises(ConcurrentUpdate):
+            first.save_user_if(GUILD, USER, {'cash': 70, 'stocks': {}}, 1)
+
+        assert first.load_user(GUILD, USER) == {'cash': 50, 'version': 2, 'stocks': {}}
+    finally:
+        first.close()
+        second.close()
+
+def test_get_user_reloads_a_user_saved_by_another_process(processes):
+    first, second = processes
+
+    first.get_user(GUILD, USER).cash = 100
+    first.save_user(GUILD, USER)
+
+    user = second.get_user(GUILD, USER)
+    assert (user.cash, user.version) == (100, 1)
+
+def test_trade_is_retried_on_the_fresh_user_after_a_conflict(processes):
+    first, second = processes
+    engine = TradeEngine(first)
+    save_user_if = first.storage.save_user_if
+
+    def racing(*args):
+        # the other process sells the user's cash away between the read and the save
+        if not engine.conflicts:
+            other = second.get_user(GUILD, USER)
+            other.cash -= 1000
+            second.save_user(GUILD, USER)
+        return save_user_if(*args)
+
+    first.storage.save_user_if = racing
+    trade = asyncio.run(engine.buy(GUILD, USER, 'AAPL', value=100, price=10))
+
+    assert engine.conflicts == 1
+    assert trade.shares == pytest.approx(10)
+
+    stored = first.storage.load_user(GUILD, USER)
+    # both trades are kept, neither overwrote the other
+    assert stored['cash'] == pytest.approx(4000 - 1000 - 100)
+    assert stored['stocks']['AAPL']['number_owned'] == pytest.approx(10)
+
+def test_trade_is_retried_when_the_store_stays_locked(processes):
+    first, _ = processes
+    engine = TradeEngine(first)
+    save_user_if = first.storage.save_user_if
+
+    def locked(*args):
+        if not engine.conflicts:
+            raise sqlite3.OperationalError("database is locked")
+        return save_user_if(*args)
+
+    first.storage.save_user_if = locked
+    asyncio.run(engine.buy(GUILD, USER, 'AAPL', value=100, price=10))
+
+    # the failed attempt is not applied twice
+    assert engine.conflicts == 1
+    assert first.storage.load_user(GUILD, USER)['cash'] == pytest.approx(3900)
+    assert first.get_user(GUILD, USER).cash == pytest.approx(3900)
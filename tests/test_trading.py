@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from database.database import InMemoryDatabase
+from database.storage import JsonStorage
+from trading import InsufficientShares, TradeEngine
+
+GUILD, USER = 1, 10
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return TradeEngine(InMemoryDatabase(storage=JsonStorage(str(tmp_path / 'data.json'))))
+
+
+def test_selling_everything_by_value_closes_the_position(engine):
+    asyncio.run(engine.buy(GUILD, USER, 'AAPL', value=100, price=7))
+    # selling back the whole value at 11 leaves about 2e-15 shares
+    asyncio.run(engine.sell(GUILD, USER, 'AAPL', value=100 / 7 * 11, price=11))
+
+    assert 'AAPL' not in engine.db.get_user(GUILD, USER).stocks
+
+def test_partial_sell_keeps_the_position(engine):
+    asyncio.run(engine.buy(GUILD, USER, 'AAPL', quantity=2, price=10))
+    asyncio.run(engine.sell(GUILD, USER, 'AAPL', quantity=1.5, price=10))
+
+    assert engine.db.get_user(GUILD, USER).stocks['AAPL'].number_owned == 0.5
+
+def test_selling_more_than_owned_fails(engine):
+    asyncio.run(engine.buy(GUILD, USER, 'AAPL', quantity=1, price=10))
+
+    with pytest.raises(InsufficientShares):
+        asyncio.run(engine.sell(GUILD, USER, 'AAPL', quantity=1.001, price=10))
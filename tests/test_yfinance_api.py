@@ -0,0 +1,52 @@
+import pytest
+
+from apis import market_data, yfinance_api
+from apis.history_store import HistoryStore
+from apis.quote_cache import QuoteCache
+from benchmarks.fakes import FakeMarket
+from utils import calculate_start_date
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    provider = FakeMarket(latency=0)
+
+    monkeypatch.setattr(market_data, 'provider', provider)
+    monkeypatch.setattr(yfinance_api, 'history_store', HistoryStore(directory=str(tmp_path / 'history')))
+    monkeypatch.setattr(yfinance_api, 'quote_cache', QuoteCache())
+    monkeypatch.setattr(yfinance_api, '_symbol_currencies', {})
+    monkeypatch.setattr(yfinance_api.symbol_index, 'add', lambda symbol, name: None)
+
+    return provider
+
+
+def test_cold_get_stock_data(provider):
+    stock = yfinance_api.get_stock_data('AAPL', '6mo')
+
+    assert stock.symbol == 'AAPL'
+    assert stock.name == 'AAPL Inc.'
+    assert stock.currency == 'USD'
+    assert stock.value == pytest.approx(provider.series('AAPL').iloc[-1])
+    assert not stock.history.empty
+    assert stock.history.index[0] >= calculate_start_date('6mo')
+    assert provider.calls['info'] == 1
+
+
+def test_warm_get_stock_data_reuses_metadata(provider):
+    yfinance_api.get_stock_data('AAPL', '6mo')
+    stock = yfinance_api.get_stock_data('AAPL', '1mo')
+
+    assert stock.name == 'AAPL Inc.'
+    assert provider.calls['info'] == 1
+    assert provider.calls['history'] == 1
+
+
+def test_get_stock_quotes_from_a_replay(tmp_path, provider, monkeypatch):
+    directory = str(tmp_path / 'replay')
+    market_data.record(provider, ['AAPL', 'SAP.DE'], directory)
+    monkeypatch.setattr(market_data, 'provider', market_data.ReplayProvider(directory))
+
+    quotes = yfinance_api.get_stock_quotes(['AAPL', 'SAP.DE', 'UNKNOWN'])
+
+    assert {symbol: quote.currency for symbol, quote in quotes.items()} == {'AAPL': 'USD', 'SAP.DE': 'EUR'}
+    assert quotes['AAPL'].price == pytest.approx(provider.series('AAPL').iloc[-1])